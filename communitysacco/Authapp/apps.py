@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AuthappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Authapp'
+
+    def ready(self):
+        from . import backends  # noqa: F401  (registers the user cache invalidation signals)
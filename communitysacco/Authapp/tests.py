@@ -1,3 +1,37 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from .backends import CachedModelBackend
+
+
+class CachedModelBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.member = User.objects.create_user(username="member", password="pass12345")
+        self.backend = CachedModelBackend()
+
+    def test_user_is_loaded_once_then_served_from_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.member.pk), self.member)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.member.pk), self.member)
+
+    def test_saving_the_user_drops_the_cached_copy(self):
+        self.backend.get_user(self.member.pk)
+        self.member.is_active = False
+        self.member.save()
+        self.assertIsNone(self.backend.get_user(self.member.pk))
+
+    def test_deleted_user_is_logged_out_on_the_next_request(self):
+        self.client.force_login(self.member)
+        self.assertTrue(self.client.get(reverse("home")).context["user"].is_authenticated)
+        self.member.delete()
+        self.assertFalse(self.client.get(reverse("home")).context["user"].is_authenticated)
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=0)
+    def test_zero_ttl_disables_caching(self):
+        self.backend.get_user(self.member.pk)
+        with self.assertNumQueries(1):
+            self.backend.get_user(self.member.pk)
@@ -5,31 +5,16 @@ from django.contrib.auth import authenticate ,login ,logout
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum
 from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_POST
-from FinanceApp.models import Transaction, UserLoanLimit
+from FinanceApp.member_summary import member_summary
 
 
 # Create your views here.
 def home(request):
     context = {}
     if request.user.is_authenticated:
-        latest_loan = request.user.loan_requests.first()
-        loan_status = latest_loan.get_status_display() if latest_loan else "None"
-        total_saved = request.user.savings_records.aggregate(total=Sum("amount"))["total"] or 0
-        pending_transactions = request.user.transactions.filter(status=Transaction.STATUS_PENDING).count()
-        loan_limit_obj = UserLoanLimit.objects.filter(user=request.user).first()
-        loan_limit = loan_limit_obj.amount if loan_limit_obj and loan_limit_obj.amount is not None else "None"
-
-        context.update(
-            {
-                "loan_status": loan_status,
-                "total_saved": total_saved,
-                "pending_transactions": pending_transactions,
-                "loan_limit": loan_limit,
-            }
-        )
+        context.update(member_summary(request.user))
     return render(request, 'Authapp/home.html', context)
 
 def loginUser(request):
@@ -0,0 +1,204 @@
+from collections import Counter
+from datetime import datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction as db_transaction
+from django.db.models import F, Max, Min, Sum
+from django.utils import timezone
+
+from . import analytics, ledger, ledger_archive, loan_limits, member_summary, search, trends
+from .models import RepaymentInstalment, SavingsRecord, Transaction
+
+
+CENT = Decimal("0.01")
+ACCRUAL_TYPES = (Transaction.TYPE_DIVIDEND, Transaction.TYPE_PENALTY)
+
+
+def daily_accrual(base, annual_rate):
+    """One day's accrual on ``base`` at ``annual_rate`` percent a year, to the cent."""
+    return (Decimal(base) * Decimal(str(annual_rate)) / 36500).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def accrual_reference(transaction_type, accrual_date, user_id):
+    """
+    Payment reference of one member's accrual for one day.
+
+    ``payment_reference`` is unique across the ledger, so a rerun (or two
+    workers given overlapping ranges) can never post the same accrual twice.
+    """
+    return f"ACR-{transaction_type}-{accrual_date:%Y%m%d}-{user_id}"
+
+
+def accrual_timestamp(accrual_date):
+    """Accruals are dated at the last instant of their day so they roll up under that date."""
+    return timezone.make_aware(datetime.combine(accrual_date + timedelta(days=1), time.min)) - timedelta(microseconds=1)
+
+
+def partition_bounds(index, count):
+    """
+    Return the inclusive ``(first_user_id, last_user_id)`` range of partition ``index`` of ``count``.
+
+    Partitions split the span of user ids evenly so separate worker processes
+    can each take one. Returns ``None`` for an empty partition.
+    """
+    if not 1 <= index <= count:
+        raise ValueError(f"Partition {index} is outside 1..{count}.")
+    span = User.objects.aggregate(first=Min("id"), last=Max("id"))
+    if span["first"] is None:
+        return None
+    size = -(-(span["last"] - span["first"] + 1) // count)
+    first = span["first"] + (index - 1) * size
+    last = min(first + size - 1, span["last"])
+    return (first, last) if first <= last else None
+
+
+def savings_balances(first, last, before):
+    """Savings plus credited dividends per member in ``first..last``, as of ``before``."""
+    balances = Counter()
+    for user_id, total in (
+        SavingsRecord.objects.filter(user_id__gte=first, user_id__lte=last, created_at__lt=before)
+        .order_by()
+        .values("user_id")
+        .annotate(total=Sum("amount"))
+        .values_list("user_id", "total")
+    ):
+        balances[user_id] += total
+    for transactions in ledger_archive.sources(end=before):
+        for user_id, total in (
+            transactions.filter(
+                user_id__gte=first,
+                user_id__lte=last,
+                transaction_type=Transaction.TYPE_DIVIDEND,
+                status=Transaction.STATUS_COMPLETED,
+                created_at__lt=before,
+            )
+            .order_by()
+            .values("user_id")
+            .annotate(total=Sum("amount"))
+            .values_list("user_id", "total")
+        ):
+            balances[user_id] += total
+    return balances
+
+
+def overdue_balances(first, last, due_before):
+    """Unpaid instalment amounts per member in ``first..last`` that fell due before ``due_before``."""
+    return dict(
+        RepaymentInstalment.objects.filter(
+            loan__user_id__gte=first,
+            loan__user_id__lte=last,
+            due_date__lt=due_before,
+            amount_paid__lt=F("principal_due") + F("interest_due"),
+        )
+        .order_by()
+        .values("loan__user_id")
+        .annotate(overdue=Sum(F("principal_due") + F("interest_due") - F("amount_paid")))
+        .values_list("loan__user_id", "overdue")
+    )
+
+
+def run_accruals(accrual_date, user_range=None, chunk_size=5000):
+    """
+    Post one day's savings dividends and late-repayment penalties.
+
+    Members are processed in user id order, ``chunk_size`` at a time; each
+    chunk's balances come from grouped aggregates and its accruals are written
+    with one ``bulk_create`` in the same transaction as the set-wise ledger and
+    rollup updates. Accruals already posted for ``accrual_date`` are skipped, so the
+    job can be rerun safely. ``user_range`` limits the run to an inclusive
+    ``(first, last)`` user id range (see ``partition_bounds``).
+    Returns a ``Counter`` of members, posted and skipped accruals and totals.
+    """
+    rates = {
+        Transaction.TYPE_DIVIDEND: settings.SAVINGS_DIVIDEND_RATE,
+        Transaction.TYPE_PENALTY: settings.LOAN_PENALTY_RATE,
+    }
+    posted_at = accrual_timestamp(accrual_date)
+    due_before = accrual_date - timedelta(days=settings.LOAN_PENALTY_GRACE_DAYS)
+
+    users = User.objects.order_by("id")
+    if user_range is not None:
+        users = users.filter(id__gte=user_range[0], id__lte=user_range[1])
+    user_ids = users.values_list("id", flat=True)
+
+    stats = Counter()
+    last_id = None
+    while True:
+        chunk = list((user_ids.filter(id__gt=last_id) if last_id is not None else user_ids)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1]
+        stats["members"] += len(chunk)
+        bases = {
+            Transaction.TYPE_DIVIDEND: savings_balances(chunk[0], last_id, posted_at) if rates[Transaction.TYPE_DIVIDEND] else {},
+            Transaction.TYPE_PENALTY: overdue_balances(chunk[0], last_id, due_before) if rates[Transaction.TYPE_PENALTY] else {},
+        }
+        stats.update(_post_chunk(accrual_date, posted_at, bases, rates))
+    return stats
+
+
+def _post_chunk(accrual_date, posted_at, bases, rates):
+    stats = Counter()
+    accruals = []
+    for transaction_type, balances in bases.items():
+        for user_id, base in balances.items():
+            amount = daily_accrual(base, rates[transaction_type])
+            if amount > 0:
+                accruals.append(
+                    Transaction(
+                        user_id=user_id,
+                        transaction_type=transaction_type,
+                        status=Transaction.STATUS_COMPLETED,
+                        amount=amount,
+                        payment_reference=accrual_reference(transaction_type, accrual_date, user_id),
+                        description=f"{dict(Transaction.TYPE_CHOICES)[transaction_type]} for {accrual_date:%Y-%m-%d}",
+                        created_at=posted_at,
+                    )
+                )
+    if not accruals:
+        return stats
+    for accrual in accruals:
+        accrual.backdated = True
+
+    with db_transaction.atomic():
+        # Runs over overlapping ranges wait for each other member by member.
+        list(
+            User.objects.select_for_update()
+            .filter(id__in={accrual.user_id for accrual in accruals})
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        trends.hold_refresh()
+        posted = ledger_archive.recorded_references([accrual.payment_reference for accrual in accruals])
+        accruals = [accrual for accrual in accruals if accrual.payment_reference not in posted]
+        references = [accrual.payment_reference for accrual in accruals]
+        ours = Transaction.objects.exclude(payment_reference="").filter(payment_reference__in=references)
+        existing = set(ours.values_list("id", flat=True))
+        # An accrual posted since the check is skipped by the unique reference instead of failing
+        # the chunk, and only the rows this insert added move balances and rollups.
+        Transaction.objects.bulk_create(accruals, ignore_conflicts=True)
+        created = list(ours.exclude(id__in=existing))
+        posted |= set(references) - {accrual.payment_reference for accrual in created}
+        if created:
+            # Accruals only feed balances, rollups and loan limits and home summaries (they are never repayments), so the
+            # balances move with one set-wise UPDATE per chunk rather than one per member.
+            ids = [accrual.pk for accrual in created]
+            ledger.apply_inserted(
+                Transaction.objects.filter(
+                    id__gte=min(ids), id__lte=max(ids), created_at=posted_at, transaction_type__in=ACCRUAL_TYPES
+                ).exclude(id__in=existing),
+                {accrual.user_id for accrual in created},
+            )
+            analytics.apply_changes(Transaction, [(None, accrual.tracked_state()) for accrual in created])
+            loan_limits.mark_stale({accrual.user_id for accrual in created})
+            member_summary.invalidate({accrual.user_id for accrual in created})
+            search.index_instances(Transaction, created)
+
+    stats["skipped"] += len(posted)
+    for accrual in created:
+        key = "dividends" if accrual.transaction_type == Transaction.TYPE_DIVIDEND else "penalties"
+        stats[key] += 1
+        stats[f"{key}_total"] += accrual.amount
+    return stats
@@ -1,6 +1,40 @@
 from django.contrib import admin
 
-from .models import LoanRequest, SavingsRecord, Transaction, UserLoanLimit
+from .models import (
+    AnalyticsRollup,
+    LedgerImport,
+    LedgerPartition,
+    LoanProduct,
+    LoanRequest,
+    MemberBalance,
+    PaymentJob,
+    ProcessedCallback,
+    RepaymentInstalment,
+    SavingsRecord,
+    SearchEntry,
+    Transaction,
+    TransactionTrend,
+    TrendWatermark,
+    UserLoanLimit,
+)
+from .search import matching_entries
+
+
+class IndexedSearchMixin:
+    """
+    Answer the changelist search box from the search index instead of ``icontains`` scans.
+    Searches with no word long enough for the index fall back to ``search_fields``.
+    """
+
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        entries = matching_entries(search_term, self.search_kind)
+        if entries is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=entries.values("object_id")), False
 
 
 @admin.register(SavingsRecord)
@@ -10,16 +44,20 @@ class SavingsRecordAdmin(admin.ModelAdmin):
 
 
 @admin.register(LoanRequest)
-class LoanRequestAdmin(admin.ModelAdmin):
+class LoanRequestAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ("name", "user", "id_number", "amount", "status", "created_at")
-    search_fields = ("name", "user__username", "id_number")
+    search_fields = ("name", "id_number")
+    search_help_text = "Applicant name or ID number; the start of each word is enough."
+    search_kind = SearchEntry.KIND_LOAN
     list_filter = ("status", "created_at")
 
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ("user", "transaction_type", "status", "amount", "created_at")
-    search_fields = ("user__username", "description")
+    search_fields = ("payment_reference", "phone_number")
+    search_help_text = "Payment reference or phone number; the start is enough."
+    search_kind = SearchEntry.KIND_TRANSACTION
     list_filter = ("transaction_type", "status", "created_at")
 
 
@@ -27,3 +65,72 @@ class TransactionAdmin(admin.ModelAdmin):
 class UserLoanLimitAdmin(admin.ModelAdmin):
     list_display = ("user", "amount", "updated_at")
     search_fields = ("user__username",)
+
+
+@admin.register(MemberBalance)
+class MemberBalanceAdmin(admin.ModelAdmin):
+    list_display = ("user", "total_saved", "total_disbursed", "total_repaid", "outstanding", "pending_count", "updated_at")
+    search_fields = ("user__username",)
+
+
+@admin.register(AnalyticsRollup)
+class AnalyticsRollupAdmin(admin.ModelAdmin):
+    list_display = ("metric", "period", "category", "status", "count", "total_amount")
+    list_filter = ("metric", "category", "status")
+
+
+@admin.register(TransactionTrend)
+class TransactionTrendAdmin(admin.ModelAdmin):
+    list_display = ("month", "transaction_type", "status", "count", "total_amount")
+    list_filter = ("transaction_type", "status")
+
+
+@admin.register(TrendWatermark)
+class TrendWatermarkAdmin(admin.ModelAdmin):
+    list_display = ("name", "last_id", "refreshed_at")
+
+
+@admin.register(PaymentJob)
+class PaymentJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "transaction", "status", "attempts", "next_attempt_at", "updated_at")
+    list_filter = ("status",)
+    search_fields = ("transaction__user__username", "transaction__payment_reference")
+
+
+@admin.register(ProcessedCallback)
+class ProcessedCallbackAdmin(admin.ModelAdmin):
+    list_display = ("checkout_request_id", "mpesa_receipt_number", "result_code", "transaction", "received_at")
+    search_fields = ("checkout_request_id", "mpesa_receipt_number")
+
+
+@admin.register(LedgerImport)
+class LedgerImportAdmin(admin.ModelAdmin):
+    list_display = ("source", "kind", "rows_read", "rows_imported", "rows_rejected", "updated_at", "completed_at")
+    list_filter = ("kind",)
+
+
+@admin.register(LedgerPartition)
+class LedgerPartitionAdmin(admin.ModelAdmin):
+    list_display = ("month", "table_name", "row_count", "total_amount", "checksum", "updated_at", "verified_at")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LoanProduct)
+class LoanProductAdmin(admin.ModelAdmin):
+    list_display = ("name", "interest_rate", "term_months", "interest_method", "is_active")
+    list_filter = ("interest_method", "is_active")
+
+
+@admin.register(RepaymentInstalment)
+class RepaymentInstalmentAdmin(admin.ModelAdmin):
+    list_display = ("loan", "number", "due_date", "principal_due", "interest_due", "amount_paid", "paid_at")
+    search_fields = ("loan__user__username", "loan__name")
+    list_filter = ("due_date",)
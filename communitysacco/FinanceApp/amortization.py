@@ -0,0 +1,317 @@
+import calendar
+from collections import Counter, defaultdict
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+
+from django.db import transaction as db_transaction
+from django.db.models import BigIntegerField, CharField, DateTimeField, Exists, F, OuterRef, Sum
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
+
+from . import ledger_archive
+from .models import LoanProduct, LoanRequest, RepaymentInstalment, Transaction
+
+
+TERM_FIELDS = ("id", "user_id", "amount", "interest_rate", "term_months", "interest_method", "reviewed_at", "created_at")
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def in_cents(field):
+    """Read a money column as integer cents, skipping the per-row ``Decimal`` conversion."""
+    return Cast(Round(F(field) * 100), BigIntegerField())
+
+
+def add_months(day, months):
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+@lru_cache(maxsize=65536)
+def schedule_cents(principal_cents, annual_rate, term_months, method):
+    """
+    Split a loan into ``term_months`` monthly ``(principal, interest)`` pairs, in cents.
+
+    Flat-rate loans charge interest on the original principal for the whole
+    term, spread evenly. Reducing-balance loans use equal instalments with
+    interest on the outstanding balance each month. Rounding remainders go on
+    the last instalment. Cached because a portfolio shares few distinct terms.
+    """
+    monthly_rate = float(annual_rate) / 1200
+    if method == LoanProduct.METHOD_FLAT:
+        total_interest = round(principal_cents * float(annual_rate) / 100 * term_months / 12)
+        principal_each, interest_each = principal_cents // term_months, total_interest // term_months
+        rows = [(principal_each, interest_each)] * (term_months - 1)
+        rows.append(
+            (
+                principal_cents - principal_each * (term_months - 1),
+                total_interest - interest_each * (term_months - 1),
+            )
+        )
+        return tuple(rows)
+
+    if monthly_rate:
+        payment = round(principal_cents * monthly_rate / (1 - (1 + monthly_rate) ** -term_months))
+    else:
+        payment = -(-principal_cents // term_months)
+    balance = principal_cents
+    rows = []
+    for number in range(1, term_months + 1):
+        interest = round(balance * monthly_rate)
+        principal = balance if number == term_months else min(max(payment - interest, 0), balance)
+        rows.append((principal, interest))
+        balance -= principal
+    return tuple(rows)
+
+
+@lru_cache(maxsize=4096)
+def due_dates(start, term_months):
+    """Monthly due dates after ``start``, as ISO strings, shared by every loan approved that day."""
+    return tuple(add_months(start, number).isoformat() for number in range(1, term_months + 1))
+
+
+def loan_schedule(loan):
+    """
+    Return ``[(number, due_date, principal_cents, interest_cents), ...]`` for a loan's stored terms.
+
+    ``loan`` is a dict with the ``TERM_FIELDS`` keys. The first instalment falls
+    due one month after approval; due dates are ISO strings.
+    """
+    start = timezone.localtime(loan["reviewed_at"] or loan["created_at"]).date()
+    rows = schedule_cents(
+        to_cents(loan["amount"]), loan["interest_rate"], loan["term_months"], loan["interest_method"]
+    )
+    return [
+        (number, due_date, principal, interest)
+        for number, due_date, (principal, interest) in zip(
+            range(1, len(rows) + 1), due_dates(start, loan["term_months"]), rows
+        )
+    ]
+
+
+def allocate(amounts_due, repaid):
+    """Spread ``repaid`` over instalment amounts in order, oldest first. Returns the paid amount per instalment."""
+    paid = []
+    for amount_due in amounts_due:
+        portion = min(amount_due, repaid) if repaid > 0 else 0
+        paid.append(portion)
+        repaid -= portion
+    return paid
+
+
+def _scheduled_loans():
+    return LoanRequest.objects.filter(
+        status=LoanRequest.STATUS_APPROVED, interest_rate__isnull=False, term_months__gt=0
+    ).exclude(interest_method="")
+
+
+def scheduled_repayments(user_ids):
+    """
+    Completed repayments, in cents per member, made once the member had a scheduled loan.
+
+    Repayments from before the first scheduled loan's approval settled earlier, unscheduled
+    loans, so they never pay down instalments. Archived months are included.
+    """
+    scheduled = _scheduled_loans().annotate(
+        started_at=Coalesce("reviewed_at", "created_at", output_field=DateTimeField())
+    ).filter(user_id=OuterRef("user_id"), started_at__lte=OuterRef("created_at"))
+    repaid = Counter()
+    for transactions in ledger_archive.sources():
+        repaid.update(
+            dict(
+                transactions.filter(
+                    user_id__in=user_ids,
+                    transaction_type=Transaction.TYPE_LOAN_REPAYMENT,
+                    status=Transaction.STATUS_COMPLETED,
+                )
+                .filter(Exists(scheduled))
+                .order_by()
+                .values("user_id")
+                .annotate(total=Sum("amount"))
+                .values_list("user_id", "total")
+            )
+        )
+    return {user_id: to_cents(total) for user_id, total in repaid.items()}
+
+
+def _instalment(loan_id, number, due_date, principal, interest, paid=0, paid_at=None):
+    return RepaymentInstalment(
+        loan_id=loan_id,
+        number=number,
+        due_date=due_date,
+        principal_due=from_cents(principal),
+        interest_due=from_cents(interest),
+        amount_paid=from_cents(paid),
+        paid_at=paid_at,
+    )
+
+
+def create_schedules(loan_ids):
+    """Store repayment schedules for newly approved loans and allocate their members' repayments."""
+    with db_transaction.atomic():
+        loans = list(
+            _scheduled_loans().filter(id__in=loan_ids, instalments__isnull=True).order_by().values(*TERM_FIELDS)
+        )
+        RepaymentInstalment.objects.bulk_create(
+            [_instalment(loan["id"], *row) for loan in loans for row in loan_schedule(loan)],
+            batch_size=1000,
+        )
+        allocate_repayments({loan["user_id"] for loan in loans})
+    return len(loans)
+
+
+def allocate_repayments(user_ids, repaid_by_user=None):
+    """
+    Re-allocate each member's completed repayments across their instalments, oldest due first.
+
+    ``repaid_by_user`` maps user ids to repaid cents and defaults to
+    ``scheduled_repayments``. Only instalments whose paid amount changes are
+    written. Returns that count.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return 0
+    if repaid_by_user is None:
+        repaid_by_user = scheduled_repayments(user_ids)
+
+    by_user = defaultdict(list)
+    for row in (
+        RepaymentInstalment.objects.filter(loan__user_id__in=user_ids, loan__status=LoanRequest.STATUS_APPROVED)
+        .annotate(due=in_cents("principal_due") + in_cents("interest_due"), paid=in_cents("amount_paid"))
+        .order_by("loan__user_id", "due_date", "loan_id", "number")
+        .values_list("id", "loan__user_id", "due", "paid")
+    ):
+        by_user[row[1]].append(row)
+
+    changes = []
+    for user_id, rows in by_user.items():
+        paid_amounts = allocate([row[2] for row in rows], repaid_by_user.get(user_id) or 0)
+        changes.extend((row[0], paid, row[2]) for row, paid in zip(rows, paid_amounts) if paid != row[3])
+    _write_paid(changes)
+    return len(changes)
+
+
+def _write_paid(changes, chunk_size=500):
+    """
+    Store new paid amounts (``(instalment_id, paid_cents, due_cents)``) with a few grouped ``UPDATE`` statements.
+
+    Fully paid and unpaid instalments are written in bulk; only the partly paid
+    ones (at most one per member) need their own amount.
+    """
+    full, empty, partial = [], [], []
+    for instalment_id, paid, amount_due in changes:
+        if paid == amount_due:
+            full.append(instalment_id)
+        elif not paid:
+            empty.append(instalment_id)
+        else:
+            partial.append((instalment_id, paid))
+
+    now = timezone.now()
+    for start in range(0, len(full), chunk_size):
+        RepaymentInstalment.objects.filter(id__in=full[start : start + chunk_size]).update(
+            amount_paid=F("principal_due") + F("interest_due"), paid_at=Coalesce("paid_at", now)
+        )
+    for start in range(0, len(empty), chunk_size):
+        RepaymentInstalment.objects.filter(id__in=empty[start : start + chunk_size]).update(amount_paid=0, paid_at=None)
+    for instalment_id, paid in partial:
+        RepaymentInstalment.objects.filter(id=instalment_id).update(amount_paid=from_cents(paid), paid_at=None)
+
+
+def apply_changes(model, changes):
+    """Re-allocate instalments for members whose completed repayments changed in ``changes``."""
+    if model is not Transaction:
+        return
+    affected = set()
+    for previous, current in changes:
+        for state in (previous, current):
+            if (
+                state
+                and state["transaction_type"] == Transaction.TYPE_LOAN_REPAYMENT
+                and state["status"] == Transaction.STATUS_COMPLETED
+            ):
+                affected.add(state["user"])
+    if affected and RepaymentInstalment.objects.filter(loan__user_id__in=affected).exists():
+        allocate_repayments(affected)
+
+
+def recompute_portfolio(batch_size=2000):
+    """
+    Regenerate every approved loan's schedule from its terms and re-allocate all repayments.
+
+    Works through members in batches, one transaction each. Schedules are
+    recomputed in memory, in integer cents, and compared with the stored
+    instalments; only loans whose schedule differs are rewritten, and only
+    changed paid amounts are updated. Repaid totals come straight from the
+    transactions table. Returns a ``Counter`` of loans, schedules written and
+    instalments updated.
+    """
+    stats = Counter(loans=0, schedules_written=0, instalments_updated=0)
+    user_ids = sorted(set(_scheduled_loans().order_by().values_list("user_id", flat=True)))
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start : start + batch_size]
+        with db_transaction.atomic():
+            stats.update(_recompute_members(batch))
+    return stats
+
+
+def _recompute_members(user_ids):
+    stats = Counter()
+    repaid_by_user = scheduled_repayments(user_ids)
+
+    stored = defaultdict(list)
+    for row in (
+        RepaymentInstalment.objects.filter(loan__user_id__in=user_ids)
+        .annotate(
+            due_on=Cast("due_date", CharField()),
+            principal=in_cents("principal_due"),
+            interest=in_cents("interest_due"),
+            paid=in_cents("amount_paid"),
+        )
+        .order_by("loan_id", "number")
+        .values_list("loan_id", "number", "due_on", "principal", "interest", "id", "paid")
+    ):
+        stored[row[0]].append(row[1:])
+
+    expected_by_user = defaultdict(list)
+    stale_loans = []
+    for loan in _scheduled_loans().filter(user_id__in=user_ids).order_by().values(*TERM_FIELDS):
+        stats["loans"] += 1
+        schedule = loan_schedule(loan)
+        existing = stored.pop(loan["id"], ())
+        if len(existing) != len(schedule) or any(row[:4] != expected for row, expected in zip(existing, schedule)):
+            stale_loans.append(loan["id"])
+            existing = [None] * len(schedule)
+        entries = expected_by_user[loan["user_id"]]
+        for (number, due_date, principal, interest), row in zip(schedule, existing):
+            entries.append((due_date, loan["id"], number, principal, interest, row))
+    # Anything left belongs to loans that are no longer approved or lost their terms.
+    stale_loans.extend(stored)
+
+    RepaymentInstalment.objects.filter(loan_id__in=stale_loans).delete()
+    new_rows = []
+    changes = []
+    now = timezone.now()
+    for user_id, entries in expected_by_user.items():
+        entries.sort(key=lambda entry: entry[:3])
+        paid_amounts = allocate([entry[3] + entry[4] for entry in entries], repaid_by_user.get(user_id, 0))
+        for (due_date, loan_id, number, principal, interest, row), paid in zip(entries, paid_amounts):
+            if row is None:
+                paid_at = now if paid == principal + interest else None
+                new_rows.append(_instalment(loan_id, number, due_date, principal, interest, paid, paid_at))
+            elif paid != row[5]:
+                changes.append((row[4], paid, principal + interest))
+    RepaymentInstalment.objects.bulk_create(new_rows, batch_size=1000)
+    _write_paid(changes)
+
+    stats["schedules_written"] += len({row.loan_id for row in new_rows})
+    stats["instalments_updated"] += len(changes)
+    return stats
@@ -0,0 +1,185 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import ledger_archive
+from .models import AnalyticsRollup, LoanRequest, Transaction
+
+
+def _period(created_at):
+    return timezone.localtime(created_at).date() if timezone.is_aware(created_at) else created_at.date()
+
+
+def rollup_entries(model, state):
+    """Return ``[(metric, period, category, status, amount)]`` for a tracked row's state."""
+    if state is None:
+        return []
+    if model is Transaction:
+        return [
+            (
+                AnalyticsRollup.METRIC_TRANSACTION,
+                _period(state["created_at"]),
+                state["transaction_type"],
+                state["status"],
+                state["amount"],
+            )
+        ]
+    if model is LoanRequest:
+        return [(AnalyticsRollup.METRIC_LOAN_REQUEST, _period(state["created_at"]), "", state["status"], state["amount"])]
+    return []
+
+
+def _applicant_changes(changes):
+    # A member counts as an applicant from their first loan request until their last one is removed.
+    gained = defaultdict(list)
+    lost = defaultdict(list)
+    for previous, current in changes:
+        previous_user = previous["user"] if previous else None
+        current_user = current["user"] if current else None
+        if previous_user == current_user:
+            continue
+        if previous_user is not None:
+            lost[previous_user].append(previous["created_at"])
+        if current_user is not None:
+            gained[current_user].append(current["created_at"])
+
+    users = set(gained) | set(lost)
+    if not users:
+        return []
+    counts_now = dict(
+        LoanRequest.objects.filter(user_id__in=users)
+        .order_by()
+        .values("user_id")
+        .annotate(total=Count("id"))
+        .values_list("user_id", "total")
+    )
+    applicant_changes = []
+    for user_id in users:
+        now = counts_now.get(user_id, 0)
+        before = now - len(gained[user_id]) + len(lost[user_id])
+        if not before and now:
+            applicant_changes.append((_period(min(gained[user_id])), 1))
+        elif before and not now:
+            applicant_changes.append((_period(min(lost[user_id])), -1))
+    return applicant_changes
+
+
+def apply_change(model, previous, current):
+    """
+    Move a row's rollup contribution from its ``previous`` to its ``current`` state.
+
+    Runs after the row write, inside the same transaction.
+    """
+    apply_changes(model, [(previous, current)])
+
+
+def apply_changes(model, changes):
+    """Apply many ``(previous, current)`` state pairs with one ``UPDATE`` per affected bucket."""
+    totals = defaultdict(lambda: [0, 0])
+    for previous, current in changes:
+        for entries, sign in ((rollup_entries(model, previous), -1), (rollup_entries(model, current), 1)):
+            for metric, period, category, status, amount in entries:
+                bucket = totals[(metric, period, category, status)]
+                bucket[0] += sign
+                bucket[1] += sign * amount
+
+    if model is LoanRequest:
+        for period, count in _applicant_changes(changes):
+            totals[(AnalyticsRollup.METRIC_LOAN_APPLICANT, period, "", "")][0] += count
+
+    # Sorted, so concurrent batches lock rollup rows in the same order and cannot deadlock.
+    for key, (count, amount) in sorted(totals.items()):
+        adjust_rollup(*key, count=count, amount=amount)
+
+
+def adjust_rollup(metric, period, category, status, count=0, amount=0):
+    """Add ``count`` and ``amount`` to one rollup bucket with a single ``UPDATE``."""
+    if not count and not amount:
+        return
+    key = {"metric": metric, "period": period, "category": category, "status": status}
+    updates = {"count": F("count") + count, "total_amount": F("total_amount") + amount}
+    if AnalyticsRollup.objects.filter(**key).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            AnalyticsRollup.objects.create(count=count, total_amount=amount, **key)
+    except IntegrityError:
+        AnalyticsRollup.objects.filter(**key).update(**updates)
+
+
+def rollup_totals():
+    """
+    Return all-time ``{(metric, category, status): (count, total_amount)}`` summed from the rollups.
+    """
+    rows = (
+        AnalyticsRollup.objects.order_by()
+        .values("metric", "category", "status")
+        .annotate(count_total=Sum("count"), amount_total=Sum("total_amount"))
+    )
+    return {
+        (row["metric"], row["category"], row["status"]): (row["count_total"] or 0, row["amount_total"] or Decimal("0"))
+        for row in rows
+    }
+
+
+def rebuild_rollups(batch_size=1000):
+    """
+    Recompute every rollup bucket from the source tables, archived ledger months included.
+    Returns the number of buckets written.
+    """
+    transaction_buckets = defaultdict(lambda: [0, 0])
+    for transactions in ledger_archive.sources():
+        transaction_rows = (
+            transactions.order_by()
+            .annotate(period=TruncDate("created_at"))
+            .values("period", "transaction_type", "status")
+            .annotate(count=Count("id"), total_amount=Sum("amount"))
+        )
+        for row in transaction_rows:
+            bucket = transaction_buckets[row["period"], row["transaction_type"], row["status"]]
+            bucket[0] += row["count"]
+            bucket[1] += row["total_amount"] or 0
+
+    rollups = [
+        AnalyticsRollup(
+            metric=AnalyticsRollup.METRIC_TRANSACTION,
+            period=period,
+            category=transaction_type,
+            status=status,
+            count=count,
+            total_amount=total_amount,
+        )
+        for (period, transaction_type, status), (count, total_amount) in transaction_buckets.items()
+    ]
+
+    loan_rows = (
+        LoanRequest.objects.order_by()
+        .annotate(period=TruncDate("created_at"))
+        .values("period", "status")
+        .annotate(count=Count("id"), total_amount=Sum("amount"))
+    )
+    for row in loan_rows:
+        rollups.append(
+            AnalyticsRollup(
+                metric=AnalyticsRollup.METRIC_LOAN_REQUEST,
+                period=row["period"],
+                status=row["status"],
+                count=row["count"],
+                total_amount=row["total_amount"] or 0,
+            )
+        )
+
+    first_loans = defaultdict(int)
+    for row in LoanRequest.objects.order_by().values("user_id").annotate(first=TruncDate(Min("created_at"))):
+        first_loans[row["first"]] += 1
+    for period, count in first_loans.items():
+        rollups.append(AnalyticsRollup(metric=AnalyticsRollup.METRIC_LOAN_APPLICANT, period=period, count=count))
+
+    with transaction.atomic():
+        AnalyticsRollup.objects.all().delete()
+        AnalyticsRollup.objects.bulk_create(rollups, batch_size=batch_size)
+    return len(rollups)
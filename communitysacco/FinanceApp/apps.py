@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class FinanceappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'FinanceApp'
+
+    def ready(self):
+        from . import member_summary  # noqa: F401  (registers the cache invalidation signals)
+        from . import request_metrics  # noqa: F401  (registers the per-request query timing)
+        from . import search  # noqa: F401  (registers the search index signals)
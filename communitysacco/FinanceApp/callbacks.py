@@ -0,0 +1,259 @@
+import json
+import logging
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.db import IntegrityError, transaction as db_transaction
+
+from . import search
+from .models import ProcessedCallback, Transaction, apply_tracked_change, apply_tracked_changes
+
+
+logger = logging.getLogger(__name__)
+
+APPLIED = "applied"
+DUPLICATE = "duplicate"
+UNMATCHED = "unmatched"
+INVALID = "invalid"
+
+
+class StkCallback:
+    def __init__(self, checkout_request_id, result_code, result_desc="", receipt_number="", amount=None, phone_number=""):
+        self.checkout_request_id = checkout_request_id
+        self.result_code = result_code
+        self.result_desc = result_desc
+        self.receipt_number = receipt_number
+        self.amount = amount
+        self.phone_number = phone_number
+
+    @property
+    def succeeded(self):
+        return self.result_code == 0
+
+
+def parse_stk_callback(payload):
+    """Build an ``StkCallback`` from a Daraja callback body, or return ``None`` if it is unusable."""
+    if not isinstance(payload, dict):
+        return None
+    body = payload.get("Body")
+    callback_data = body.get("stkCallback", {}) if isinstance(body, dict) else {}
+    checkout_request_id = callback_data.get("CheckoutRequestID") or payload.get("CheckoutRequestID")
+    result_code = callback_data.get("ResultCode", payload.get("ResultCode"))
+    try:
+        result_code = int(result_code)
+    except (TypeError, ValueError):
+        return None
+    if not checkout_request_id:
+        return None
+
+    metadata = {}
+    items = (callback_data.get("CallbackMetadata") or {}).get("Item") or []
+    for item in items:
+        if isinstance(item, dict) and "Name" in item:
+            metadata[item["Name"]] = item.get("Value")
+
+    return StkCallback(
+        checkout_request_id=str(checkout_request_id),
+        result_code=result_code,
+        result_desc=str(callback_data.get("ResultDesc") or payload.get("ResultDesc") or ""),
+        receipt_number=str(metadata.get("MpesaReceiptNumber") or ""),
+        amount=metadata.get("Amount"),
+        phone_number=str(metadata.get("PhoneNumber") or ""),
+    )
+
+
+def _by_payment_reference(queryset):
+    # The unique index on payment_reference only covers non-empty references. Repeating that
+    # condition lets SQLite pick the index (PostgreSQL infers it from the equality on its own).
+    return queryset.exclude(payment_reference="").order_by()
+
+
+def callback_outcome(callback):
+    """Return the ``(status, description)`` a pending transaction moves to for this callback."""
+    # Receipt numbers live on ProcessedCallback; keeping descriptions generic lets batches
+    # update every transaction with the same outcome in one statement.
+    if callback.succeeded:
+        return Transaction.STATUS_COMPLETED, "Paid via M-Pesa"
+    reason = callback.result_desc or "Payment not completed."
+    return Transaction.STATUS_FAILED, f"Payment not completed: {reason}"[:255]
+
+
+def apply_stk_callback(callback):
+    """
+    Apply one STK callback exactly once.
+
+    The transaction is found through the unique ``payment_reference`` index and
+    moved out of ``PENDING`` with a single conditional ``UPDATE``; the callback
+    is logged in ``ProcessedCallback`` in the same transaction so replays are
+    rejected by its unique index. Returns ``APPLIED``, ``DUPLICATE`` or
+    ``UNMATCHED``.
+    """
+    tracked_fields = Transaction.tracked_fields
+    with db_transaction.atomic():
+        # Locking the transaction first serialises this with batches touching the same payment.
+        state = (
+            _by_payment_reference(Transaction.objects.select_for_update())
+            .filter(payment_reference=callback.checkout_request_id)
+            .values("id", *tracked_fields)
+            .first()
+        )
+        if state is None:
+            # Leave it unlogged: the push may not have recorded its reference yet.
+            return UNMATCHED
+
+        try:
+            with db_transaction.atomic():
+                ProcessedCallback.objects.create(
+                    checkout_request_id=callback.checkout_request_id,
+                    mpesa_receipt_number=callback.receipt_number,
+                    result_code=callback.result_code,
+                    result_desc=callback.result_desc[:255],
+                    transaction_id=state["id"],
+                )
+        except IntegrityError:
+            return DUPLICATE
+
+        status, description = callback_outcome(callback)
+        updated = Transaction.objects.filter(id=state["id"], status=Transaction.STATUS_PENDING).update(
+            status=status, description=description
+        )
+        if updated:
+            previous = {field: state[field] for field in tracked_fields}
+            apply_tracked_change(Transaction, previous, dict(previous, status=status))
+            search.reindex(Transaction, [state["id"]])
+    return APPLIED
+
+
+def iter_jsonl_callbacks(lines):
+    """Yield an ``StkCallback`` (or ``None`` for an unusable line) per non-blank JSONL line."""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield parse_stk_callback(json.loads(line))
+        except json.JSONDecodeError:
+            yield None
+
+
+def ingest_callbacks(callbacks, batch_size=1000):
+    """
+    Apply a stream of parsed callbacks in batches, one database transaction per batch.
+
+    Accepts any iterable (``None`` entries count as invalid) and never holds more
+    than ``batch_size`` callbacks in memory. Returns a ``Counter`` of outcomes.
+    """
+    stats = Counter()
+    callbacks = iter(callbacks)
+    while True:
+        batch = list(islice(callbacks, batch_size))
+        if not batch:
+            return stats
+        stats[INVALID] += sum(1 for callback in batch if callback is None)
+        stats.update(_apply_callback_batch([callback for callback in batch if callback is not None]))
+
+
+def _unlogged(by_checkout_id, stats):
+    """The callbacks of ``by_checkout_id`` whose checkout id and receipt are not logged yet."""
+    seen_ids = set(
+        ProcessedCallback.objects.filter(checkout_request_id__in=list(by_checkout_id)).values_list(
+            "checkout_request_id", flat=True
+        )
+    )
+    receipts = [callback.receipt_number for callback in by_checkout_id.values() if callback.receipt_number]
+    seen_receipts = set(
+        ProcessedCallback.objects.filter(mpesa_receipt_number__in=receipts).values_list("mpesa_receipt_number", flat=True)
+    )
+    fresh = []
+    for checkout_request_id, callback in by_checkout_id.items():
+        if checkout_request_id in seen_ids or (callback.receipt_number and callback.receipt_number in seen_receipts):
+            stats[DUPLICATE] += 1
+            continue
+        if callback.receipt_number:
+            seen_receipts.add(callback.receipt_number)
+        fresh.append(callback)
+    return fresh
+
+
+def _apply_callback_batch(batch):
+    stats = Counter()
+    by_checkout_id = {}
+    for callback in batch:
+        if callback.checkout_request_id in by_checkout_id:
+            stats[DUPLICATE] += 1
+        else:
+            by_checkout_id[callback.checkout_request_id] = callback
+    if not by_checkout_id:
+        return stats
+
+    tracked_fields = Transaction.tracked_fields
+    with db_transaction.atomic():
+        # Lock the matched transactions in id order before looking at the log, as single
+        # callbacks do, so two writers never both log the same payment.
+        states = {
+            state["payment_reference"]: state
+            for state in _by_payment_reference(Transaction.objects.select_for_update())
+            .filter(payment_reference__in=list(by_checkout_id))
+            .order_by("id")
+            .values("id", "payment_reference", *tracked_fields)
+        }
+        fresh = _unlogged(by_checkout_id, stats)
+
+        log_rows = []
+        for callback in fresh:
+            state = states.get(callback.checkout_request_id)
+            if state is None:
+                stats[UNMATCHED] += 1
+                continue
+            log_rows.append(
+                ProcessedCallback(
+                    checkout_request_id=callback.checkout_request_id,
+                    mpesa_receipt_number=callback.receipt_number,
+                    result_code=callback.result_code,
+                    result_desc=callback.result_desc[:255],
+                    transaction_id=state["id"],
+                )
+            )
+
+        # A receipt logged by another writer since the check above is skipped rather than
+        # failing the batch; only the callbacks whose rows went in are applied.
+        ProcessedCallback.objects.bulk_create(log_rows, batch_size=500, ignore_conflicts=True)
+        logged = set(
+            ProcessedCallback.objects.filter(
+                checkout_request_id__in=[row.checkout_request_id for row in log_rows],
+                transaction_id__in=[row.transaction_id for row in log_rows],
+            ).values_list("checkout_request_id", "mpesa_receipt_number", "transaction_id")
+        )
+
+        status_updates = {}
+        changes = []
+        for row in log_rows:
+            if (row.checkout_request_id, row.mpesa_receipt_number, row.transaction_id) not in logged:
+                stats[DUPLICATE] += 1
+                continue
+            stats[APPLIED] += 1
+            state = states[row.checkout_request_id]
+            if state["status"] == Transaction.STATUS_PENDING:
+                status, description = callback_outcome(by_checkout_id[row.checkout_request_id])
+                status_updates[state["id"]] = (status, description)
+                previous = {field: state[field] for field in tracked_fields}
+                changes.append((previous, dict(previous, status=status)))
+
+        _bulk_update_statuses(status_updates)
+        apply_tracked_changes(Transaction, changes)
+        search.reindex(Transaction, status_updates)
+    return stats
+
+
+def _bulk_update_statuses(status_updates, chunk_size=500):
+    """Apply status changes with one ``UPDATE ... WHERE id IN (...)`` per outcome and chunk."""
+    by_outcome = defaultdict(list)
+    for txn_id, outcome in status_updates.items():
+        by_outcome[outcome].append(txn_id)
+    for (status, description), txn_ids in by_outcome.items():
+        for start in range(0, len(txn_ids), chunk_size):
+            Transaction.objects.filter(
+                id__in=txn_ids[start : start + chunk_size], status=Transaction.STATUS_PENDING
+            ).update(status=status, description=description)
@@ -0,0 +1,135 @@
+import io
+import logging
+import shutil
+import subprocess
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .documents import get_document_storage
+from .models import LoanDocument
+
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class PreviewUnavailable(Exception):
+    """No renderer is installed for the document's type (Pillow for images, poppler's pdftoppm for PDFs)."""
+
+
+def preview_name(document):
+    return f"loan_previews/{document.sha256[:2]}/{document.sha256}.jpg"
+
+
+def _thumbnail(source):
+    """JPEG bytes of an image file shrunk to fit ``DOCUMENT_PREVIEW_MAX_PX`` square."""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise PreviewUnavailable("Pillow is not installed.") from None
+    max_px = _setting("DOCUMENT_PREVIEW_MAX_PX", 480)
+    with Image.open(source) as image:
+        image.thumbnail((max_px, max_px))
+        output = io.BytesIO()
+        image.convert("RGB").save(output, "JPEG", quality=80)
+    return output.getvalue()
+
+
+def _pdf_first_page(document, storage):
+    pdftoppm = shutil.which("pdftoppm")
+    if pdftoppm is None:
+        raise PreviewUnavailable("pdftoppm is not installed.")
+    with tempfile.TemporaryDirectory() as scratch:
+        source = storage.local_path(document.name)
+        if source is None:
+            source = Path(scratch) / "document.pdf"
+            with storage.open(document.name) as stored, open(source, "wb") as copy:
+                shutil.copyfileobj(stored, copy)
+        output = Path(scratch) / "page"
+        subprocess.run(
+            [pdftoppm, "-f", "1", "-l", "1", "-singlefile", "-r", "72", "-jpeg", str(source), str(output)],
+            check=True,
+            capture_output=True,
+            timeout=_setting("DOCUMENT_PREVIEW_TIMEOUT_SECONDS", 60),
+        )
+        return _thumbnail(output.with_suffix(".jpg"))
+
+
+def render_preview(document, storage=None):
+    """JPEG preview bytes for a stored document. Raises ``PreviewUnavailable`` for unsupported types."""
+    storage = storage or get_document_storage()
+    if document.content_type == "application/pdf":
+        return _pdf_first_page(document, storage)
+    if document.content_type.startswith("image/"):
+        with storage.open(document.name) as source:
+            return _thumbnail(source)
+    raise PreviewUnavailable(f"No preview for {document.content_type}.")
+
+
+def requeue_stale_previews(now=None):
+    """Put back previews left RUNNING by a worker that died mid-render."""
+    now = now or timezone.now()
+    timeout = timedelta(seconds=_setting("DOCUMENT_PREVIEW_RUNNING_TIMEOUT_SECONDS", 300))
+    return LoanDocument.objects.filter(
+        preview_status=LoanDocument.PREVIEW_RUNNING, updated_at__lt=now - timeout
+    ).update(preview_status=LoanDocument.PREVIEW_PENDING, updated_at=now)
+
+
+def claim_pending_previews(limit, now=None):
+    """Claim up to ``limit`` documents awaiting a preview, one conditional UPDATE each (see ``claim_due_jobs``)."""
+    now = now or timezone.now()
+    candidate_ids = list(
+        LoanDocument.objects.filter(preview_status=LoanDocument.PREVIEW_PENDING)
+        .order_by("id")
+        .values_list("id", flat=True)[:limit]
+    )
+    claimed = [
+        document_id
+        for document_id in candidate_ids
+        if LoanDocument.objects.filter(id=document_id, preview_status=LoanDocument.PREVIEW_PENDING).update(
+            preview_status=LoanDocument.PREVIEW_RUNNING, updated_at=now
+        )
+    ]
+    return list(LoanDocument.objects.filter(id__in=claimed))
+
+
+def generate_preview(document, storage=None):
+    """Render and store one claimed document's preview, recording the outcome on the row."""
+    storage = storage or get_document_storage()
+    try:
+        name = preview_name(document)
+        storage.save(name, render_preview(document, storage))
+    except PreviewUnavailable as exc:
+        document.preview_status = LoanDocument.PREVIEW_UNAVAILABLE
+        document.preview_error = str(exc)[:255]
+    except Exception as exc:
+        # Damaged or hostile uploads make Pillow and pdftoppm fail in many ways; none should stop the worker.
+        logger.warning("Preview for document %s failed: %s", document.id, exc)
+        document.preview_status = LoanDocument.PREVIEW_FAILED
+        document.preview_error = str(exc)[:255]
+    else:
+        document.preview_status = LoanDocument.PREVIEW_READY
+        document.preview_name = name
+        document.preview_error = ""
+    document.save(update_fields=["preview_status", "preview_name", "preview_error", "updated_at"])
+    return document
+
+
+def drain(storage=None, batch_size=20):
+    """Render previews for every pending document. Returns how many were processed."""
+    requeue_stale_previews()
+    processed = 0
+    while True:
+        documents = claim_pending_previews(batch_size)
+        if not documents:
+            return processed
+        for document in documents:
+            generate_preview(document, storage)
+        processed += len(documents)
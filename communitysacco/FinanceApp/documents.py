@@ -0,0 +1,274 @@
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.move import file_move_safe
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction as db_transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+from .models import LoanDocument
+
+
+DEFAULT_STORAGE = "FinanceApp.documents.LocalDocumentStorage"
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the formats a preview can be rendered for; anything else keeps its extension's type.
+SIGNATURES = (
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+INLINE_CONTENT_TYPES = {content_type for _, content_type in SIGNATURES}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream every upload to a temporary file on disk, whatever its size, and SHA-256 it as the
+    chunks arrive, so storing it needs neither a second read nor the whole file in memory.
+    The digest is left on the uploaded file as ``sha256``.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.digest.hexdigest()
+        return uploaded
+
+
+class DocumentStorage:
+    """
+    Where loan documents and their previews are kept. Names are relative ``/``-separated paths.
+
+    Backends must write atomically: a name either holds its complete content or does not exist.
+    """
+
+    def store(self, uploaded, name):
+        """Move or copy an ``UploadedFile``'s content to ``name``."""
+        raise NotImplementedError
+
+    def save(self, name, content):
+        """Write ``content`` (bytes) to ``name``."""
+        raise NotImplementedError
+
+    def exists(self, name):
+        raise NotImplementedError
+
+    def size(self, name):
+        raise NotImplementedError
+
+    def open(self, name):
+        """Open ``name`` for binary reading."""
+        raise NotImplementedError
+
+    def local_path(self, name):
+        """The file's path on this machine, or ``None`` if the backend is not a local filesystem."""
+        return None
+
+
+class LocalDocumentStorage(DocumentStorage):
+    """Documents under ``DOCUMENT_STORAGE_ROOT`` (default ``MEDIA_ROOT``)."""
+
+    @property
+    def root(self):
+        return Path(_setting("DOCUMENT_STORAGE_ROOT", None) or settings.MEDIA_ROOT).resolve()
+
+    def local_path(self, name):
+        path = (self.root / name).resolve()
+        if not path.is_relative_to(self.root):
+            raise SuspiciousFileOperation(f"Document name {name!r} is outside the storage root.")
+        return path
+
+    def _write(self, name, fill):
+        target = self.local_path(name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Written next to the target and renamed into place, so readers never see a partial file.
+        fd, partial = tempfile.mkstemp(dir=target.parent, prefix=".partial-")
+        os.close(fd)
+        try:
+            fill(partial)
+            os.chmod(partial, _setting("FILE_UPLOAD_PERMISSIONS", None) or 0o644)
+            os.replace(partial, target)
+        except BaseException:
+            Path(partial).unlink(missing_ok=True)
+            raise
+
+    def store(self, uploaded, name):
+        if hasattr(uploaded, "temporary_file_path"):
+            self._write(name, lambda partial: file_move_safe(uploaded.temporary_file_path(), partial, allow_overwrite=True))
+            return
+
+        def copy(partial):
+            with open(partial, "wb") as destination:
+                for chunk in uploaded.chunks(CHUNK_SIZE):
+                    destination.write(chunk)
+
+        self._write(name, copy)
+
+    def save(self, name, content):
+        self._write(name, lambda partial: Path(partial).write_bytes(content))
+
+    def exists(self, name):
+        return self.local_path(name).is_file()
+
+    def size(self, name):
+        return self.local_path(name).stat().st_size
+
+    def open(self, name):
+        return open(self.local_path(name), "rb")
+
+
+def get_document_storage():
+    """Return this process's shared instance of the configured document storage backend."""
+    return _storage_instance(_setting("DOCUMENT_STORAGE_BACKEND", DEFAULT_STORAGE))
+
+
+@lru_cache(maxsize=None)
+def _storage_instance(path):
+    return import_string(path)()
+
+
+def sniff_content_type(uploaded):
+    """The upload's type from its leading bytes, falling back to its extension; the client's claim is ignored."""
+    uploaded.seek(0)
+    head = uploaded.read(16)
+    uploaded.seek(0)
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return mimetypes.guess_type(uploaded.name or "")[0] or "application/octet-stream"
+
+
+def _extension(filename):
+    suffix = Path(filename or "").suffix.lower()
+    return suffix if re.fullmatch(r"\.[a-z0-9]{1,8}", suffix) else ""
+
+
+def store_upload(uploaded, storage=None):
+    """
+    Store an uploaded loan document under its SHA-256 and return its ``LoanDocument``.
+
+    Content that is already stored is not written again: the existing row is returned.
+    """
+    sha256 = getattr(uploaded, "sha256", None)
+    if sha256 is None:
+        digest = hashlib.sha256()
+        for chunk in uploaded.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+        sha256 = digest.hexdigest()
+
+    existing = LoanDocument.objects.filter(sha256=sha256).first()
+    if existing is not None:
+        return existing
+
+    storage = storage or get_document_storage()
+    content_type = sniff_content_type(uploaded)
+    name = f"loan_documents/{sha256[:2]}/{sha256}{_extension(uploaded.name)}"
+    storage.store(uploaded, name)
+    try:
+        with db_transaction.atomic():
+            return LoanDocument.objects.create(
+                sha256=sha256, name=name, size=uploaded.size, content_type=content_type
+            )
+    except IntegrityError:
+        # The same content was stored concurrently; both wrote identical bytes.
+        return LoanDocument.objects.get(sha256=sha256)
+
+
+class _FileRange:
+    """Iterate ``length`` bytes of an open file in chunks, closing it when the response is closed."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def __iter__(self):
+        while self.remaining > 0:
+            chunk = self.file.read(min(CHUNK_SIZE, self.remaining))
+            if not chunk:
+                break
+            self.remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+def _requested_range(header, size):
+    """``(start, end)`` for a single ``bytes=`` range, ``None`` for no usable range, or ``False`` if unsatisfiable."""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def document_response(request, name, content_type, filename, storage=None):
+    """
+    Serve a stored document without reading it into memory.
+
+    With ``DOCUMENT_SENDFILE_HEADER`` set the web server sends the file (``X-Accel-Redirect``
+    for nginx, ``X-Sendfile`` for Apache/lighttpd); otherwise it is streamed from the storage
+    backend in chunks, honouring single-range ``Range`` requests.
+    """
+    storage = storage or get_document_storage()
+    if not storage.exists(name):
+        return None
+
+    offload = _setting("DOCUMENT_SENDFILE_HEADER", "")
+    path = storage.local_path(name)
+    if offload == "X-Accel-Redirect":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = quote(_setting("DOCUMENT_SENDFILE_PREFIX", "/protected-media/") + name)
+    elif offload == "X-Sendfile" and path is not None:
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = str(path)
+    else:
+        size = storage.size(name)
+        requested = _requested_range(request.headers.get("Range", ""), size)
+        if requested is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        file = storage.open(name)
+        if requested is None:
+            response = FileResponse(file, content_type=content_type)
+        else:
+            start, end = requested
+            file.seek(start)
+            response = StreamingHttpResponse(_FileRange(file, end - start + 1), status=206, content_type=content_type)
+            response["Content-Length"] = end - start + 1
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Accept-Ranges"] = "bytes"
+
+    # Only formats browsers render safely are shown inline; anything else (HTML, SVG...) downloads.
+    disposition = "inline" if content_type in INLINE_CONTENT_TYPES else "attachment"
+    response["Content-Disposition"] = f"{disposition}; filename*=UTF-8''{quote(filename)}"
+    return response
@@ -0,0 +1,123 @@
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from .payments import QUERY_STILL_PROCESSING
+
+
+class FakeDarajaServer:
+    """
+    A local HTTP stand-in for the Daraja endpoints the payment code calls.
+
+    Point ``MPESA_API_BASE_URL`` at ``server.url`` to exercise ``DarajaBackend``
+    end to end without Safaricom. STK queries succeed unless ``outcomes`` maps
+    the checkout request ID to another result code, or to ``None`` for "still
+    processing". ``latency`` adds a delay to every response, ``requests``
+    counts calls per path and ``max_in_flight`` records the most requests
+    that were being served at once.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        self.outcomes = {}
+        self.requests = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), _handler_for(self))
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def handle(self, method, path, body):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            return self._answer(method, path, body)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _answer(self, method, path, body):
+        if method == "GET" and path == "/oauth/v1/generate":
+            return 200, {"access_token": "fake-access-token", "expires_in": "3599"}
+        if method == "POST" and path == "/mpesa/stkpush/v1/processrequest":
+            checkout_request_id = f"ws_CO_LOCAL_{next(self._counter):010d}"
+            return 200, {
+                "MerchantRequestID": checkout_request_id.replace("ws_CO", "mr"),
+                "CheckoutRequestID": checkout_request_id,
+                "ResponseCode": "0",
+                "ResponseDescription": "Success. Request accepted for processing",
+                "CustomerMessage": "Success. Request accepted for processing",
+            }
+        if method == "POST" and path == "/mpesa/stkpushquery/v1/query":
+            checkout_request_id = body.get("CheckoutRequestID", "")
+            result_code = self.outcomes.get(checkout_request_id, 0)
+            if result_code is None:
+                return 500, {"errorCode": QUERY_STILL_PROCESSING, "errorMessage": "The transaction is being processed"}
+            return 200, {
+                "ResponseCode": "0",
+                "ResponseDescription": "The service request has been accepted successsfully",
+                "CheckoutRequestID": checkout_request_id,
+                "ResultCode": str(result_code),
+                "ResultDesc": "The service request is processed successfully."
+                if result_code == 0
+                else "Request cancelled by user",
+            }
+        return 404, {"errorCode": "404.001.03", "errorMessage": "Invalid Access Token"}
+
+
+def _handler_for(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self._respond("GET", {})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                body = {}
+            self._respond("POST", body)
+
+        def _respond(self, method, body):
+            status, payload = server.handle(method, urlsplit(self.path).path, body)
+            content = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
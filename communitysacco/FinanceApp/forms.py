@@ -1,6 +1,11 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
+from django.conf import settings
+from django.utils import timezone
 
-from .models import LoanRequest, SavingsRecord
+from .documents import store_upload
+from .models import LoanProduct, LoanRequest, SavingsRecord, Transaction
 
 
 class SavingsRecordForm(forms.ModelForm):
@@ -17,12 +22,115 @@ class SavingsRecordForm(forms.ModelForm):
 class LoanRequestForm(forms.ModelForm):
     class Meta:
         model = LoanRequest
-        fields = ["name", "id_number", "amount", "purpose", "document"]
+        fields = ["name", "id_number", "amount", "product", "purpose", "document"]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.fields["product"].queryset = LoanProduct.objects.filter(is_active=True)
+        self.fields["product"].empty_label = "No repayment schedule"
         for name, field in self.fields.items():
             if name == "document":
                 field.widget.attrs.update({"class": "form-control"})
             else:
                 field.widget.attrs.update({"class": "form-control"})
+
+    def save(self, commit=True):
+        # The upload is stored once per distinct content; the request points at the shared copy.
+        stored = store_upload(self.cleaned_data["document"])
+        self.instance.stored_document = stored
+        self.instance.document = stored.name
+        return super().save(commit)
+
+
+class DateRangeFilterForm(forms.Form):
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={"type": "date"}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={"type": "date"}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            field.widget.attrs.update({"class": "form-select" if isinstance(field, forms.ChoiceField) else "form-control"})
+
+    def bounds(self):
+        """The selected ``[start, end)`` as aware datetimes; either is ``None`` when open or invalid."""
+        if not self.is_valid():
+            return None, None
+        data = self.cleaned_data
+        return (
+            _start_of_day(data["date_from"]) if data["date_from"] else None,
+            _start_of_day(data["date_to"] + timedelta(days=1)) if data["date_to"] else None,
+        )
+
+    def filter(self, queryset):
+        """Apply the valid filters to a queryset with a ``created_at`` field; invalid input is ignored."""
+        start, end = self.bounds()
+        if start:
+            queryset = queryset.filter(created_at__gte=start)
+        if end:
+            queryset = queryset.filter(created_at__lt=end)
+        return queryset
+
+
+class LoanFilterForm(DateRangeFilterForm):
+    status = forms.ChoiceField(choices=[("", "All statuses")] + LoanRequest.STATUS_CHOICES, required=False)
+    applicant = forms.CharField(required=False, max_length=150)
+
+    field_order = ["status", "date_from", "date_to", "applicant"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["applicant"].widget.attrs["placeholder"] = "Username"
+
+    def filter(self, queryset, by_status=True):
+        queryset = super().filter(queryset)
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if by_status and data["status"]:
+            queryset = queryset.filter(status=data["status"])
+        if data["applicant"]:
+            queryset = queryset.filter(user__username__icontains=data["applicant"])
+        return queryset
+
+
+class TransactionFilterForm(DateRangeFilterForm):
+    transaction_type = forms.ChoiceField(choices=[("", "All types")] + Transaction.TYPE_CHOICES, required=False)
+    status = forms.ChoiceField(choices=[("", "All statuses")] + Transaction.STATUS_CHOICES, required=False)
+
+    def filter(self, queryset):
+        queryset = super().filter(queryset)
+        if not self.is_valid():
+            return queryset
+        for field in ("transaction_type", "status"):
+            if self.cleaned_data[field]:
+                queryset = queryset.filter(**{field: self.cleaned_data[field]})
+        return queryset
+
+
+class TransactionTrendForm(forms.Form):
+    """Window of the transaction trend API: the last ``months`` months, optionally one ``status``."""
+
+    WINDOW_CHOICES = [(3, "Last 3 months"), (6, "Last 6 months"), (12, "Last 12 months"), (24, "Last 24 months"), (36, "Last 36 months")]
+
+    months = forms.IntegerField(
+        min_value=1,
+        required=False,
+        initial=12,
+        widget=forms.Select(choices=WINDOW_CHOICES, attrs={"class": "form-select form-select-sm"}),
+    )
+    status = forms.ChoiceField(
+        choices=[("", "All statuses")] + Transaction.STATUS_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={"class": "form-select form-select-sm"}),
+    )
+
+    def clean_months(self):
+        months = self.cleaned_data["months"] or 12
+        if months > settings.TRANSACTION_TRENDS_MAX_MONTHS:
+            raise forms.ValidationError(f"At most {settings.TRANSACTION_TRENDS_MAX_MONTHS} months.")
+        return months
+
+
+def _start_of_day(day):
+    # Compare against datetimes rather than created_at__date so the created_at indexes stay usable.
+    return timezone.make_aware(datetime.combine(day, time.min))
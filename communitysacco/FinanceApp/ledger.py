@@ -0,0 +1,213 @@
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import ledger_archive
+from .models import MemberBalance, SavingsRecord, Transaction
+
+
+BALANCE_FIELDS = ("total_saved", "total_disbursed", "total_repaid", "outstanding", "pending_count")
+ZERO = Decimal("0.00")
+
+
+def transaction_deltas(transaction_type, status, amount):
+    """Balance contribution of one transaction row."""
+    if status == Transaction.STATUS_PENDING:
+        return {"pending_count": 1}
+    if transaction_type == Transaction.TYPE_LOAN_DISBURSEMENT:
+        return {"total_disbursed": amount, "outstanding": amount}
+    if transaction_type == Transaction.TYPE_LOAN_REPAYMENT:
+        return {"total_repaid": amount, "outstanding": -amount}
+    if transaction_type == Transaction.TYPE_DIVIDEND:
+        return {"total_saved": amount}
+    if transaction_type == Transaction.TYPE_PENALTY:
+        return {"outstanding": amount}
+    return {}
+
+
+def ledger_entry(model, state):
+    """Return ``(user_id, deltas)`` for a tracked row's state, or ``None`` if it does not feed balances."""
+    if state is None:
+        return None
+    if model is SavingsRecord:
+        return state["user"], {"total_saved": state["amount"]}
+    if model is Transaction:
+        return state["user"], transaction_deltas(state["transaction_type"], state["status"], state["amount"])
+    return None
+
+
+def apply_change(model, previous, current):
+    """
+    Move a row's balance contribution from its ``previous`` to its ``current`` state.
+
+    States are ``TrackedModel.tracked_state()`` dicts, or ``None`` for a row that
+    did not exist yet / no longer exists. Must run inside the transaction that
+    wrote the row.
+    """
+    apply_changes(model, [(previous, current)])
+
+
+def apply_changes(model, changes):
+    """Apply many ``(previous, current)`` state pairs with one ``UPDATE`` per affected member."""
+    totals = defaultdict(lambda: defaultdict(int))
+    for previous, current in changes:
+        for entry, sign in ((ledger_entry(model, previous), -1), (ledger_entry(model, current), 1)):
+            if entry is None:
+                continue
+            user_id, deltas = entry
+            for field, amount in deltas.items():
+                totals[user_id][field] += sign * amount
+
+    # Sorted, so concurrent batches lock balance rows in the same order and cannot deadlock.
+    for user_id, deltas in sorted(totals.items()):
+        adjust_balance(user_id, **deltas)
+
+
+def adjust_balance(user_id, **deltas):
+    """Add ``deltas`` to a member's balance row with a single ``UPDATE``."""
+    deltas = {field: amount for field, amount in deltas.items() if amount}
+    if not deltas:
+        return
+    unknown = set(deltas) - set(BALANCE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown balance fields: {', '.join(sorted(unknown))}")
+
+    updates = {field: F(field) + amount for field, amount in deltas.items()}
+    if MemberBalance.objects.filter(user_id=user_id).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            MemberBalance.objects.create(user_id=user_id, **deltas)
+    except IntegrityError:
+        # Another writer created the row first; apply on top of theirs.
+        MemberBalance.objects.filter(user_id=user_id).update(**updates)
+
+
+def get_balance(user):
+    """Return the member's balance row, or an unsaved zero balance for new members."""
+    balance = MemberBalance.objects.filter(user=user).first()
+    return balance or MemberBalance(user=user)
+
+
+def _transaction_totals():
+    """Per-member aggregates of the transactions that feed balances, for ``annotate``."""
+    money = DecimalField(max_digits=14, decimal_places=2)
+    completed = Q(status=Transaction.STATUS_COMPLETED)
+
+    def completed_sum(transaction_type):
+        return Coalesce(Sum("amount", filter=completed & Q(transaction_type=transaction_type)), Value(ZERO), output_field=money)
+
+    return {
+        "disbursed": completed_sum(Transaction.TYPE_LOAN_DISBURSEMENT),
+        "repaid": completed_sum(Transaction.TYPE_LOAN_REPAYMENT),
+        "dividends": completed_sum(Transaction.TYPE_DIVIDEND),
+        "penalties": completed_sum(Transaction.TYPE_PENALTY),
+        "pending": Count("id", filter=Q(status=Transaction.STATUS_PENDING)),
+    }
+
+
+def _transaction_balance(totals):
+    """Map ``_transaction_totals`` values (numbers or expressions) onto balance fields."""
+    return {
+        "total_saved": totals["dividends"],
+        "total_disbursed": totals["disbursed"],
+        "total_repaid": totals["repaid"],
+        "outstanding": totals["disbursed"] + totals["penalties"] - totals["repaid"],
+        "pending_count": totals["pending"],
+    }
+
+
+def apply_inserted(transactions, user_ids):
+    """
+    Add the balance contribution of freshly inserted ``transactions`` (a queryset) set-wise.
+
+    Stored balances of ``user_ids`` are moved with a single ``UPDATE`` of
+    correlated per-member aggregates instead of one statement per member.
+    Members without a balance row yet fall back to ``adjust_balance``.
+    """
+    user_ids = set(user_ids)
+    inserted = transactions.filter(user_id=OuterRef("user_id")).order_by().values("user_id")
+    totals = {
+        name: Subquery(inserted.annotate(total=aggregate).values("total"), output_field=aggregate.output_field)
+        for name, aggregate in _transaction_totals().items()
+    }
+    deltas = _transaction_balance(totals)
+    MemberBalance.objects.filter(user_id__in=user_ids).update(
+        **{field: F(field) + Coalesce(delta, Value(0), output_field=MemberBalance._meta.get_field(field)) for field, delta in deltas.items()}
+    )
+
+    missing = user_ids - set(MemberBalance.objects.filter(user_id__in=user_ids).values_list("user_id", flat=True))
+    if missing:
+        for row in transactions.filter(user_id__in=missing).order_by().values("user_id").annotate(**_transaction_totals()):
+            adjust_balance(row["user_id"], **_transaction_balance(row))
+
+
+def compute_balances(user_ids=None):
+    """Recompute balances from the source tables, archived months included, with set-wise aggregates."""
+    savings = SavingsRecord.objects.all()
+    if user_ids is not None:
+        savings = savings.filter(user_id__in=user_ids)
+
+    balances = defaultdict(lambda: dict.fromkeys(BALANCE_FIELDS, ZERO) | {"pending_count": 0})
+    for row in savings.order_by().values("user_id").annotate(total=Sum("amount")):
+        balances[row["user_id"]]["total_saved"] = row["total"] or ZERO
+
+    totals = defaultdict(Counter)
+    for transactions in ledger_archive.sources():
+        if user_ids is not None:
+            transactions = transactions.filter(user_id__in=user_ids)
+        for row in transactions.order_by().values("user_id").annotate(**_transaction_totals()):
+            totals[row.pop("user_id")].update(row)
+    for user_id, row in totals.items():
+        balance = balances[user_id]
+        balance.update(_transaction_balance(row), total_saved=balance["total_saved"] + row["dividends"])
+    return balances
+
+
+def rebuild_balances(user_ids=None, batch_size=1000):
+    """
+    Replace stored balances with freshly computed ones. Returns the number of rows written.
+
+    The stored rows are locked before the source tables are read, so a payment committing
+    meanwhile waits and applies its delta on top of the rebuilt row instead of being lost.
+    """
+    with transaction.atomic():
+        stored = MemberBalance.objects.all()
+        if user_ids is not None:
+            stored = stored.filter(user_id__in=user_ids)
+        list(stored.select_for_update().order_by("user_id").values_list("user_id", flat=True))
+        balances = compute_balances(user_ids)
+        stored.delete()
+        MemberBalance.objects.bulk_create(
+            [MemberBalance(user_id=user_id, **values) for user_id, values in balances.items()],
+            batch_size=batch_size,
+        )
+    return len(balances)
+
+
+def verify_balances(user_ids=None):
+    """
+    Compare stored balances with the source tables.
+
+    Returns a list of ``(user_id, field, stored, expected)`` tuples; empty when
+    the ledger is consistent.
+    """
+    expected = compute_balances(user_ids)
+    stored = MemberBalance.objects.all()
+    if user_ids is not None:
+        stored = stored.filter(user_id__in=user_ids)
+    stored = {row["user_id"]: row for row in stored.values("user_id", *BALANCE_FIELDS)}
+
+    mismatches = []
+    for user_id in sorted(set(expected) | set(stored)):
+        expected_values = expected.get(user_id, {})
+        stored_values = stored.get(user_id, {})
+        for field in BALANCE_FIELDS:
+            expected_value = expected_values.get(field, 0)
+            stored_value = stored_values.get(field, 0)
+            if expected_value != stored_value:
+                mismatches.append((user_id, field, stored_value, expected_value))
+    return mismatches
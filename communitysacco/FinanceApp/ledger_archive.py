@@ -0,0 +1,336 @@
+import hashlib
+import heapq
+import threading
+import time as time_module
+from datetime import date, datetime, time, timedelta
+
+from django.apps.registry import Apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, models, router, transaction as db_transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import LedgerPartition, PaymentJob, ProcessedCallback, SearchEntry, Transaction
+from .pagination import DEFAULT_PAGE_SIZE, cut_page, decode_cursor, seek
+
+
+# Transaction's columns, which archive tables share and checksums cover.
+LEDGER_FIELDS = [field.attname for field in Transaction._meta.concrete_fields]
+CHECKSUM_MODULUS = 2**64
+
+READ_ONLY_SQL = {
+    "sqlite": [
+        'CREATE TRIGGER "{table}_no_update" BEFORE UPDATE ON "{table}" '
+        "BEGIN SELECT RAISE(ABORT, 'archived transactions are read-only'); END",
+        'CREATE TRIGGER "{table}_no_delete" BEFORE DELETE ON "{table}" '
+        "BEGIN SELECT RAISE(ABORT, 'archived transactions are read-only'); END",
+    ],
+    "postgresql": [
+        "CREATE OR REPLACE FUNCTION ledger_archive_read_only() RETURNS trigger AS $$ "
+        "BEGIN RAISE EXCEPTION 'archived transactions are read-only'; END $$ LANGUAGE plpgsql",
+        'CREATE TRIGGER "{table}_read_only" BEFORE UPDATE OR DELETE ON "{table}" '
+        "FOR EACH ROW EXECUTE FUNCTION ledger_archive_read_only()",
+    ],
+}
+
+# Archive tables are created at runtime, one per month, so their models live in a registry of
+# their own where migrations never see them.
+partition_apps = Apps()
+_partition_models = {}
+_partition_models_lock = threading.Lock()
+
+
+class ArchiveMismatch(Exception):
+    """Rows read back from an archive table differ from the rows they were copied from."""
+
+
+class ArchivedTransaction(models.Model):
+    """
+    A completed transaction in a monthly archive table. The columns are Transaction's, but
+    ``user_id`` is a plain integer: archived rows are append-only history and must not be
+    cascaded away or block deletes elsewhere.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField()
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TYPE_CHOICES)
+    status = models.CharField(max_length=10, choices=Transaction.STATUS_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    phone_number = models.CharField(max_length=20, blank=True)
+    payment_reference = models.CharField(max_length=120, blank=True)
+    description = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        abstract = True
+
+
+def table_name(month):
+    return f"FinanceApp_ledger_{month:%Y%m}"
+
+
+def partition_model(name):
+    """The model of archive table ``name``, created on first use."""
+    with _partition_models_lock:
+        model = _partition_models.get(name)
+        if model is None:
+            suffix = name.rsplit("_", 1)[-1]
+            meta = type(
+                "Meta",
+                (),
+                {
+                    "app_label": "FinanceApp",
+                    "apps": partition_apps,
+                    "db_table": name,
+                    "indexes": [
+                        models.Index(fields=["user_id", "-created_at", "-id"], name=f"ledger_{suffix}_user_idx"),
+                        models.Index(fields=["payment_reference"], name=f"ledger_{suffix}_ref_idx"),
+                    ],
+                },
+            )
+            model = type(f"ArchivedTransaction{suffix}", (ArchivedTransaction,), {"__module__": __name__, "Meta": meta})
+            _partition_models[name] = model
+        return model
+
+
+def rows(partition):
+    """Queryset over the archived rows of ``partition``."""
+    return partition_model(partition.table_name).objects.all()
+
+
+def month_bounds(month):
+    """``[start, end)`` of ``month`` in the current time zone, as aware datetimes."""
+    following = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return (
+        timezone.make_aware(datetime.combine(month.replace(day=1), time.min)),
+        timezone.make_aware(datetime.combine(following, time.min)),
+    )
+
+
+def archive_cutoff(keep_months=None, now=None):
+    """Start of the oldest month kept live: months before it are closed and may be archived."""
+    if keep_months is None:
+        keep_months = settings.LEDGER_ARCHIVE_AFTER_MONTHS
+    today = timezone.localdate(now)
+    months = today.year * 12 + today.month - 1 - keep_months
+    return month_bounds(date(months // 12, months % 12 + 1, 1))[0]
+
+
+def partitions(start=None, end=None):
+    """Archived months overlapping ``[start, end)``, newest first."""
+    found = LedgerPartition.objects.filter(row_count__gt=0)
+    if start is not None:
+        found = found.filter(ends_at__gt=start)
+    if end is not None:
+        found = found.filter(starts_at__lt=end)
+    return list(found.order_by("-starts_at"))
+
+
+def sources(start=None, end=None):
+    """
+    The querysets holding the ledger between ``start`` and ``end``: ``Transaction`` first, then
+    each archived month overlapping the range, newest first. Callers filter every one the same
+    way, by column (``user_id``, not ``user``), and combine the results.
+    """
+    return [Transaction.objects.all()] + [rows(partition) for partition in partitions(start, end)]
+
+
+def with_usernames(queryset):
+    """Annotate archived rows with the ``user__username`` live rows reach through their foreign key."""
+    return queryset.annotate(
+        **{"user__username": Subquery(User.objects.filter(pk=OuterRef("user_id")).values("username")[:1])}
+    )
+
+
+def recorded_references(references):
+    """The payment ``references`` already on the ledger, live or archived."""
+    recorded = set()
+    for queryset in sources():
+        # The exclude matches the live table's partial unique index condition so SQLite can use it.
+        recorded.update(
+            queryset.exclude(payment_reference="")
+            .filter(payment_reference__in=references)
+            .values_list("payment_reference", flat=True)
+        )
+    return recorded
+
+
+def _position(transaction):
+    return transaction.created_at, transaction.id
+
+
+def ledger_page(cursor=None, page_size=DEFAULT_PAGE_SIZE, **filters):
+    """
+    ``keyset_page`` across the live table and the archive, for ``filters`` on columns.
+
+    Archived months are only read when the live rows do not fill the page, and then only the
+    months that can still hold rows for it, in one ``UNION ALL`` of index seeks.
+    """
+    before = decode_cursor(cursor)[0] if cursor else None
+    page = list(seek(Transaction.objects.filter(**filters), cursor)[: page_size + 1])
+    # Only months ending after the live page's last row and starting by the cursor can change it.
+    after = page[page_size].created_at if len(page) > page_size else None
+    relevant = partitions(start=after, end=before and before + timedelta(microseconds=1))
+    if relevant:
+        # Every archive table has the same columns, so the seek is compiled once and repeated per
+        # table; compiling a queryset per month would cost more than running the index seeks.
+        part = seek(rows(relevant[0]).filter(**filters), cursor).order_by()
+        template, params = part.query.get_compiler(using=part.db).as_sql()
+        quote = connections[part.db].ops.quote_name
+        union = " UNION ALL ".join(
+            template.replace(quote(relevant[0].table_name), quote(partition.table_name)) for partition in relevant
+        )
+        archived = Transaction.objects.db_manager(part.db).raw(
+            f'SELECT * FROM ({union}) AS archived ORDER BY "created_at" DESC, "id" DESC LIMIT %s',
+            [*params * len(relevant), page_size + 1],
+        )
+        page = list(heapq.merge(page, archived, key=_position, reverse=True))[: page_size + 1]
+    return cut_page(page, page_size)
+
+
+def _digest(values):
+    raw = "\x1f".join("" if value is None else str(value) for value in values).encode("utf-8")
+    return int.from_bytes(hashlib.sha256(raw).digest()[:8], "big")
+
+
+def fold(values_rows):
+    """
+    ``(count, total amount, checksum)`` of rows given as ``LEDGER_FIELDS`` tuples.
+
+    The checksum adds up per-row SHA-256 prefixes modulo 2**64, so it does not depend on row
+    order and the checksums of chunks add up to the checksum of the whole month.
+    """
+    amount_index = LEDGER_FIELDS.index("amount")
+    count, total, checksum = 0, 0, 0
+    for values in values_rows:
+        count += 1
+        total += values[amount_index]
+        checksum = (checksum + _digest(values)) % CHECKSUM_MODULUS
+    return count, total, checksum
+
+
+def _combine(stored, checksum):
+    return f"{(int(stored, 16) + checksum) % CHECKSUM_MODULUS:016x}"
+
+
+def ensure_partition(month):
+    """Catalog row and read-only table for ``month``, creating them on first use."""
+    month = month.replace(day=1)
+    starts_at, ends_at = month_bounds(month)
+    partition, _ = LedgerPartition.objects.get_or_create(
+        month=month, defaults={"table_name": table_name(month), "starts_at": starts_at, "ends_at": ends_at}
+    )
+    model = partition_model(partition.table_name)
+    connection = connections[router.db_for_write(model)]
+    if partition.table_name not in connection.introspection.table_names():
+        with connection.schema_editor() as editor:
+            editor.create_model(model)
+            for statement in READ_ONLY_SQL.get(connection.vendor, []):
+                editor.execute(statement.format(table=partition.table_name))
+    return partition
+
+
+def _archive_chunk(partition, ids):
+    """Copy the still-completed rows of ``ids`` into ``partition``, prove the copy and delete the originals."""
+    model = partition_model(partition.table_name)
+    alias = router.db_for_write(Transaction)
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(field.column) for field in Transaction._meta.concrete_fields)
+    live = Transaction.objects.using(alias).filter(status=Transaction.STATUS_COMPLETED)
+
+    with db_transaction.atomic(using=alias):
+        moving = list(live.select_for_update().filter(id__in=ids).values_list("id", flat=True))
+        if not moving:
+            return 0
+        placeholders = ", ".join(["%s"] * len(moving))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(partition.table_name)} ({columns}) SELECT {columns} "
+                f"FROM {quote(Transaction._meta.db_table)} WHERE id IN ({placeholders}) AND status = %s",
+                [*moving, Transaction.STATUS_COMPLETED],
+            )
+        source = fold(live.filter(id__in=moving).values_list(*LEDGER_FIELDS))
+        copied = fold(model.objects.using(alias).filter(id__in=moving).values_list(*LEDGER_FIELDS))
+        if source != copied:
+            raise ArchiveMismatch(f"{partition.table_name}: copied {copied} but the live rows hold {source}.")
+
+        # Finished payment jobs go with their transaction; callbacks keep their row for replay
+        # protection but stop pointing at it, and staff search covers live rows only.
+        PaymentJob.objects.using(alias).filter(transaction_id__in=moving).delete()
+        ProcessedCallback.objects.using(alias).filter(transaction_id__in=moving).update(transaction=None)
+        SearchEntry.objects.using(alias).filter(kind=SearchEntry.KIND_TRANSACTION, object_id__in=moving).delete()
+        with connection.cursor() as cursor:
+            # Deleted without signals on purpose: the money has not moved, so balances and rollups stay.
+            cursor.execute(
+                f"DELETE FROM {quote(Transaction._meta.db_table)} WHERE id IN ({placeholders}) AND status = %s",
+                [*moving, Transaction.STATUS_COMPLETED],
+            )
+            if cursor.rowcount != copied[0]:
+                raise ArchiveMismatch(f"{partition.table_name}: deleted {cursor.rowcount} live rows, copied {copied[0]}.")
+
+        partition = LedgerPartition.objects.using(alias).select_for_update().get(pk=partition.pk)
+        partition.row_count += copied[0]
+        partition.total_amount += copied[1]
+        partition.checksum = _combine(partition.checksum, copied[2])
+        partition.save(update_fields=["row_count", "total_amount", "checksum", "updated_at"])
+    return copied[0]
+
+
+def archive_month(month, chunk_size=None, pause=0):
+    """Move the completed transactions of ``month`` into its archive table. Returns the rows moved."""
+    chunk_size = chunk_size or settings.LEDGER_ARCHIVE_CHUNK_SIZE
+    partition = ensure_partition(month)
+    completed = Transaction.objects.filter(
+        status=Transaction.STATUS_COMPLETED, created_at__gte=partition.starts_at, created_at__lt=partition.ends_at
+    ).order_by("created_at", "id")
+    moved = 0
+    while True:
+        ids = list(completed.values_list("id", flat=True)[:chunk_size])
+        if not ids:
+            return moved
+        moved += _archive_chunk(partition, ids)
+        if pause:
+            # Leave a gap for the web workers' writes between chunks.
+            time_module.sleep(pause)
+
+
+def archive(cutoff=None, chunk_size=None, pause=0):
+    """
+    Archive every closed month before ``cutoff`` (default ``archive_cutoff()``), oldest first.
+
+    Runs online: each chunk is its own short transaction, only completed rows move, and a run
+    can stop at any point and resume later. Yields ``(partition, rows moved)`` per month.
+    """
+    cutoff = cutoff or archive_cutoff()
+    completed = Transaction.objects.filter(status=Transaction.STATUS_COMPLETED, created_at__lt=cutoff)
+    since = None
+    while True:
+        pending = completed if since is None else completed.filter(created_at__gte=since)
+        oldest = pending.order_by("created_at").values_list("created_at", flat=True).first()
+        if oldest is None:
+            return
+        month = timezone.localtime(oldest).date().replace(day=1)
+        moved = archive_month(month, chunk_size, pause)
+        partition = LedgerPartition.objects.get(month=month)
+        since = partition.ends_at
+        yield partition, moved
+
+
+def verify_partition(partition):
+    """
+    Re-read ``partition`` and compare it with its catalog row.
+
+    Returns a list of ``(field, stored, actual)`` tuples; empty when every archived row is there
+    unchanged, in which case ``verified_at`` is stamped.
+    """
+    actual = fold(rows(partition).order_by().values_list(*LEDGER_FIELDS).iterator(chunk_size=5000))
+    actual = {"row_count": actual[0], "total_amount": actual[1], "checksum": f"{actual[2]:016x}"}
+    mismatches = [
+        (field, getattr(partition, field), value) for field, value in actual.items() if getattr(partition, field) != value
+    ]
+    if not mismatches:
+        partition.verified_at = timezone.now()
+        partition.save(update_fields=["verified_at"])
+    return mismatches
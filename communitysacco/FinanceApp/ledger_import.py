@@ -0,0 +1,194 @@
+import csv
+import json
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .forms import LoanRequestForm, SavingsRecordForm
+from .ledger_archive import recorded_references
+from .models import LedgerImport, LoanRequest, SavingsRecord, Transaction, apply_tracked_changes
+from .search import index_instances
+from .trends import hold_refresh
+
+
+class ImportSpec:
+    """
+    How rows of one kind are validated and turned into model instances.
+
+    Each column is checked with the field from the app's ``ModelForm`` where one
+    exists, otherwise with the model field's own form field, so imported rows
+    follow the same rules as rows entered through the site. The fields are
+    built once and reused; no form instance is created per row.
+    """
+
+    # Small, highly repetitive columns whose cleaned values are cached by raw text.
+    MEMO_FIELDS = {"transaction_type", "status", "amount", "created_at"}
+    MEMO_LIMIT = 50_000
+
+    def __init__(self, model, columns, form_class=None):
+        self.model = model
+        form_fields = form_class.base_fields if form_class else {}
+        self.fields = {name: form_fields.get(name) or model._meta.get_field(name).formfield() for name in columns}
+        self.fields["created_at"] = model._meta.get_field("created_at").formfield(required=True)
+        self.defaults = {
+            name: model._meta.get_field(name).get_default()
+            for name in columns
+            if model._meta.get_field(name).has_default()
+        }
+        self._memo = {name: {} for name in self.fields if name in self.MEMO_FIELDS}
+
+    def clean(self, row):
+        """Return ``(values, errors)`` for one input row (a dict of strings)."""
+        values = {}
+        errors = {}
+        for name, field in self.fields.items():
+            raw = row.get(name)
+            if raw is None or raw == "":
+                if name in self.defaults:
+                    values[name] = self.defaults[name]
+                    continue
+                raw = ""
+            elif not isinstance(raw, str):
+                raw = str(raw)
+
+            memo = self._memo.get(name)
+            if memo is not None and raw in memo:
+                values[name] = memo[raw]
+                continue
+            try:
+                value = field.clean(raw)
+            except ValidationError as exc:
+                errors[name] = " ".join(exc.messages)
+                continue
+            if memo is not None:
+                if len(memo) >= self.MEMO_LIMIT:
+                    memo.clear()
+                memo[raw] = value
+            values[name] = value
+
+        if "amount" in values and values["amount"] is not None and values["amount"] <= Decimal("0"):
+            errors["amount"] = "Amount must be greater than zero."
+        return values, errors
+
+
+IMPORT_SPECS = {
+    LedgerImport.KIND_SAVINGS: ImportSpec(SavingsRecord, ["amount", "notes"], SavingsRecordForm),
+    LedgerImport.KIND_TRANSACTIONS: ImportSpec(
+        Transaction, ["transaction_type", "status", "amount", "phone_number", "payment_reference", "description"]
+    ),
+    LedgerImport.KIND_LOANS: ImportSpec(
+        LoanRequest, ["name", "id_number", "amount", "purpose", "status", "admin_comment"], LoanRequestForm
+    ),
+}
+
+
+def read_rows(stream, fmt):
+    """Yield each input row as a dict from a CSV (with a header) or JSONL text stream."""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            row = {"_raw": line}
+        yield row if isinstance(row, dict) else {"_raw": line}
+
+
+def import_ledger(rows, kind, source, chunk_size=5000, rejects=None, progress=None):
+    """
+    Validate and insert legacy ledger rows, resuming where an earlier run stopped.
+
+    ``rows`` is an iterable of dicts with a ``username`` column plus the
+    columns of ``kind``. Rows are inserted with one ``bulk_create`` per chunk.
+    Each chunk's insert, its ledger/analytics deltas and the ``LedgerImport``
+    checkpoint for ``source`` commit together, so a rerun skips exactly the
+    rows already committed. Rejected rows are written to ``rejects`` (a text
+    stream) as JSON lines with their errors. Returns the ``LedgerImport``.
+    """
+    spec = IMPORT_SPECS[kind]
+    record, _ = LedgerImport.objects.get_or_create(source=source, defaults={"kind": kind})
+    if record.kind != kind:
+        raise ValueError(f"{source} was imported as {record.kind}, not {kind}.")
+    if record.completed_at:
+        return record
+
+    user_ids = dict(User.objects.values_list("username", "id"))
+    rows = islice(iter(rows), record.rows_read, None)
+    line_number = record.rows_read
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        instances, rejected = _build_chunk(spec, chunk, line_number, user_ids)
+        with db_transaction.atomic():
+            if spec.model is Transaction:
+                hold_refresh()
+            created = spec.model.objects.bulk_create(instances)
+            apply_tracked_changes(spec.model, [(None, instance.tracked_state()) for instance in created])
+            if spec.model in (LoanRequest, Transaction):
+                index_instances(spec.model, created)
+            LedgerImport.objects.filter(pk=record.pk).update(
+                rows_read=F("rows_read") + len(chunk),
+                rows_imported=F("rows_imported") + len(created),
+                rows_rejected=F("rows_rejected") + len(rejected),
+                updated_at=timezone.now(),
+            )
+        line_number += len(chunk)
+        if rejects is not None:
+            for reject in rejected:
+                rejects.write(json.dumps(reject, default=str) + "\n")
+            rejects.flush()
+        if progress is not None:
+            progress(line_number)
+
+    LedgerImport.objects.filter(pk=record.pk).update(completed_at=timezone.now(), updated_at=timezone.now())
+    record.refresh_from_db()
+    return record
+
+
+def _build_chunk(spec, chunk, first_row, user_ids):
+    accepted = []
+    rejected = []
+    references = set()
+    for row_number, row in enumerate(chunk, start=first_row + 1):
+        values, errors = spec.clean(row)
+        user_id = user_ids.get(str(row.get("username") or "").strip())
+        if user_id is None:
+            errors["username"] = "Unknown member."
+        reference = values.get("payment_reference")
+        if reference:
+            if reference in references:
+                errors["payment_reference"] = "Duplicate payment reference."
+            references.add(reference)
+        if errors:
+            rejected.append({"row": row_number, "errors": errors, "data": row})
+        else:
+            accepted.append((row_number, row, user_id, values))
+
+    if references:
+        # payment_reference is unique across the ledger, archived months included; one lookup per
+        # chunk keeps bulk_create from failing.
+        existing = recorded_references(references)
+        if existing:
+            for row_number, row, _, values in accepted:
+                if values["payment_reference"] in existing:
+                    rejected.append(
+                        {"row": row_number, "errors": {"payment_reference": "Payment reference already recorded."}, "data": row}
+                    )
+            accepted = [entry for entry in accepted if entry[3]["payment_reference"] not in existing]
+
+    instances = []
+    for _, _, user_id, values in accepted:
+        instance = spec.model(user_id=user_id, **values)
+        instance.backdated = True
+        instances.append(instance)
+    return instances, rejected
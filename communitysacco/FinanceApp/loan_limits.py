@@ -0,0 +1,143 @@
+from collections import Counter
+from decimal import ROUND_DOWN, Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction as db_transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import member_summary
+from .models import MemberBalance, RepaymentInstalment, SavingsRecord, Transaction, UserLoanLimit
+
+
+ZERO = Decimal("0")
+
+
+def compute_limit(total_saved, outstanding, instalments_due, paid_on_time):
+    """
+    A member's limit: savings times ``LOAN_LIMIT_SAVINGS_MULTIPLE``, scaled by the share
+    of due instalments paid on time, less what they still owe. Never below zero.
+    """
+    punctuality = Decimal(paid_on_time) / instalments_due if instalments_due else Decimal(1)
+    limit = total_saved * Decimal(str(settings.LOAN_LIMIT_SAVINGS_MULTIPLE)) * punctuality - outstanding
+    return max(limit, ZERO).quantize(Decimal("1"), rounding=ROUND_DOWN)
+
+
+def _score_inputs(user_ids, today):
+    """``{user_id: (total_saved, outstanding, instalments_due, paid_on_time)}`` from grouped aggregates."""
+    inputs = {user_id: [ZERO, ZERO, 0, 0] for user_id in user_ids}
+    for user_id, saved, outstanding in MemberBalance.objects.filter(user_id__in=user_ids).values_list(
+        "user_id", "total_saved", "outstanding"
+    ):
+        inputs[user_id][:2] = saved, outstanding
+    for user_id, due, on_time in (
+        RepaymentInstalment.objects.filter(loan__user_id__in=user_ids, due_date__lt=today)
+        .order_by()
+        .values("loan__user_id")
+        .annotate(
+            due=Count("id"),
+            on_time=Count("id", filter=Q(paid_at__isnull=False, paid_at__date__lte=F("due_date"))),
+        )
+        .values_list("loan__user_id", "due", "on_time")
+    ):
+        inputs[user_id][2:] = due, on_time
+    return inputs
+
+
+def score_limits(user_ids):
+    """
+    Score ``user_ids`` and store their limits with one upsert.
+
+    Members with an admin-set limit are skipped. Every limit row is locked before the inputs are
+    read, so an admin setting a limit or a write marking the member stale mid-run waits for the
+    scores instead of being overwritten by them. Returns the number scored.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return 0
+    now = timezone.now()
+    with db_transaction.atomic():
+        UserLoanLimit.objects.bulk_create(
+            [UserLoanLimit(user_id=user_id) for user_id in sorted(user_ids)], ignore_conflicts=True
+        )
+        manual = {
+            user_id
+            for user_id, is_manual in UserLoanLimit.objects.select_for_update()
+            .filter(user_id__in=user_ids)
+            .order_by("user_id")
+            .values_list("user_id", "is_manual")
+            if is_manual
+        }
+        inputs = _score_inputs(user_ids - manual, timezone.localdate())
+        UserLoanLimit.objects.bulk_create(
+            [
+                UserLoanLimit(user_id=user_id, amount=compute_limit(*values), needs_scoring=False, scored_at=now)
+                for user_id, values in inputs.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["user"],
+            update_fields=["amount", "needs_scoring", "scored_at", "updated_at"],
+        )
+        member_summary.invalidate(inputs)
+    return len(inputs)
+
+
+def score_stale(chunk_size=5000):
+    """Re-score only members whose ledger changed since their last score. Returns a ``Counter``."""
+    stats = Counter(scored=0)
+    while True:
+        user_ids = list(
+            UserLoanLimit.objects.filter(needs_scoring=True, is_manual=False)
+            .order_by("user_id")
+            .values_list("user_id", flat=True)[:chunk_size]
+        )
+        if not user_ids:
+            return stats
+        stats["scored"] += score_limits(user_ids)
+
+
+def score_all(chunk_size=5000):
+    """Score every member, ``chunk_size`` at a time. Returns a ``Counter``."""
+    stats = Counter(scored=0)
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:chunk_size])
+        if not user_ids:
+            return stats
+        last_id = user_ids[-1]
+        stats["scored"] += score_limits(user_ids)
+
+
+def mark_stale(user_ids, chunk_size=5000):
+    """Flag members for the next incremental scoring run, creating limit rows where missing."""
+    user_ids = sorted(set(user_ids))
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start : start + chunk_size]
+        updated = UserLoanLimit.objects.filter(user_id__in=chunk, needs_scoring=False, is_manual=False).update(
+            needs_scoring=True
+        )
+        if updated < len(chunk):
+            UserLoanLimit.objects.bulk_create([UserLoanLimit(user_id=user_id) for user_id in chunk], ignore_conflicts=True)
+
+
+def apply_changes(model, changes):
+    """Mark members stale when savings or transactions that feed their balance change."""
+    if model not in (SavingsRecord, Transaction):
+        return
+    mark_stale({state["user"] for pair in changes for state in pair if state})
+
+
+def cached_limit(user):
+    """
+    The member's stored limit, read with a single unique-index lookup.
+
+    Members who have never been scored are scored now, once. Returns ``None``
+    when no limit applies.
+    """
+    stored = UserLoanLimit.objects.filter(user=user).values_list("amount", "scored_at", "is_manual")
+    row = stored.first()
+    if row is None or (row[1] is None and not row[2]):
+        score_limits([user.id])
+        row = stored.first()
+    return row[0]
@@ -0,0 +1,64 @@
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from . import search
+from .amortization import create_schedules
+from .models import LoanRequest, Transaction, apply_tracked_changes
+
+
+REVIEW_DECISIONS = (LoanRequest.STATUS_APPROVED, LoanRequest.STATUS_REJECTED)
+
+
+def review_loans(loan_ids, decision, reviewer, comment=""):
+    """
+    Approve or reject many pending loan requests in one transaction.
+
+    The pending requests are locked with ``select_for_update`` and moved to
+    ``decision`` with a single ``UPDATE``; approvals get their disbursement
+    transactions from one ``bulk_create`` and their repayment schedules from
+    ``create_schedules``. Requests that are no longer pending,
+    or that belong to ``reviewer``, are left untouched. Returns
+    ``(reviewed, skipped)`` counts.
+    """
+    if decision not in REVIEW_DECISIONS:
+        raise ValueError(f"Unknown loan review decision: {decision!r}")
+    loan_ids = {int(loan_id) for loan_id in loan_ids}
+    tracked_fields = LoanRequest.tracked_fields
+
+    with db_transaction.atomic():
+        states = list(
+            LoanRequest.objects.select_for_update()
+            .filter(id__in=loan_ids, status=LoanRequest.STATUS_PENDING)
+            .exclude(user_id=reviewer.id)
+            .values("id", "name", *tracked_fields)
+        )
+        if not states:
+            return 0, len(loan_ids)
+
+        LoanRequest.objects.filter(id__in=[state["id"] for state in states]).update(
+            status=decision, admin_comment=comment, reviewed_by=reviewer, reviewed_at=timezone.now()
+        )
+        loan_changes = []
+        for state in states:
+            previous = {field: state[field] for field in tracked_fields}
+            loan_changes.append((previous, dict(previous, status=decision)))
+        apply_tracked_changes(LoanRequest, loan_changes)
+        search.reindex(LoanRequest, [state["id"] for state in states])
+
+        if decision == LoanRequest.STATUS_APPROVED:
+            disbursements = Transaction.objects.bulk_create(
+                [
+                    Transaction(
+                        user_id=state["user"],
+                        transaction_type=Transaction.TYPE_LOAN_DISBURSEMENT,
+                        status=Transaction.STATUS_COMPLETED,
+                        amount=state["amount"],
+                        description=f"Approved loan: {state['name']}",
+                    )
+                    for state in states
+                ]
+            )
+            apply_tracked_changes(Transaction, [(None, disbursement.tracked_state()) for disbursement in disbursements])
+            create_schedules([state["id"] for state in states])
+
+    return len(states), len(loan_ids) - len(states)
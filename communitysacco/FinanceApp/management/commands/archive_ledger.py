@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from FinanceApp.ledger_archive import archive, archive_cutoff, partitions, verify_partition
+
+
+class Command(BaseCommand):
+    help = (
+        "Move completed transactions of closed months into read-only monthly archive tables, then "
+        "re-read each table and check it against its recorded count, total and checksum. Runs online "
+        "in short per-chunk transactions and can be stopped and resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-months", type=int, help="Whole months kept live (default LEDGER_ARCHIVE_AFTER_MONTHS).")
+        parser.add_argument("--chunk-size", type=int, help="Rows moved per transaction (default LEDGER_ARCHIVE_CHUNK_SIZE).")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks.")
+        parser.add_argument("--verify", action="store_true", help="Only verify every archived month.")
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            checked = partitions()
+        else:
+            cutoff = archive_cutoff(options["keep_months"])
+            self.stdout.write(f"Archiving completed transactions before {cutoff:%Y-%m-%d}.")
+            checked = []
+            for partition, moved in archive(cutoff, options["chunk_size"], options["pause"]):
+                self.stdout.write(f"{partition.month:%Y-%m}: moved {moved}, {partition.row_count} archived.")
+                checked.append(partition)
+
+        failed = 0
+        for partition in checked:
+            mismatches = verify_partition(partition)
+            for field, stored, actual in mismatches:
+                self.stderr.write(f"{partition.month:%Y-%m} {field}: recorded {stored}, table holds {actual}")
+            failed += bool(mismatches)
+        if failed:
+            raise CommandError(f"{failed} archived months do not match their checksums.")
+        self.stdout.write(self.style.SUCCESS(f"{len(checked)} archived months verified."))
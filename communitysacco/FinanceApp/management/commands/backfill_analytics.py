@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from FinanceApp.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the analytics dashboard rollups from the transaction and loan request tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} analytics rollup rows."))
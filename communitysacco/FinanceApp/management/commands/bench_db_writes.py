@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.db import transaction as db_transaction
+from django.db.models import F
+
+from communitysacco.databases import sqlite_database
+from FinanceApp.models import MemberBalance, Transaction
+
+
+def _write_payments(args):
+    """Run ``count`` callback-shaped write transactions in a worker process. Returns ``(timings, failures)``."""
+    alias, user_ids, offset, count = args
+    timings, failures = [], []
+    try:
+        for index in range(offset, offset + count):
+            user_id = user_ids[index % len(user_ids)]
+            started = time.perf_counter()
+            try:
+                with db_transaction.atomic(using=alias):
+                    MemberBalance.objects.using(alias).filter(user_id=user_id).exists()
+                    Transaction.objects.using(alias).bulk_create(
+                        [Transaction(user_id=user_id, transaction_type=Transaction.TYPE_DEPOSIT, amount=100)]
+                    )
+                    MemberBalance.objects.using(alias).filter(user_id=user_id).update(pending_count=F("pending_count") + 1)
+            except OperationalError as error:
+                failures.append(str(error))
+                continue
+            timings.append(time.perf_counter() - started)
+    finally:
+        connections.close_all()
+    return timings, failures
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent write throughput for each database profile. Worker processes each run "
+        "callback-shaped transactions (read the member's balance, insert a payment, bump the balance) "
+        "against scratch SQLite databases with Django's stock settings and with the WAL profile, and "
+        "against the configured PostgreSQL database when that profile is active. Benchmark rows are "
+        "removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent writer processes.")
+        parser.add_argument("--writes", type=int, default=250, help="Transactions per worker.")
+        parser.add_argument("--members", type=int, default=100)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as scratch:
+            template = Path(scratch) / "template.sqlite3"
+            # The data migrations write through the default alias, so the scratch schema is
+            # migrated by a separate process whose default database is the scratch file.
+            subprocess.run(
+                [sys.executable, str(settings.BASE_DIR / "manage.py"), "migrate", "-v0"],
+                env=os.environ | {
+                    "DJANGO_SETTINGS_MODULE": "communitysacco.settings",
+                    "DATABASE_ENGINE": "sqlite",
+                    "SQLITE_PATH": str(template),
+                },
+                check=True,
+            )
+
+            for name, tuned in (("sqlite-stock", False), ("sqlite-wal", True)):
+                path = Path(scratch) / f"{name}.sqlite3"
+                shutil.copy(template, path)
+                with closing(sqlite3.connect(path)) as scratch_db:
+                    # WAL is stored in the file, so the stock copy is put back on the rollback journal.
+                    scratch_db.execute(f"PRAGMA journal_mode={'WAL' if tuned else 'DELETE'}")
+                self._register(name, sqlite_database(path, tuned=tuned))
+                self._report(name, self._run(name, options))
+                connections[name].close()
+
+        if connections["default"].vendor == "postgresql":
+            self._register("postgres", connections.settings["default"])
+            self._report("postgres", self._run("postgres", options))
+            connections["postgres"].close()
+
+    def _register(self, alias, database):
+        connections.settings[alias] = connections.configure_settings({"default": dict(database)})["default"]
+
+    def _run(self, alias, options):
+        users = User.objects.db_manager(alias).bulk_create(
+            [User(username=f"bench-writes-{index}") for index in range(options["members"])]
+        )
+        user_ids = [user.pk for user in users]
+        MemberBalance.objects.using(alias).bulk_create([MemberBalance(user_id=user_id) for user_id in user_ids])
+        # Workers are forked like web/queue worker processes; they must not inherit open connections or pools.
+        connections.close_all()
+        if hasattr(connections[alias], "close_pool"):
+            connections[alias].close_pool()
+
+        started = time.perf_counter()
+        try:
+            with ProcessPoolExecutor(options["workers"], mp_context=multiprocessing.get_context("fork")) as pool:
+                results = list(
+                    pool.map(
+                        _write_payments,
+                        [(alias, user_ids, worker * options["writes"], options["writes"]) for worker in range(options["workers"])],
+                    )
+                )
+            elapsed = time.perf_counter() - started
+        finally:
+            User.objects.using(alias).filter(id__in=user_ids).delete()
+        timings = [timing for worker_timings, _ in results for timing in worker_timings]
+        failures = [failure for _, worker_failures in results for failure in worker_failures]
+        return timings, failures, elapsed
+
+    def _report(self, name, result):
+        timings, failures, elapsed = result
+        p95 = statistics.quantiles(timings, n=100)[94] * 1000 if len(timings) > 1 else 0
+        self.stdout.write(
+            f"{name:>12}: {len(timings) / elapsed:.0f} commits/s, p95 {p95:.1f} ms, "
+            f"{len(failures)} failed" + (f" ({failures[0]})" if failures else "")
+        )
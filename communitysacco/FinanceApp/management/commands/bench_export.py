@@ -0,0 +1,97 @@
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from FinanceApp.exports import LEDGER_COLUMNS, iter_transaction_csv
+from FinanceApp.models import Transaction
+
+
+class _Rollback(Exception):
+    pass
+
+
+def current_rss_mb():
+    """Resident set size of this process in MiB, or ``None`` where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a large ledger and stream it through the CSV export, recording rows per second "
+        "and how far resident memory grows. All seeded rows are rolled back when the benchmark finishes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5_000_000)
+        parser.add_argument("--members", type=int, default=1000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument(
+            "--max-rss-growth",
+            type=float,
+            default=64.0,
+            help="Fail if resident memory grows by more than this many MiB while exporting.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        rows = options["rows"]
+        batch_size = options["batch_size"]
+        members = User.objects.bulk_create(
+            [User(username=f"bench-export-member-{index}") for index in range(options["members"])]
+        )
+
+        seed_started = time.perf_counter()
+        for start in range(0, rows, batch_size):
+            Transaction.objects.bulk_create(
+                [
+                    Transaction(
+                        user=members[index % len(members)],
+                        transaction_type=Transaction.TYPE_DEPOSIT,
+                        amount=100,
+                        description="Benchmark deposit",
+                    )
+                    for index in range(start, min(start + batch_size, rows))
+                ],
+                batch_size=batch_size,
+            )
+        self.stdout.write(f"Seeded {rows} transactions in {time.perf_counter() - seed_started:.1f}s")
+
+        rss_before = current_rss_mb()
+        peak_rss = rss_before
+        exported = -1  # the header line is not a row
+        size = 0
+        started = time.perf_counter()
+        for line in iter_transaction_csv(Transaction.objects.all(), columns=LEDGER_COLUMNS):
+            exported += 1
+            size += len(line)
+            if rss_before is not None and not exported % 100_000:
+                peak_rss = max(peak_rss, current_rss_mb())
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"Exported {exported} rows ({size / 2**20:.0f} MiB of CSV) in {elapsed:.1f}s "
+            f"({exported / elapsed:.0f} rows/s)"
+        )
+        if rss_before is None:
+            self.stdout.write("Resident memory is not available on this platform.")
+            return
+        growth = peak_rss - rss_before
+        self.stdout.write(f"Resident memory: {rss_before:.0f} MiB before, {peak_rss:.0f} MiB peak (+{growth:.1f} MiB)")
+        if growth > options["max_rss_growth"]:
+            raise CommandError(f"Export grew resident memory by {growth:.1f} MiB (limit {options['max_rss_growth']} MiB).")
+        self.stdout.write(self.style.SUCCESS("Export memory stayed flat."))
@@ -0,0 +1,83 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from FinanceApp.loan_review import review_loans
+from FinanceApp.models import LoanRequest, Transaction
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare approving many pending loan requests one at a time (the old per-POST loop) "
+        "with review_loans. All seeded rows are rolled back when the benchmark finishes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loans", type=int, default=500)
+        parser.add_argument("--members", type=int, default=100)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        reviewer = User.objects.create(username="bench-loan-reviewer", is_staff=True)
+        members = User.objects.bulk_create(
+            [User(username=f"bench-loan-member-{index}") for index in range(options["members"])]
+        )
+
+        loop_ids = self._seed(members, options["loans"])
+        started = time.perf_counter()
+        for loan_id in loop_ids:
+            self._approve_one(loan_id, reviewer)
+        loop_elapsed = time.perf_counter() - started
+
+        bulk_ids = self._seed(members, options["loans"])
+        started = time.perf_counter()
+        reviewed, _ = review_loans(bulk_ids, LoanRequest.STATUS_APPROVED, reviewer, "Bulk approval")
+        bulk_elapsed = time.perf_counter() - started
+
+        for label, count, elapsed in [("per-loan", len(loop_ids), loop_elapsed), ("bulk", reviewed, bulk_elapsed)]:
+            self.stdout.write(f"{label:>8}: {count} loans in {elapsed:.2f}s ({count / elapsed:.0f} loans/s)")
+        self.stdout.write(self.style.SUCCESS(f"Bulk review is {loop_elapsed / bulk_elapsed:.1f}x faster."))
+
+    def _seed(self, members, count):
+        loans = LoanRequest.objects.bulk_create(
+            [
+                LoanRequest(
+                    user=members[index % len(members)],
+                    name="Benchmark member",
+                    id_number=str(index),
+                    document="loan_documents/benchmark.pdf",
+                    amount=1000,
+                )
+                for index in range(count)
+            ]
+        )
+        return [loan.id for loan in loans]
+
+    def _approve_one(self, loan_id, reviewer):
+        loan_request = LoanRequest.objects.get(id=loan_id)
+        loan_request.status = LoanRequest.STATUS_APPROVED
+        loan_request.admin_comment = "Per-loan approval"
+        loan_request.reviewed_by = reviewer
+        loan_request.reviewed_at = timezone.now()
+        loan_request.save()
+        Transaction.objects.create(
+            user=loan_request.user,
+            transaction_type=Transaction.TYPE_LOAN_DISBURSEMENT,
+            status=Transaction.STATUS_COMPLETED,
+            amount=loan_request.amount,
+            description=f"Approved loan: {loan_request.name}",
+        )
@@ -0,0 +1,131 @@
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+
+PHASES = {
+    "baseline": {"SESSION_ENGINE": "django.contrib.sessions.backends.db", "AUTH_USER_CACHE_SECONDS": 0},
+    "cached": {"SESSION_ENGINE": "django.contrib.sessions.backends.cached_db", "AUTH_USER_CACHE_SECONDS": 60},
+}
+PAGES = ("home", "savings", "loans", "transactions")
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _CountingApp:
+    """Wrap the WSGI handler to record how many queries each request ran."""
+
+    def __init__(self):
+        self.handler = WSGIHandler()
+        self.counts = []
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = self.handler(environ, start_response)
+        with self.lock:
+            self.counts.append(queries)
+        return response
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the member pages from a local threaded server and load them concurrently, once with "
+        "database sessions and uncached user lookups and once with cached sessions and the cached "
+        "auth backend. Reports queries per request and p50/p95 latency for each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", help="Existing member to browse as. Defaults to a temporary member.")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=16)
+
+    def handle(self, *args, **options):
+        temporary = None
+        if options["username"]:
+            member = User.objects.filter(username=options["username"]).first()
+            if member is None:
+                raise CommandError(f"No user named {options['username']!r}.")
+        else:
+            member = temporary = User.objects.create_user(username="bench-requests-member")
+        try:
+            results = {name: self._run_phase(member, overrides, options) for name, overrides in PHASES.items()}
+        finally:
+            if temporary is not None:
+                temporary.delete()
+
+        for name, (queries, p50, p95, throughput) in results.items():
+            self.stdout.write(
+                f"{name:>8}: {queries:.2f} queries/request, p50 {p50 * 1000:.1f} ms, "
+                f"p95 {p95 * 1000:.1f} ms, {throughput:.0f} requests/s"
+            )
+        baseline, cached = results["baseline"], results["cached"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Cached sessions and users saved {baseline[0] - cached[0]:.2f} queries per request; "
+                f"p95 {baseline[2] * 1000:.1f} -> {cached[2] * 1000:.1f} ms."
+            )
+        )
+
+    def _run_phase(self, member, overrides, options):
+        with override_settings(**overrides):
+            cache.clear()
+            client = Client()
+            client.force_login(member)
+            cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+            app = _CountingApp()
+            server = ThreadedWSGIServer(("127.0.0.1", 0), _QuietHandler, allow_reuse_address=False)
+            server.set_app(app)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            base = f"http://127.0.0.1:{server.server_port}"
+            urls = [base + reverse(page) for page in PAGES]
+
+            def fetch(index):
+                request = urllib.request.Request(urls[index % len(urls)], headers={"Cookie": cookie})
+                started = time.perf_counter()
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    if response.url != request.full_url:
+                        raise CommandError(f"{request.full_url} redirected to {response.url}; the session was not accepted.")
+                return time.perf_counter() - started
+
+            try:
+                # One pass over every page first, so the cached phase is measured warm.
+                for index in range(len(urls)):
+                    fetch(index)
+                app.counts.clear()
+                started = time.perf_counter()
+                with ThreadPoolExecutor(options["concurrency"]) as pool:
+                    timings = list(pool.map(fetch, range(options["requests"])))
+                elapsed = time.perf_counter() - started
+            finally:
+                server.shutdown()
+                server.server_close()
+                client.logout()
+
+        percentiles = statistics.quantiles(timings, n=100)
+        return statistics.mean(app.counts), percentiles[49], percentiles[94], len(timings) / elapsed
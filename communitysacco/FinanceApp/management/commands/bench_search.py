@@ -0,0 +1,108 @@
+import random
+import statistics
+import string
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from django.db.models import Q
+
+from FinanceApp.models import LoanRequest, SearchEntry, Transaction
+from FinanceApp.search import BATCH_SIZE, phone_terms, rebuild_index, search, words
+
+# Synthetic entries get object IDs from here up so they can be removed afterwards.
+SYNTHETIC_ID_OFFSET = 10**12
+NAMES = (
+    "wanjiru kamau otieno achieng mwangi njeri kiprop chebet mutua wambui ochieng akinyi "
+    "kariuki nyambura omondi atieno kibet jepkosgei muthoni onyango"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Time staff search typeahead against the search index and the icontains scans it replaces. "
+        "Use --synthetic to pad the index with generated entries first; they are removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--synthetic", type=int, default=0, help="Generated entries to add to the index.")
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        if not SearchEntry.objects.exists():
+            started = time.perf_counter()
+            written = rebuild_index()
+            self.stdout.write(f"Indexed {sum(written.values())} entries in {time.perf_counter() - started:.1f}s.")
+        try:
+            if options["synthetic"]:
+                started = time.perf_counter()
+                self._add_synthetic(rng, options["synthetic"])
+                self.stdout.write(f"Added {options['synthetic']} synthetic entries in {time.perf_counter() - started:.1f}s.")
+            self.stdout.write(f"Index holds {SearchEntry.objects.count()} entries.")
+            self._compare(rng, options["queries"])
+        finally:
+            SearchEntry.objects.filter(object_id__gte=SYNTHETIC_ID_OFFSET).delete()
+
+    def _add_synthetic(self, rng, count):
+        user_ids = list(User.objects.values_list("id", flat=True)[:1000])
+        for start in range(0, count, 10000):
+            entries = []
+            for object_id in range(start, min(start + 10000, count)):
+                name = " ".join(rng.sample(NAMES, 2))
+                phone = f"07{rng.randrange(10**8):08d}"
+                reference = "".join(rng.choices(string.ascii_uppercase + string.digits, k=10))
+                entries.append(
+                    SearchEntry(
+                        kind=SearchEntry.KIND_TRANSACTION,
+                        object_id=SYNTHETIC_ID_OFFSET + object_id,
+                        user_id=rng.choice(user_ids),
+                        title=name,
+                        terms=" ".join(words(name, reference) + phone_terms(phone)),
+                    )
+                )
+            with db_transaction.atomic():
+                SearchEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+
+    def _sample_queries(self, rng, count):
+        sample = list(
+            SearchEntry.objects.filter(kind__in=[SearchEntry.KIND_LOAN, SearchEntry.KIND_TRANSACTION])
+            .order_by("?")
+            .values_list("kind", "terms")[: count * 2]
+        )
+        queries = []
+        for kind, terms in sample:
+            candidates = [term for term in terms.split() if len(term) >= 3]
+            if candidates:
+                term = rng.choice(candidates)
+                queries.append((kind, term[: rng.randint(3, min(6, len(term)))]))
+        return queries[:count]
+
+    def _scan(self, kind, query):
+        if kind == SearchEntry.KIND_LOAN:
+            matches = LoanRequest.objects.filter(
+                Q(name__icontains=query) | Q(id_number__icontains=query) | Q(user__username__icontains=query)
+            )
+        else:
+            matches = Transaction.objects.filter(Q(payment_reference__icontains=query) | Q(phone_number__icontains=query))
+        return list(matches.order_by("-id").values_list("id", flat=True)[:20])
+
+    def _compare(self, rng, count):
+        queries = self._sample_queries(rng, count)
+        timings = {"index": [], "icontains": []}
+        for kind, query in queries:
+            started = time.perf_counter()
+            search(query, [kind])
+            timings["index"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            self._scan(kind, query)
+            timings["icontains"].append(time.perf_counter() - started)
+
+        for name, samples in timings.items():
+            quantiles = statistics.quantiles(samples, n=100)
+            self.stdout.write(
+                f"{name:>9}: p50 {quantiles[49] * 1000:.1f} ms, p95 {quantiles[94] * 1000:.1f} ms, "
+                f"max {max(samples) * 1000:.1f} ms over {len(samples)} queries"
+            )
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from FinanceApp.fake_daraja import FakeDarajaServer
+from FinanceApp.models import PaymentJob, Transaction
+from FinanceApp.payment_queue import adrain, drain
+from FinanceApp.payments import DarajaBackend
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue STK pushes against a local fake Daraja with a fixed response latency and drain them "
+        "in one process twice: with the sync worker the WSGI deployment runs, then with the asyncio "
+        "worker and async gateway client. Reports pushes per second and the most pushes in flight. "
+        "Benchmark rows are removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=100)
+        parser.add_argument("--latency", type=float, default=0.25, help="Seconds the fake gateway takes per call.")
+        parser.add_argument("--concurrency", type=int, default=50, help="Pushes the async worker keeps in flight.")
+
+    def handle(self, *args, **options):
+        server = FakeDarajaServer(latency=options["latency"]).start()
+        member = User.objects.create_user(username="bench-stk-member")
+        try:
+            with override_settings(MPESA_API_BASE_URL=server.url):
+                results = {
+                    "sync": self._phase(server, member, options, lambda backend: drain(backend)),
+                    "async": self._phase(
+                        server,
+                        member,
+                        options,
+                        lambda backend: asyncio.run(self._adrain(backend, options["concurrency"])),
+                    ),
+                }
+        finally:
+            member.delete()
+            server.stop()
+
+        for name, (processed, elapsed, in_flight) in results.items():
+            self.stdout.write(
+                f"{name:>5}: {processed} pushes in {elapsed:.1f}s ({processed / elapsed:.1f}/s), "
+                f"at most {in_flight} in flight"
+            )
+        speedup = results["sync"][1] / results["async"][1] if results["async"][1] else 0
+        self.stdout.write(self.style.SUCCESS(f"The async worker drained the queue {speedup:.1f}x faster."))
+
+    async def _adrain(self, backend, concurrency):
+        try:
+            return await adrain(backend, concurrency=concurrency)
+        finally:
+            await backend.aclose()
+
+    def _phase(self, server, member, options, run):
+        pending = Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    user=member,
+                    transaction_type=Transaction.TYPE_DEPOSIT,
+                    status=Transaction.STATUS_PENDING,
+                    amount=10,
+                    phone_number="0712345678",
+                    description="Benchmark STK push",
+                )
+                for _ in range(options["jobs"])
+            ]
+        )
+        PaymentJob.objects.bulk_create(
+            [PaymentJob(transaction=transaction, callback_url="https://example.com/callback") for transaction in pending]
+        )
+        cache.delete(DarajaBackend.TOKEN_CACHE_KEY)
+        server.max_in_flight = 0
+
+        started = time.perf_counter()
+        processed = run(DarajaBackend())
+        elapsed = time.perf_counter() - started
+        sent = PaymentJob.objects.filter(transaction__user=member, status=PaymentJob.STATUS_SENT).count()
+        if sent != options["jobs"]:
+            self.stderr.write(f"Only {sent} of {options['jobs']} pushes were accepted.")
+        Transaction.objects.filter(user=member).delete()
+        return processed, elapsed, server.max_in_flight
@@ -0,0 +1,86 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from FinanceApp.models import Transaction
+from FinanceApp.pagination import encode_cursor, keyset_page
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a member with a large transaction history and check that keyset-paginated "
+        "history pages cost the same near the newest rows and deep in the history. "
+        "All seeded rows are rolled back when the benchmark finishes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--page-size", type=int, default=25)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--max-ratio",
+            type=float,
+            default=3.0,
+            help="Fail if the deepest page is this many times slower than the first page.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        rows = options["rows"]
+        batch_size = options["batch_size"]
+        page_size = options["page_size"]
+
+        member = User.objects.create(username="bench-history-member")
+        seed_started = time.perf_counter()
+        for start in range(0, rows, batch_size):
+            Transaction.objects.bulk_create(
+                [
+                    Transaction(
+                        user=member,
+                        transaction_type=Transaction.TYPE_DEPOSIT,
+                        amount=100,
+                        description="Benchmark deposit",
+                    )
+                    for _ in range(min(batch_size, rows - start))
+                ],
+                batch_size=batch_size,
+            )
+        self.stdout.write(f"Seeded {rows} transactions in {time.perf_counter() - seed_started:.1f}s")
+
+        history = Transaction.objects.filter(user=member)
+        results = {"first": self._time_page(history, None, page_size, options["repeat"])}
+        for label, fraction in [("middle", 0.5), ("deep", 0.99)]:
+            anchor = history.order_by("-created_at", "-id").values_list("created_at", "id")[int(rows * fraction)]
+            results[label] = self._time_page(history, encode_cursor(*anchor), page_size, options["repeat"])
+
+        for label, median in results.items():
+            self.stdout.write(f"{label:>6} page: {median * 1000:.2f} ms (median of {options['repeat']})")
+
+        ratio = results["deep"] / results["first"] if results["first"] else 0
+        self.stdout.write(f"deep/first latency ratio: {ratio:.2f}")
+        if ratio > options["max_ratio"]:
+            raise CommandError(f"History page latency grew {ratio:.2f}x with depth (limit {options['max_ratio']}x).")
+        self.stdout.write(self.style.SUCCESS("Page latency is flat across the history."))
+
+    def _time_page(self, queryset, cursor, page_size, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            keyset_page(queryset, cursor, page_size)
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
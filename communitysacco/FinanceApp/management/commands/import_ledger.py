@@ -0,0 +1,74 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from FinanceApp.ledger_import import IMPORT_SPECS, import_ledger, read_rows
+from FinanceApp.models import LedgerImport
+
+
+class Command(BaseCommand):
+    help = (
+        "Import legacy savings, transactions or loan requests from CSV or JSONL. Rows need a username, "
+        "created_at and the model's columns; progress is checkpointed so an interrupted import resumes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--kind", required=True, choices=sorted(IMPORT_SPECS))
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension.")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--rejects", help="Where to write rejected rows (default: <path>.rejects.jsonl).")
+        parser.add_argument(
+            "--source",
+            help="Checkpoint name for this input (default: the absolute path). Reuse it to resume.",
+        )
+        parser.add_argument("--restart", action="store_true", help="Forget the checkpoint and import from the start.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.lower().endswith(".csv") else "jsonl")
+        source = options["source"] or os.path.abspath(path)
+        rejects_path = options["rejects"] or f"{path}.rejects.jsonl"
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist.")
+
+        if options["restart"]:
+            LedgerImport.objects.filter(source=source).delete()
+        previous = LedgerImport.objects.filter(source=source).first()
+        if previous and previous.completed_at:
+            self.stdout.write(f"{source} was already imported ({previous}). Use --restart to import it again.")
+            return
+        if previous:
+            self.stdout.write(f"Resuming {source} after row {previous.rows_read}.")
+
+        started = time.perf_counter()
+        rows_before = previous.rows_read if previous else 0
+
+        def progress(rows_read):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  {rows_read} rows read ({(rows_read - rows_before) / elapsed:.0f} rows/s)")
+
+        with open(path, newline="", encoding="utf-8") as stream, open(rejects_path, "a", encoding="utf-8") as rejects:
+            try:
+                record = import_ledger(
+                    read_rows(stream, fmt),
+                    options["kind"],
+                    source,
+                    chunk_size=options["chunk_size"],
+                    rejects=rejects,
+                    progress=progress if options["verbosity"] > 1 else None,
+                )
+            except ValueError as exc:
+                raise CommandError(str(exc)) from exc
+
+        elapsed = time.perf_counter() - started
+        rate = (record.rows_read - rows_before) / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {record.rows_imported} rows, rejected {record.rows_rejected} "
+                f"in {elapsed:.1f}s ({rate:.0f} rows/s)."
+            )
+        )
+        if record.rows_rejected:
+            self.stdout.write(f"Rejected rows were written to {rejects_path}.")
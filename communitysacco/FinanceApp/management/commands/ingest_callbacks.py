@@ -0,0 +1,28 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from FinanceApp.callbacks import ingest_callbacks, iter_jsonl_callbacks
+
+
+class Command(BaseCommand):
+    help = "Replay a JSONL file of M-Pesa stkCallback payloads (one per line) in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSONL file to read, or - for standard input.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options["path"] == "-":
+            stats = ingest_callbacks(iter_jsonl_callbacks(sys.stdin), options["batch_size"])
+        else:
+            with open(options["path"], encoding="utf-8") as source:
+                stats = ingest_callbacks(iter_jsonl_callbacks(source), options["batch_size"])
+        elapsed = time.perf_counter() - started
+
+        total = sum(stats.values())
+        summary = ", ".join(f"{count} {outcome}" for outcome, count in sorted(stats.items())) or "nothing to do"
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"Ingested {total} callbacks in {elapsed:.1f}s ({rate:.0f}/s): {summary}."))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from FinanceApp.ledger import rebuild_balances, verify_balances
+from FinanceApp.replicas import reading_from, replica_alias
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-member balance ledger from savings and transactions, then verify it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="user_ids", help="Limit to these user IDs.")
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help=(
+                "Only verify the stored balances, reading from the replica if there is one; "
+                "exit with an error if they have drifted."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"]
+        if options["check"]:
+            with reading_from(replica_alias()):
+                mismatches = verify_balances(user_ids)
+        else:
+            written = rebuild_balances(user_ids)
+            self.stdout.write(f"Rebuilt {written} member balances.")
+            mismatches = verify_balances(user_ids)
+
+        for user_id, field, stored, expected in mismatches[:50]:
+            self.stderr.write(f"user {user_id}: {field} is {stored}, expected {expected}")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} balance mismatches found.")
+        self.stdout.write(self.style.SUCCESS("Member balances verified."))
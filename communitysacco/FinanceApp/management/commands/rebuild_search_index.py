@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from FinanceApp.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the staff search index from members, loan requests and transactions. Saves keep it "
+        "current; run this after migrating an existing database or restoring a backup."
+    )
+
+    def handle(self, *args, **options):
+        written = rebuild_index()
+        self.stdout.write(", ".join(f"{count} {kind} entries" for kind, count in written.items()))
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from FinanceApp.payments import get_payment_backend
+from FinanceApp.reconciliation import reconcile_pending
+
+
+class Command(BaseCommand):
+    help = "Query M-Pesa for pending payments whose callback never arrived and apply the results."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=5, help="Minutes a push must have been pending.")
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent gateway queries.")
+        parser.add_argument("--rate", type=float, default=10.0, help="Maximum gateway queries per second (0 = no limit).")
+        parser.add_argument("--limit", type=int, default=None, help="Stop after querying this many payments.")
+        parser.add_argument(
+            "--expire-unsent-after",
+            type=int,
+            default=24,
+            help="Hours after which pending payments that were never sent are failed (0 = never).",
+        )
+
+    def handle(self, *args, **options):
+        backend = get_payment_backend()
+        report = reconcile_pending(
+            backend,
+            older_than=timedelta(minutes=options["older_than"]),
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+            rate_limit=options["rate"] or None,
+            limit=options["limit"],
+            expire_unsent_after=timedelta(hours=options["expire_unsent_after"]) if options["expire_unsent_after"] else None,
+        )
+        self.stdout.write(self.style.SUCCESS(str(report)))
+
+        metrics = getattr(backend, "metrics", None)
+        if metrics is not None:
+            stats = metrics.snapshot().get("stk_query")
+            if stats:
+                self.stdout.write(
+                    f"stk_query: {stats['count']} calls, {stats['errors']} errors, "
+                    f"avg {stats['avg_seconds'] * 1000:.1f} ms, max {stats['max_seconds'] * 1000:.1f} ms"
+                )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from FinanceApp.models import TrendWatermark
+from FinanceApp.trends import refresh
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold transactions added since the last run into the monthly trend summary behind the "
+        "analytics trend API. Only rows above the stored high-water mark are read; schedule it "
+        "every few minutes. Use --rebuild after editing or deleting settled transactions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Recompute the summary from the first transaction.")
+
+    def handle(self, *args, **options):
+        folded = refresh(rebuild=options["rebuild"])
+        mark = TrendWatermark.objects.get(name=TrendWatermark.TRANSACTIONS)
+        self.stdout.write(self.style.SUCCESS(f"Folded {folded} transactions; summary now runs through #{mark.last_id}."))
@@ -0,0 +1,52 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from FinanceApp.accruals import partition_bounds, run_accruals
+
+
+def _partition(value):
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise CommandError(f"--partition must look like 2/4, not {value!r}.")
+    return index, count
+
+
+class Command(BaseCommand):
+    help = (
+        "Post one day's savings dividends and late-repayment penalties for every member. "
+        "Safe to rerun for the same date; use --partition to split members across worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", type=date.fromisoformat, help="Accrual date, YYYY-MM-DD (default: yesterday).")
+        parser.add_argument("--partition", type=_partition, help="Run only partition I of N by user id, e.g. 2/4.")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Members per transaction.")
+
+    def handle(self, *args, **options):
+        accrual_date = options["date"] or timezone.localdate() - timedelta(days=1)
+        user_range = None
+        if options["partition"]:
+            try:
+                user_range = partition_bounds(*options["partition"])
+            except ValueError as exc:
+                raise CommandError(str(exc)) from exc
+            if user_range is None:
+                self.stdout.write("Partition is empty; nothing to accrue.")
+                return
+
+        started = time.perf_counter()
+        stats = run_accruals(accrual_date, user_range=user_range, chunk_size=options["chunk_size"])
+        elapsed = time.perf_counter() - started
+        scope = f"users {user_range[0]}-{user_range[1]}" if user_range else "all members"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Accruals for {accrual_date} ({scope}, {stats['members']} members) in {elapsed:.1f}s: "
+                f"{stats['dividends']} dividends totalling {stats['dividends_total']}, "
+                f"{stats['penalties']} penalties totalling {stats['penalties_total']}, "
+                f"{stats['skipped']} already posted."
+            )
+        )
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from FinanceApp.document_previews import drain
+
+
+class Command(BaseCommand):
+    help = "Render inline previews for uploaded loan documents (first page of PDFs, thumbnails of images)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Render the previews waiting now, then exit.")
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds to sleep when nothing is waiting.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Document worker started.")
+        try:
+            while True:
+                processed = drain(batch_size=options["batch_size"])
+                if processed:
+                    self.stdout.write(f"Processed {processed} document previews.")
+                if options["once"]:
+                    break
+                if not processed:
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Document worker stopped.")
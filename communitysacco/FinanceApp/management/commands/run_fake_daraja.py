@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from FinanceApp.fake_daraja import FakeDarajaServer
+
+
+class Command(BaseCommand):
+    help = "Serve a local fake of the Daraja OAuth, STK push and STK query endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.0, help="Seconds to delay every response.")
+
+    def handle(self, *args, **options):
+        server = FakeDarajaServer(port=options["port"], latency=options["latency"])
+        self.stdout.write(f"Fake Daraja listening on {server.url}; set MPESA_API_BASE_URL to use it.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Fake Daraja stopped.")
+        finally:
+            server.httpd.server_close()
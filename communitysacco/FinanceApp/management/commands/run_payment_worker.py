@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from FinanceApp.payment_queue import adrain, drain
+from FinanceApp.payments import get_payment_backend
+
+
+class Command(BaseCommand):
+    help = "Drain the queued STK push jobs, retrying gateway failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Process the jobs that are due now, then exit.")
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="STK pushes to keep in flight. Above 1 the worker runs on asyncio with the async gateway client.",
+        )
+
+    def handle(self, *args, **options):
+        backend = get_payment_backend()
+        self.stdout.write(f"Payment worker started with {backend.__class__.__name__}.")
+        try:
+            if options["concurrency"] > 1:
+                asyncio.run(self._run_async(backend, options))
+            else:
+                self._run(backend, options)
+        except KeyboardInterrupt:
+            self.stdout.write("Payment worker stopped.")
+        self._report_metrics(backend)
+
+    def _run(self, backend, options):
+        while True:
+            processed = drain(backend, batch_size=options["batch_size"])
+            if processed:
+                self.stdout.write(f"Processed {processed} payment jobs.")
+            if options["once"]:
+                break
+            if not processed:
+                time.sleep(options["interval"])
+
+    async def _run_async(self, backend, options):
+        try:
+            while True:
+                processed = await adrain(backend, batch_size=options["batch_size"], concurrency=options["concurrency"])
+                if processed:
+                    self.stdout.write(f"Processed {processed} payment jobs.")
+                if options["once"]:
+                    break
+                if not processed:
+                    await asyncio.sleep(options["interval"])
+        finally:
+            await backend.aclose()
+
+    def _report_metrics(self, backend):
+        metrics = getattr(backend, "metrics", None)
+        if metrics is None:
+            return
+        for operation, stats in sorted(metrics.snapshot().items()):
+            self.stdout.write(
+                f"{operation}: {stats['count']} calls, {stats['errors']} errors, "
+                f"avg {stats['avg_seconds'] * 1000:.1f} ms, max {stats['max_seconds'] * 1000:.1f} ms"
+            )
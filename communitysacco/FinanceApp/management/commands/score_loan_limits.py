@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from FinanceApp.loan_limits import score_all, score_stale
+
+
+class Command(BaseCommand):
+    help = (
+        "Score members' loan limits from savings, repayment punctuality and outstanding balance. "
+        "By default only members whose ledger changed since their last score are rescored."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Rescore every member, e.g. nightly as instalments fall due.")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        score = score_all if options["full"] else score_stale
+        stats = score(chunk_size=options["chunk_size"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Scored {stats['scored']} loan limits in {elapsed:.1f}s."))
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction as db_transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .ledger import get_balance
+from .models import LoanRequest, SavingsRecord, Transaction, UserLoanLimit
+from .replicas import reading_from
+
+
+HITS_KEY = "member-summary:hits"
+MISSES_KEY = "member-summary:misses"
+
+
+def summary_key(user_id):
+    return f"member-summary:{user_id}"
+
+
+def _count(key):
+    # add() is a no-op when the counter exists; incr() is atomic on shared backends.
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr(); losing one count is fine.
+        pass
+
+
+def build_summary(user):
+    latest_loan = user.loan_requests.first()
+    balance = get_balance(user)
+    loan_limit = UserLoanLimit.objects.filter(user=user).values_list("amount", flat=True).first()
+    return {
+        "loan_status": latest_loan.get_status_display() if latest_loan else "None",
+        "total_saved": balance.total_saved,
+        "pending_transactions": balance.pending_count,
+        "loan_limit": loan_limit if loan_limit is not None else "None",
+    }
+
+
+def member_summary(user):
+    """
+    The home page figures for ``user``, served from the cache while nothing they depend on changes.
+
+    Writes to the member's savings, loans, transactions or loan limit drop the
+    cached copy (see ``invalidate``), so a warm hit needs no queries at all.
+    """
+    key = summary_key(user.id)
+    summary = cache.get(key)
+    if summary is not None:
+        _count(HITS_KEY)
+        return summary
+    _count(MISSES_KEY)
+    # Built from the primary even under ``replica_reads``: figures read from a lagging replica
+    # would be served from the cache for its whole lifetime.
+    with reading_from(DEFAULT_DB_ALIAS):
+        summary = build_summary(user)
+    cache.set(key, summary, settings.MEMBER_SUMMARY_CACHE_SECONDS)
+    return summary
+
+
+def cache_stats():
+    """``{"hits": n, "misses": n}`` since the counters were last reset."""
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {"hits": counts.get(HITS_KEY, 0), "misses": counts.get(MISSES_KEY, 0)}
+
+
+def invalidate(user_ids):
+    """
+    Drop the cached summaries of ``user_ids``.
+
+    They are dropped now and again once the surrounding transaction commits,
+    so a page render racing the write cannot put the old figures back.
+    """
+    keys = [summary_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    db_transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def apply_changes(model, changes):
+    """Invalidate members touched by tracked writes, including bulk ones that bypass the save signals."""
+    invalidate({state["user"] for pair in changes for state in pair if state})
+
+
+@receiver(post_save, sender=SavingsRecord)
+@receiver(post_save, sender=LoanRequest)
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=UserLoanLimit)
+@receiver(post_delete, sender=SavingsRecord)
+@receiver(post_delete, sender=LoanRequest)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=UserLoanLimit)
+def invalidate_on_write(sender, instance, **kwargs):
+    invalidate([instance.user_id])
@@ -0,0 +1,131 @@
+import cProfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .replicas import PIN_COOKIE, SAFE_METHODS, replica_alias, tracking_writes
+from .request_metrics import UNRESOLVED, RequestStats, current_request, histogram
+
+PROFILE_HEADER = "X-Profile-Request"
+
+
+class RequestMetricsMiddleware:
+    """
+    Record each request's query count, SQL time, template render time and wall time under its
+    URL name (see ``request_metrics``). Staff can send an ``X-Profile-Request`` header to have
+    the request run under cProfile and dumped to ``REQUEST_PROFILE_DIR``.
+
+    Works on both handlers, so under ASGI the async views are awaited directly rather than
+    being run in a thread to suit this middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with self._measuring(request):
+            if self._should_profile(request):
+                profile = cProfile.Profile()
+                response = profile.runcall(self.get_response, request)
+                return self._dump(profile, request, response)
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with self._measuring(request):
+            if await self._ashould_profile(request):
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    profile.disable()
+                return self._dump(profile, request, response)
+            return await self.get_response(request)
+
+    @contextmanager
+    def _measuring(self, request):
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            current_request.reset(token)
+        match = request.resolver_match
+        histogram.record(match.url_name if match and match.url_name else UNRESOLVED, stats, time.perf_counter() - started)
+
+    def _profile_requested(self, request):
+        return bool(settings.REQUEST_PROFILE_DIR) and PROFILE_HEADER in request.headers
+
+    def _should_profile(self, request):
+        if not self._profile_requested(request):
+            return False
+        user = getattr(request, "user", None)
+        return bool(user and user.is_staff)
+
+    async def _ashould_profile(self, request):
+        # request.user would load the session and user on the event loop; auser() does it off it.
+        if not self._profile_requested(request) or not hasattr(request, "auser"):
+            return False
+        user = await request.auser()
+        return user.is_staff
+
+    def _dump(self, profile, request, response):
+        match = request.resolver_match
+        directory = Path(settings.REQUEST_PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{match.url_name if match else 'request'}-{time.time_ns()}.prof"
+        profile.dump_stats(path)
+        response["X-Profile-File"] = str(path)
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Keep a browser reading from the primary for ``DATABASE_REPLICA_PIN_SECONDS`` after one of its
+    requests writes (or uses an unsafe method), so it reads its own writes however far the
+    replica lags. The pin is a short-lived cookie, so it costs no session write.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if replica_alias() is None:
+            return self.get_response(request)
+        with tracking_writes() as writes:
+            response = self.get_response(request)
+        return self._pin(request, response, writes)
+
+    async def __acall__(self, request):
+        if replica_alias() is None:
+            return await self.get_response(request)
+        with tracking_writes() as writes:
+            response = await self.get_response(request)
+        return self._pin(request, response, writes)
+
+    def _pin(self, request, response, writes):
+        if writes.seen or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=settings.DATABASE_REPLICA_PIN_SECONDS, httponly=True, samesite="Lax"
+            )
+        return response
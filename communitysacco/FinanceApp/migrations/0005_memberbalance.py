@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_balances(apps, schema_editor):
+    MemberBalance = apps.get_model("FinanceApp", "MemberBalance")
+    SavingsRecord = apps.get_model("FinanceApp", "SavingsRecord")
+    Transaction = apps.get_model("FinanceApp", "Transaction")
+
+    balances = {}
+
+    def balance_for(user_id):
+        return balances.setdefault(user_id, MemberBalance(user_id=user_id))
+
+    for row in SavingsRecord.objects.order_by().values("user_id").annotate(total=Sum("amount")):
+        balance_for(row["user_id"]).total_saved = row["total"] or 0
+
+    completed = Q(status="COMPLETED")
+    rows = Transaction.objects.order_by().values("user_id").annotate(
+        disbursed=Sum("amount", filter=completed & Q(transaction_type="LOAN_DISBURSEMENT")),
+        repaid=Sum("amount", filter=completed & Q(transaction_type="LOAN_REPAYMENT")),
+        pending=Count("id", filter=Q(status="PENDING")),
+    )
+    for row in rows:
+        balance = balance_for(row["user_id"])
+        balance.total_disbursed = row["disbursed"] or 0
+        balance.total_repaid = row["repaid"] or 0
+        balance.outstanding = balance.total_disbursed - balance.total_repaid
+        balance.pending_count = row["pending"]
+
+    MemberBalance.objects.bulk_create(balances.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FinanceApp', '0004_transaction_user_created_index'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberBalance',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_saved', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_disbursed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_repaid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pending_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
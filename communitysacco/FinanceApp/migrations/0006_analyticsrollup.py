@@ -0,0 +1,93 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:19
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    AnalyticsRollup = apps.get_model("FinanceApp", "AnalyticsRollup")
+    LoanRequest = apps.get_model("FinanceApp", "LoanRequest")
+    Transaction = apps.get_model("FinanceApp", "Transaction")
+
+    rollups = []
+    transaction_rows = (
+        Transaction.objects.order_by()
+        .annotate(period=TruncDate("created_at"))
+        .values("period", "transaction_type", "status")
+        .annotate(count=Count("id"), total_amount=Sum("amount"))
+    )
+    for row in transaction_rows:
+        rollups.append(
+            AnalyticsRollup(
+                metric="transaction",
+                period=row["period"],
+                category=row["transaction_type"],
+                status=row["status"],
+                count=row["count"],
+                total_amount=row["total_amount"] or 0,
+            )
+        )
+
+    loan_rows = (
+        LoanRequest.objects.order_by()
+        .annotate(period=TruncDate("created_at"))
+        .values("period", "status")
+        .annotate(count=Count("id"), total_amount=Sum("amount"))
+    )
+    for row in loan_rows:
+        rollups.append(
+            AnalyticsRollup(
+                metric="loan_request",
+                period=row["period"],
+                status=row["status"],
+                count=row["count"],
+                total_amount=row["total_amount"] or 0,
+            )
+        )
+
+    first_loans = defaultdict(int)
+    for row in LoanRequest.objects.order_by().values("user_id").annotate(first=TruncDate(Min("created_at"))):
+        first_loans[row["first"]] += 1
+    for period, count in first_loans.items():
+        rollups.append(AnalyticsRollup(metric="loan_applicant", period=period, count=count))
+
+    AnalyticsRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FinanceApp', '0005_memberbalance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('transaction', 'Transactions'), ('loan_request', 'Loan requests'), ('loan_applicant', 'First-time loan applicants')], max_length=20)),
+                ('period', models.DateField()),
+                ('category', models.CharField(blank=True, max_length=20)),
+                ('status', models.CharField(blank=True, max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+            options={
+                'ordering': ['metric', 'period'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-created_at'], name='txn_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='analyticsrollup',
+            constraint=models.UniqueConstraint(fields=('metric', 'period', 'category', 'status'), name='analytics_rollup_key'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
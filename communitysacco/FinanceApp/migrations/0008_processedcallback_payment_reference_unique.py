@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FinanceApp', '0007_paymentjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedCallback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checkout_request_id', models.CharField(max_length=120, unique=True)),
+                ('mpesa_receipt_number', models.CharField(blank=True, max_length=40)),
+                ('result_code', models.IntegerField()),
+                ('result_desc', models.CharField(blank=True, max_length=255)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-received_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('payment_reference', ''), _negated=True), fields=('payment_reference',), name='txn_payment_reference_uniq'),
+        ),
+        migrations.AddField(
+            model_name='processedcallback',
+            name='transaction',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='callbacks', to='FinanceApp.transaction'),
+        ),
+        migrations.AddConstraint(
+            model_name='processedcallback',
+            constraint=models.UniqueConstraint(condition=models.Q(('mpesa_receipt_number', ''), _negated=True), fields=('mpesa_receipt_number',), name='callback_receipt_uniq'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FinanceApp', '0009_transaction_status_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loanrequest',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='loan_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanrequest',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='loan_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanrequest',
+            index=models.Index(fields=['-created_at', '-id'], name='loan_created_idx'),
+        ),
+    ]
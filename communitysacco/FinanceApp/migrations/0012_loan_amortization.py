@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FinanceApp', '0011_ledgerimport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=120, unique=True)),
+                ('interest_rate', models.DecimalField(decimal_places=2, help_text='Annual interest rate in percent.', max_digits=5)),
+                ('term_months', models.PositiveSmallIntegerField()),
+                ('interest_method', models.CharField(choices=[('FLAT', 'Flat rate'), ('REDUCING', 'Reducing balance')], default='REDUCING', max_length=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='loanrequest',
+            name='interest_method',
+            field=models.CharField(blank=True, choices=[('FLAT', 'Flat rate'), ('REDUCING', 'Reducing balance')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='loanrequest',
+            name='interest_rate',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='loanrequest',
+            name='term_months',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='loanrequest',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='loan_requests', to='FinanceApp.loanproduct'),
+        ),
+        migrations.CreateModel(
+            name='RepaymentInstalment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveSmallIntegerField()),
+                ('due_date', models.DateField()),
+                ('principal_due', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('interest_due', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='instalments', to='FinanceApp.loanrequest')),
+            ],
+            options={
+                'ordering': ['loan', 'number'],
+                'indexes': [models.Index(fields=['due_date'], name='instalment_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('loan', 'number'), name='instalment_loan_number_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def keep_existing_limits(apps, schema_editor):
+    # Limits typed in before scoring existed stay as admin overrides.
+    UserLoanLimit = apps.get_model("FinanceApp", "UserLoanLimit")
+    UserLoanLimit.objects.filter(amount__isnull=False).update(is_manual=True, needs_scoring=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FinanceApp', '0013_transaction_accrual_types'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userloanlimit',
+            name='is_manual',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userloanlimit',
+            name='needs_scoring',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='userloanlimit',
+            name='scored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='userloanlimit',
+            index=models.Index(condition=models.Q(('needs_scoring', True)), fields=['user'], name='loanlimit_needs_scoring_idx'),
+        ),
+        migrations.RunPython(keep_existing_limits, migrations.RunPython.noop),
+    ]
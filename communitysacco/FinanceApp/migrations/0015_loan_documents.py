@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FinanceApp', '0014_loan_limit_scoring'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('content_type', models.CharField(max_length=100)),
+                ('preview_name', models.CharField(blank=True, max_length=255)),
+                ('preview_status', models.CharField(choices=[('PENDING', 'Waiting'), ('RUNNING', 'Rendering'), ('READY', 'Ready'), ('NONE', 'Not available for this file type'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('preview_error', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['preview_status', 'id'], name='loan_document_preview_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='loanrequest',
+            name='stored_document',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='loan_requests', to='FinanceApp.loandocument'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+SQLITE_INDEX = [
+    # External-content FTS5 table over SearchEntry's kind and terms, with prefix indexes for 2-6
+    # character typeahead, kept in step with the table by triggers. Indexing the kind lets a
+    # search for one kind intersect posting lists instead of filtering the joined rows.
+    """CREATE VIRTUAL TABLE "FinanceApp_searchentry_fts" USING fts5(
+        kind, terms, content='FinanceApp_searchentry', content_rowid='id',
+        prefix='2 3 4 5 6', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER "FinanceApp_searchentry_fts_insert" AFTER INSERT ON "FinanceApp_searchentry" BEGIN
+        INSERT INTO "FinanceApp_searchentry_fts" (rowid, kind, terms) VALUES (new.id, new.kind, new.terms);
+    END""",
+    """CREATE TRIGGER "FinanceApp_searchentry_fts_delete" AFTER DELETE ON "FinanceApp_searchentry" BEGIN
+        INSERT INTO "FinanceApp_searchentry_fts" ("FinanceApp_searchentry_fts", rowid, kind, terms)
+        VALUES ('delete', old.id, old.kind, old.terms);
+    END""",
+    """CREATE TRIGGER "FinanceApp_searchentry_fts_update" AFTER UPDATE OF kind, terms ON "FinanceApp_searchentry" BEGIN
+        INSERT INTO "FinanceApp_searchentry_fts" ("FinanceApp_searchentry_fts", rowid, kind, terms)
+        VALUES ('delete', old.id, old.kind, old.terms);
+        INSERT INTO "FinanceApp_searchentry_fts" (rowid, kind, terms) VALUES (new.id, new.kind, new.terms);
+    END""",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS "FinanceApp_searchentry_fts_update"',
+    'DROP TRIGGER IF EXISTS "FinanceApp_searchentry_fts_delete"',
+    'DROP TRIGGER IF EXISTS "FinanceApp_searchentry_fts_insert"',
+    'DROP TABLE IF EXISTS "FinanceApp_searchentry_fts"',
+]
+POSTGRES_INDEX = [
+    """CREATE INDEX "search_entry_terms_gin" ON "FinanceApp_searchentry" USING gin (to_tsvector('simple', "terms"))""",
+]
+POSTGRES_DROP = ['DROP INDEX IF EXISTS "search_entry_terms_gin"']
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_text_index(apps, schema_editor):
+    _run(schema_editor, {"sqlite": SQLITE_INDEX, "postgresql": POSTGRES_INDEX})
+
+
+def drop_text_index(apps, schema_editor):
+    _run(schema_editor, {"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FinanceApp', '0015_loan_documents'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('member', 'Member'), ('loan', 'Loan request'), ('transaction', 'Transaction')], max_length=12)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('detail', models.CharField(blank=True, max_length=255)),
+                ('terms', models.TextField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='search_entry_object_uniq')],
+            },
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FinanceApp', '0017_ledger_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=40, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransactionTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('transaction_type', models.CharField(choices=[('DEPOSIT', 'Deposit'), ('LOAN_DISBURSEMENT', 'Loan Disbursement'), ('LOAN_REPAYMENT', 'Loan Repayment'), ('DIVIDEND', 'Savings Dividend'), ('PENALTY', 'Late Repayment Penalty')], max_length=20)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending payment'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'ordering': ['month', 'transaction_type', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('month', 'transaction_type', 'status'), name='transaction_trend_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FinanceApp', '0018_transaction_trends'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trendwatermark',
+            name='pending_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
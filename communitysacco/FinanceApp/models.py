@@ -1,12 +1,109 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction as db_transaction
+from django.utils import timezone
 
 
-class SavingsRecord(models.Model):
+def apply_tracked_change(model, previous, current):
+    """
+    Update every maintained aggregate for one row moving from ``previous`` to ``current``.
+
+    States are ``tracked_state()``-shaped dicts (or ``None``). Write paths that
+    bypass ``TrackedModel.save`` (``QuerySet.update``, ``bulk_create``) call this
+    directly inside their transaction.
+    """
+    apply_tracked_changes(model, [(previous, current)])
+
+
+def apply_tracked_changes(model, changes):
+    """Batch form of ``apply_tracked_change`` for a list of ``(previous, current)`` pairs."""
+    from . import amortization, analytics, ledger, loan_limits, member_summary
+
+    ledger.apply_changes(model, changes)
+    analytics.apply_changes(model, changes)
+    amortization.apply_changes(model, changes)
+    loan_limits.apply_changes(model, changes)
+    member_summary.apply_changes(model, changes)
+
+
+class CreatedAtField(models.DateTimeField):
+    """
+    ``auto_now_add`` timestamp that keeps the value already set on instances marked
+    ``backdated``, so imports and accruals can write historical rows with ``bulk_create``.
+    """
+
+    def pre_save(self, model_instance, add):
+        if add and getattr(model_instance, "backdated", False):
+            return getattr(model_instance, self.attname)
+        return super().pre_save(model_instance, add)
+
+    def deconstruct(self):
+        # The column is an ordinary DateTimeField; migrations need not know the difference.
+        name, _, args, kwargs = super().deconstruct()
+        return name, "django.db.models.DateTimeField", args, kwargs
+
+
+class TrackedModel(models.Model):
+    """
+    Base for rows that feed maintained aggregates (member balances, analytics rollups).
+
+    Saves and deletes pass the row's previous and current ``tracked_fields``
+    values to ``FinanceApp.ledger`` and ``FinanceApp.analytics`` inside the same
+    database transaction as the row write. Bulk ``QuerySet`` writes bypass this
+    and must update the aggregates themselves (or be followed by a rebuild).
+    """
+
+    tracked_fields = ()
+    # Set on an instance to keep the ``created_at`` it was built with (see ``CreatedAtField``).
+    backdated = False
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = not instance.get_deferred_fields().intersection(
+            cls._meta.get_field(name).attname for name in cls.tracked_fields
+        )
+        instance._tracked_snapshot = instance.tracked_state() if loaded else None
+        return instance
+
+    def tracked_state(self):
+        return {name: getattr(self, self._meta.get_field(name).attname) for name in self.tracked_fields}
+
+    def _stored_state(self):
+        if self.pk is None or self._state.adding:
+            return None
+        snapshot = getattr(self, "_tracked_snapshot", None)
+        if snapshot is None:
+            stored = type(self)._base_manager.filter(pk=self.pk).first()
+            snapshot = stored.tracked_state() if stored else None
+        return snapshot
+
+    def save(self, *args, **kwargs):
+        with db_transaction.atomic():
+            previous = self._stored_state()
+            super().save(*args, **kwargs)
+            current = self.tracked_state()
+            apply_tracked_change(type(self), previous, current)
+        self._tracked_snapshot = current
+
+    def delete(self, *args, **kwargs):
+        with db_transaction.atomic():
+            previous = self._stored_state()
+            result = super().delete(*args, **kwargs)
+            apply_tracked_change(type(self), previous, None)
+        self._tracked_snapshot = None
+        return result
+
+
+class SavingsRecord(TrackedModel):
+    tracked_fields = ("user", "amount", "created_at")
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="savings_records")
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     notes = models.CharField(max_length=255, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = CreatedAtField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
@@ -15,7 +112,71 @@ class SavingsRecord(models.Model):
         return f"{self.user.username} saved {self.amount}"
 
 
-class LoanRequest(models.Model):
+class LoanProduct(models.Model):
+    """Lending terms a member chooses when applying; copied onto each request so later edits do not move schedules."""
+
+    METHOD_FLAT = "FLAT"
+    METHOD_REDUCING = "REDUCING"
+    METHOD_CHOICES = [
+        (METHOD_FLAT, "Flat rate"),
+        (METHOD_REDUCING, "Reducing balance"),
+    ]
+
+    name = models.CharField(max_length=120, unique=True)
+    interest_rate = models.DecimalField(max_digits=5, decimal_places=2, help_text="Annual interest rate in percent.")
+    term_months = models.PositiveSmallIntegerField()
+    interest_method = models.CharField(max_length=10, choices=METHOD_CHOICES, default=METHOD_REDUCING)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self):
+        return f"{self.name} ({self.interest_rate}% {self.get_interest_method_display()}, {self.term_months} months)"
+
+
+class LoanDocument(models.Model):
+    """
+    An uploaded loan document, stored once per distinct content however many loan requests attach it.
+
+    ``name`` is the document's path in the document storage backend, derived from its SHA-256.
+    Previews are rendered by ``run_document_worker``.
+    """
+
+    PREVIEW_PENDING = "PENDING"
+    PREVIEW_RUNNING = "RUNNING"
+    PREVIEW_READY = "READY"
+    PREVIEW_UNAVAILABLE = "NONE"
+    PREVIEW_FAILED = "FAILED"
+    PREVIEW_CHOICES = [
+        (PREVIEW_PENDING, "Waiting"),
+        (PREVIEW_RUNNING, "Rendering"),
+        (PREVIEW_READY, "Ready"),
+        (PREVIEW_UNAVAILABLE, "Not available for this file type"),
+        (PREVIEW_FAILED, "Failed"),
+    ]
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100)
+    preview_name = models.CharField(max_length=255, blank=True)
+    preview_status = models.CharField(max_length=10, choices=PREVIEW_CHOICES, default=PREVIEW_PENDING)
+    preview_error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["preview_status", "id"], name="loan_document_preview_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.size} bytes)"
+
+
+class LoanRequest(TrackedModel):
     STATUS_PENDING = "PENDING"
     STATUS_APPROVED = "APPROVED"
     STATUS_REJECTED = "REJECTED"
@@ -24,11 +185,15 @@ class LoanRequest(models.Model):
         (STATUS_APPROVED, "Approved"),
         (STATUS_REJECTED, "Rejected"),
     ]
+    tracked_fields = ("user", "status", "amount", "created_at")
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="loan_requests")
     name = models.CharField(max_length=120)
     id_number = models.CharField(max_length=30)
     document = models.FileField(upload_to="loan_documents/")
+    stored_document = models.ForeignKey(
+        LoanDocument, on_delete=models.PROTECT, null=True, blank=True, related_name="loan_requests"
+    )
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     purpose = models.TextField(blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
@@ -41,30 +206,58 @@ class LoanRequest(models.Model):
         related_name="reviewed_loan_requests",
     )
     reviewed_at = models.DateTimeField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    product = models.ForeignKey(
+        LoanProduct, on_delete=models.PROTECT, null=True, blank=True, related_name="loan_requests"
+    )
+    interest_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    term_months = models.PositiveSmallIntegerField(null=True, blank=True)
+    interest_method = models.CharField(max_length=10, choices=LoanProduct.METHOD_CHOICES, blank=True)
+    created_at = CreatedAtField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "-created_at", "-id"], name="loan_status_created_idx"),
+            models.Index(fields=["user", "-created_at", "-id"], name="loan_user_created_idx"),
+            models.Index(fields=["-created_at", "-id"], name="loan_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.amount} ({self.status})"
 
+    @property
+    def has_terms(self):
+        return self.interest_rate is not None and bool(self.term_months) and bool(self.interest_method)
+
+    def apply_product_terms(self):
+        if self.product is not None:
+            self.interest_rate = self.product.interest_rate
+            self.term_months = self.product.term_months
+            self.interest_method = self.product.interest_method
+
 
-class Transaction(models.Model):
+class Transaction(TrackedModel):
     TYPE_DEPOSIT = "DEPOSIT"
     TYPE_LOAN_DISBURSEMENT = "LOAN_DISBURSEMENT"
     TYPE_LOAN_REPAYMENT = "LOAN_REPAYMENT"
+    TYPE_DIVIDEND = "DIVIDEND"
+    TYPE_PENALTY = "PENALTY"
     TYPE_CHOICES = [
         (TYPE_DEPOSIT, "Deposit"),
         (TYPE_LOAN_DISBURSEMENT, "Loan Disbursement"),
         (TYPE_LOAN_REPAYMENT, "Loan Repayment"),
+        (TYPE_DIVIDEND, "Savings Dividend"),
+        (TYPE_PENALTY, "Late Repayment Penalty"),
     ]
     STATUS_PENDING = "PENDING"
     STATUS_COMPLETED = "COMPLETED"
+    STATUS_FAILED = "FAILED"
     STATUS_CHOICES = [
         (STATUS_PENDING, "Pending payment"),
         (STATUS_COMPLETED, "Completed"),
+        (STATUS_FAILED, "Failed"),
     ]
+    tracked_fields = ("user", "transaction_type", "status", "amount", "created_at")
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="transactions")
     transaction_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
@@ -73,19 +266,314 @@ class Transaction(models.Model):
     phone_number = models.CharField(max_length=20, blank=True)
     payment_reference = models.CharField(max_length=120, blank=True)
     description = models.CharField(max_length=255, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = CreatedAtField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "-created_at", "-id"], name="txn_user_created_idx"),
+            models.Index(fields=["-created_at"], name="txn_created_idx"),
+            models.Index(fields=["status", "created_at"], name="txn_status_created_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["payment_reference"],
+                condition=~models.Q(payment_reference=""),
+                name="txn_payment_reference_uniq",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.transaction_type} - {self.amount}"
 
 
 class UserLoanLimit(models.Model):
+    """
+    A member's borrowing limit, normally derived by ``FinanceApp.loan_limits``.
+
+    ``is_manual`` rows were set by an admin and are left alone by the scoring
+    engine; ``needs_scoring`` marks members whose ledger changed since their
+    limit was last scored.
+    """
+
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="loan_limit")
     amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    is_manual = models.BooleanField(default=False)
+    needs_scoring = models.BooleanField(default=True)
+    scored_at = models.DateTimeField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user"], condition=models.Q(needs_scoring=True), name="loanlimit_needs_scoring_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user.username} loan limit: {self.amount if self.amount is not None else 'None'}"
+
+
+class RepaymentInstalment(models.Model):
+    """One scheduled repayment of an approved loan; ``amount_paid`` is allocated from the member's repayments."""
+
+    loan = models.ForeignKey(LoanRequest, on_delete=models.CASCADE, related_name="instalments")
+    number = models.PositiveSmallIntegerField()
+    due_date = models.DateField()
+    principal_due = models.DecimalField(max_digits=12, decimal_places=2)
+    interest_due = models.DecimalField(max_digits=12, decimal_places=2)
+    amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["loan", "number"]
+        constraints = [
+            models.UniqueConstraint(fields=["loan", "number"], name="instalment_loan_number_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["due_date"], name="instalment_due_idx"),
+        ]
+
+    @property
+    def amount_due(self):
+        return self.principal_due + self.interest_due
+
+    @property
+    def balance(self):
+        return self.amount_due - self.amount_paid
+
+    def __str__(self):
+        return f"{self.loan_id} #{self.number} due {self.due_date}: {self.amount_due}"
+
+
+class MemberBalance(models.Model):
+    """Running per-member totals, kept in step with savings and transaction writes."""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="balance")
+    total_saved = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_disbursed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_repaid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} balance: saved {self.total_saved}, outstanding {self.outstanding}"
+
+
+class AnalyticsRollup(models.Model):
+    """Daily counts and sums per metric, category and status, read by the analytics dashboard."""
+
+    METRIC_TRANSACTION = "transaction"
+    METRIC_LOAN_REQUEST = "loan_request"
+    METRIC_LOAN_APPLICANT = "loan_applicant"
+    METRIC_CHOICES = [
+        (METRIC_TRANSACTION, "Transactions"),
+        (METRIC_LOAN_REQUEST, "Loan requests"),
+        (METRIC_LOAN_APPLICANT, "First-time loan applicants"),
+    ]
+
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    period = models.DateField()
+    category = models.CharField(max_length=20, blank=True)
+    status = models.CharField(max_length=10, blank=True)
+    count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["metric", "period"]
+        constraints = [
+            models.UniqueConstraint(fields=["metric", "period", "category", "status"], name="analytics_rollup_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} {self.period} {self.category} {self.status}: {self.count}"
+
+
+class PaymentJob(models.Model):
+    """A queued STK push for a pending transaction, drained by ``run_payment_worker``."""
+
+    STATUS_QUEUED = "QUEUED"
+    STATUS_RUNNING = "RUNNING"
+    STATUS_SENT = "SENT"
+    STATUS_FAILED = "FAILED"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Sending"),
+        (STATUS_SENT, "Sent to phone"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name="payment_job")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    callback_url = models.URLField(max_length=255)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["next_attempt_at", "id"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="payment_job_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"Payment job {self.id} for transaction {self.transaction_id} ({self.status})"
+
+
+class ProcessedCallback(models.Model):
+    """One row per STK callback applied, so replays are rejected by a unique index lookup."""
+
+    checkout_request_id = models.CharField(max_length=120, unique=True)
+    mpesa_receipt_number = models.CharField(max_length=40, blank=True)
+    result_code = models.IntegerField()
+    result_desc = models.CharField(max_length=255, blank=True)
+    transaction = models.ForeignKey(
+        Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name="callbacks"
+    )
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-received_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["mpesa_receipt_number"],
+                condition=~models.Q(mpesa_receipt_number=""),
+                name="callback_receipt_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.checkout_request_id} ({self.result_code})"
+
+
+class LedgerImport(models.Model):
+    """Progress of one ``import_ledger`` source, advanced in the same transaction as each imported chunk."""
+
+    KIND_SAVINGS = "savings"
+    KIND_TRANSACTIONS = "transactions"
+    KIND_LOANS = "loans"
+    KIND_CHOICES = [
+        (KIND_SAVINGS, "Savings records"),
+        (KIND_TRANSACTIONS, "Transactions"),
+        (KIND_LOANS, "Loan requests"),
+    ]
+
+    source = models.CharField(max_length=255, unique=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    rows_read = models.PositiveBigIntegerField(default=0)
+    rows_imported = models.PositiveBigIntegerField(default=0)
+    rows_rejected = models.PositiveBigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.source} ({self.rows_imported} imported, {self.rows_rejected} rejected)"
+
+
+class SearchEntry(models.Model):
+    """
+    One member, loan request or transaction in the staff search index (see ``FinanceApp.search``).
+
+    ``terms`` holds the normalised words typeahead matches on. It is indexed by an FTS5 table on
+    SQLite and a GIN ``tsvector`` index on PostgreSQL, both created by migration 0016. Altering
+    this table on SQLite makes Django rebuild it, which drops the FTS triggers: such a
+    migration must create them again.
+    """
+
+    KIND_MEMBER = "member"
+    KIND_LOAN = "loan"
+    KIND_TRANSACTION = "transaction"
+    KIND_CHOICES = [
+        (KIND_MEMBER, "Member"),
+        (KIND_LOAN, "Loan request"),
+        (KIND_TRANSACTION, "Transaction"),
+    ]
+
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    title = models.CharField(max_length=255)
+    detail = models.CharField(max_length=255, blank=True)
+    terms = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="search_entry_object_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.object_id}: {self.title}"
+
+
+class LedgerPartition(models.Model):
+    """
+    One closed month of completed transactions moved out of ``Transaction`` by ``archive_ledger``.
+
+    The rows live in their own read-only table (see ``FinanceApp.ledger_archive``). ``row_count``,
+    ``total_amount`` and ``checksum`` are advanced in the same transaction as each archived chunk,
+    so re-reading the table and comparing proves nothing was lost or altered.
+    """
+
+    month = models.DateField(unique=True)
+    table_name = models.CharField(max_length=63, unique=True)
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    row_count = models.PositiveBigIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    checksum = models.CharField(max_length=16, default="0" * 16)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    verified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-month"]
+        indexes = [
+            models.Index(fields=["starts_at", "ends_at"], name="ledger_partition_range_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}: {self.row_count} transactions in {self.table_name}"
+
+
+class TransactionTrend(models.Model):
+    """
+    Monthly count and sum of transactions per type and status, served by the trend API.
+
+    Refreshed by ``refresh_transaction_trends`` from the rows above ``TrendWatermark.last_id``
+    (see ``FinanceApp.trends``); rows above the mark are added at read time.
+    """
+
+    month = models.DateField()
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TYPE_CHOICES)
+    status = models.CharField(max_length=10, choices=Transaction.STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["month", "transaction_type", "status"]
+        constraints = [
+            models.UniqueConstraint(fields=["month", "transaction_type", "status"], name="transaction_trend_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.transaction_type} {self.status}: {self.count}"
+
+
+class TrendWatermark(models.Model):
+    """
+    The highest ``Transaction`` id already folded into a summary table, and the ids at or below
+    it that were still pending when passed and so are not folded in yet.
+    """
+
+    TRANSACTIONS = "transactions"
+
+    name = models.CharField(max_length=40, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    pending_ids = models.JSONField(default=list, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} through #{self.last_id}"
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from . import search
+from .models import PaymentJob, Transaction
+from .payments import PaymentGatewayError, get_payment_backend
+
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_REFERENCE = "FinanceApp"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2x base, 4x base ... capped at the configured maximum."""
+    base = _setting("PAYMENT_JOB_RETRY_BASE_SECONDS", 15)
+    cap = _setting("PAYMENT_JOB_RETRY_MAX_SECONDS", 600)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), cap))
+
+
+def transaction_description(payment_type):
+    return "Loan repay" if payment_type == Transaction.TYPE_LOAN_REPAYMENT else "Savings"
+
+
+def enqueue_stk_push(user, payment_type, amount, phone_number, callback_url):
+    """Record the pending transaction and queue its STK push. Returns the ``PaymentJob``."""
+    with db_transaction.atomic():
+        pending = Transaction.objects.create(
+            user=user,
+            transaction_type=payment_type,
+            status=Transaction.STATUS_PENDING,
+            amount=amount,
+            phone_number=phone_number,
+            description=f"STK push initiated for {transaction_description(payment_type).lower()}",
+        )
+        return PaymentJob.objects.create(
+            transaction=pending,
+            callback_url=callback_url,
+            max_attempts=_setting("PAYMENT_JOB_MAX_ATTEMPTS", 5),
+        )
+
+
+def requeue_stale_jobs(now=None):
+    """Put back jobs left RUNNING by a worker that died mid-push."""
+    now = now or timezone.now()
+    timeout = timedelta(seconds=_setting("PAYMENT_JOB_RUNNING_TIMEOUT_SECONDS", 300))
+    return PaymentJob.objects.filter(status=PaymentJob.STATUS_RUNNING, updated_at__lt=now - timeout).update(
+        status=PaymentJob.STATUS_QUEUED, next_attempt_at=now, updated_at=now
+    )
+
+
+def claim_due_jobs(limit, now=None):
+    """
+    Claim up to ``limit`` due jobs for this worker.
+
+    Each job is claimed with a conditional ``UPDATE ... WHERE status='QUEUED'`` so
+    several workers can drain the queue without taking the same job twice.
+    """
+    now = now or timezone.now()
+    candidate_ids = list(
+        PaymentJob.objects.filter(status=PaymentJob.STATUS_QUEUED, next_attempt_at__lte=now)
+        .order_by("next_attempt_at", "id")
+        .values_list("id", flat=True)[:limit]
+    )
+    claimed = []
+    for job_id in candidate_ids:
+        if PaymentJob.objects.filter(id=job_id, status=PaymentJob.STATUS_QUEUED).update(
+            status=PaymentJob.STATUS_RUNNING, updated_at=now
+        ):
+            claimed.append(job_id)
+    return list(PaymentJob.objects.filter(id__in=claimed).select_related("transaction"))
+
+
+def _push_arguments(job):
+    pending = job.transaction
+    return (
+        pending.phone_number,
+        int(pending.amount),
+        ACCOUNT_REFERENCE,
+        transaction_description(pending.transaction_type),
+        job.callback_url,
+    )
+
+
+def run_job(job, backend):
+    """Send one claimed job's STK push and record the outcome."""
+    try:
+        result = backend.stk_push(*_push_arguments(job))
+    except PaymentGatewayError as exc:
+        return record_outcome(job, error=exc)
+    return record_outcome(job, result)
+
+
+async def arun_job(job, backend):
+    """``run_job`` for the event loop: the push is awaited, the bookkeeping runs on the ORM thread."""
+    try:
+        result = await backend.astk_push(*_push_arguments(job))
+    except PaymentGatewayError as exc:
+        return await sync_to_async(record_outcome)(job, error=exc)
+    return await sync_to_async(record_outcome)(job, result)
+
+
+def record_outcome(job, result=None, error=None):
+    """Record a push attempt: the gateway's ``result``, or the ``PaymentGatewayError`` it raised."""
+    pending = job.transaction
+    job.attempts += 1
+    if error is not None:
+        job.last_error = str(error)[:255]
+        if job.attempts < job.max_attempts:
+            job.status = PaymentJob.STATUS_QUEUED
+            job.next_attempt_at = timezone.now() + retry_delay(job.attempts)
+            job.save(update_fields=["status", "attempts", "last_error", "next_attempt_at", "updated_at"])
+            logger.warning("STK push for job %s failed, retrying: %s", job.id, error)
+            return job
+        _fail(job, f"STK push failed after {job.attempts} attempts.")
+        return job
+
+    if not result.accepted:
+        job.last_error = (result.message or "STK request was not accepted.")[:255]
+        _fail(job, f"STK push failed: {job.last_error}")
+        return job
+
+    with db_transaction.atomic():
+        job.status = PaymentJob.STATUS_SENT
+        job.last_error = ""
+        job.save(update_fields=["status", "attempts", "last_error", "updated_at"])
+        Transaction.objects.filter(pk=pending.pk).update(payment_reference=result.checkout_request_id)
+        search.reindex(Transaction, [pending.pk])
+    pending.payment_reference = result.checkout_request_id
+    return job
+
+
+def _fail(job, description):
+    with db_transaction.atomic():
+        job.status = PaymentJob.STATUS_FAILED
+        job.save(update_fields=["status", "attempts", "last_error", "updated_at"])
+        pending = job.transaction
+        pending.status = Transaction.STATUS_FAILED
+        pending.description = description[:255]
+        pending.save(update_fields=["status", "description"])
+    logger.warning("Payment job %s failed: %s", job.id, job.last_error)
+
+
+def drain(backend=None, batch_size=20):
+    """Process every job that is currently due. Returns the number of jobs run."""
+    backend = backend or get_payment_backend()
+    requeue_stale_jobs()
+    processed = 0
+    while True:
+        jobs = claim_due_jobs(batch_size)
+        if not jobs:
+            return processed
+        for job in jobs:
+            run_job(job, backend)
+            processed += 1
+
+
+async def adrain(backend=None, batch_size=20, concurrency=10):
+    """
+    ``drain`` on an event loop, keeping up to ``concurrency`` STK pushes in flight at once.
+
+    Pushes wait on the gateway concurrently; claiming jobs and recording their
+    outcomes still go through the ORM one at a time on its sync thread.
+    Returns the number of jobs run.
+    """
+    backend = backend or get_payment_backend()
+    await sync_to_async(requeue_stale_jobs)()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        async with slots:
+            await arun_job(job, backend)
+
+    processed = 0
+    while True:
+        jobs = await sync_to_async(claim_due_jobs)(max(batch_size, concurrency))
+        if not jobs:
+            return processed
+        await asyncio.gather(*(run(job) for job in jobs))
+        processed += len(jobs)
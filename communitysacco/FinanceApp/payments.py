@@ -0,0 +1,428 @@
+import asyncio
+import base64
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from django_daraja.mpesa.exceptions import IllegalPhoneNumberException, MpesaConfigurationException
+from django_daraja.mpesa.utils import api_base_url, format_phone_number, mpesa_config
+from requests.adapters import HTTPAdapter
+
+from .callbacks import StkCallback
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = "FinanceApp.payments.DarajaBackend"
+
+# Daraja answers an STK query with this error code until the customer acts on the prompt.
+QUERY_STILL_PROCESSING = "500.001.1001"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class PaymentGatewayError(Exception):
+    """The gateway could not be reached or failed mid-request; the push may be retried."""
+
+
+@contextmanager
+def _configured():
+    """Report missing or invalid M-Pesa settings as gateway errors, so workers record them on the job."""
+    try:
+        yield
+    except MpesaConfigurationException as exc:
+        raise PaymentGatewayError(str(exc)) from exc
+
+
+class StkPushResult:
+    def __init__(self, accepted, checkout_request_id="", message=""):
+        self.accepted = accepted
+        self.checkout_request_id = checkout_request_id
+        self.message = message
+
+    def __repr__(self):
+        return f"StkPushResult(accepted={self.accepted!r}, checkout_request_id={self.checkout_request_id!r})"
+
+
+def extract_checkout_id(response):
+    if isinstance(response, dict):
+        return (
+            response.get("CheckoutRequestID")
+            or response.get("checkout_request_id")
+            or response.get("checkoutRequestID")
+            or ""
+        )
+
+    checkout_from_attr = getattr(response, "checkout_request_id", None)
+    if checkout_from_attr:
+        return str(checkout_from_attr)
+
+    response_data = getattr(response, "response", None)
+    if isinstance(response_data, dict):
+        return str(
+            response_data.get("CheckoutRequestID")
+            or response_data.get("checkout_request_id")
+            or response_data.get("checkoutRequestID")
+            or ""
+        )
+
+    return ""
+
+
+class GatewayMetrics:
+    """In-process call counts and latencies per gateway operation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    @contextmanager
+    def timed(self, operation):
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                stats = self._calls.setdefault(
+                    operation, {"count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+                )
+                stats["count"] += 1
+                stats["errors"] += int(failed)
+                stats["total_seconds"] += elapsed
+                stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+            logger.debug("Daraja %s took %.1f ms%s", operation, elapsed * 1000, " (failed)" if failed else "")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                operation: dict(stats, avg_seconds=stats["total_seconds"] / stats["count"] if stats["count"] else 0.0)
+                for operation, stats in self._calls.items()
+            }
+
+
+class DarajaBackend:
+    """
+    Sends STK pushes to Safaricom, reusing one OAuth token and one HTTP connection pool.
+
+    The access token is shared between workers through Django's cache and
+    refreshed shortly before it expires, so a push normally costs a single
+    upstream round trip. ``get_payment_backend`` keeps one instance per process.
+
+    ``astk_push`` is the asyncio counterpart of ``stk_push``; it sends through an
+    ``httpx.AsyncClient`` so one event loop can keep many pushes in flight.
+    Call ``aclose`` before that event loop ends.
+    """
+
+    TOKEN_CACHE_KEY = "payments:daraja:access_token"
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=_setting("PAYMENT_HTTP_POOL_SIZE", 10))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timeout = _setting("PAYMENT_HTTP_TIMEOUT_SECONDS", 30)
+        self.metrics = GatewayMetrics()
+        self._token_lock = threading.Lock()
+        self._async_client = None
+        self._async_token_lock = None
+
+    def api_url(self, path):
+        with _configured():
+            return (_setting("MPESA_API_BASE_URL", "") or api_base_url()).rstrip("/") + "/" + path
+
+    def _token_request(self):
+        url = self.api_url("oauth/v1/generate?grant_type=client_credentials")
+        with _configured():
+            return url, (mpesa_config("MPESA_CONSUMER_KEY"), mpesa_config("MPESA_CONSUMER_SECRET"))
+
+    def _store_token(self, payload):
+        try:
+            token = payload["access_token"]
+            expires_in = int(payload.get("expires_in", 3599))
+        except (AttributeError, KeyError, TypeError, ValueError) as exc:
+            raise PaymentGatewayError(f"Unexpected access token response: {exc!r}") from exc
+        margin = _setting("MPESA_TOKEN_REFRESH_MARGIN_SECONDS", 120)
+        cache.set(self.TOKEN_CACHE_KEY, token, max(expires_in - margin, 1))
+        return token
+
+    def access_token(self, force_refresh=False):
+        if not force_refresh:
+            token = cache.get(self.TOKEN_CACHE_KEY)
+            if token:
+                return token
+
+        with self._token_lock:
+            if not force_refresh:
+                token = cache.get(self.TOKEN_CACHE_KEY)
+                if token:
+                    return token
+
+            url, auth = self._token_request()
+            try:
+                with self.metrics.timed("oauth"):
+                    response = self.session.get(url, auth=auth, timeout=self.timeout)
+                    response.raise_for_status()
+                    payload = response.json()
+            except (requests.RequestException, ValueError) as exc:
+                raise PaymentGatewayError(f"Unable to generate access token: {exc}") from exc
+            return self._store_token(payload)
+
+    def _post(self, operation, url, payload):
+        token = self.access_token()
+        for attempt in range(2):
+            try:
+                with self.metrics.timed(operation):
+                    response = self.session.post(
+                        url, json=payload, headers={"Authorization": f"Bearer {token}"}, timeout=self.timeout
+                    )
+            except requests.RequestException as exc:
+                raise PaymentGatewayError(str(exc) or exc.__class__.__name__) from exc
+            if response.status_code != 401 or attempt:
+                return response
+            # The cached token was revoked or expired early; fetch a new one once.
+            token = self.access_token(force_refresh=True)
+
+    def _async_http(self):
+        if self._async_client is None:
+            import httpx  # Only the async payment path needs httpx.
+
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=_setting("PAYMENT_ASYNC_HTTP_POOL_SIZE", 100)),
+            )
+            self._async_token_lock = asyncio.Lock()
+        return self._async_client
+
+    async def aclose(self):
+        """Close the async HTTP client; the next async call opens a new one."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = self._async_token_lock = None
+
+    async def aaccess_token(self, force_refresh=False):
+        client = self._async_http()
+        if not force_refresh:
+            token = await cache.aget(self.TOKEN_CACHE_KEY)
+            if token:
+                return token
+
+        async with self._async_token_lock:
+            if not force_refresh:
+                token = await cache.aget(self.TOKEN_CACHE_KEY)
+                if token:
+                    return token
+
+            import httpx
+
+            url, auth = self._token_request()
+            try:
+                with self.metrics.timed("oauth"):
+                    response = await client.get(url, auth=auth)
+                    response.raise_for_status()
+                    payload = response.json()
+            except (httpx.HTTPError, ValueError) as exc:
+                raise PaymentGatewayError(f"Unable to generate access token: {exc}") from exc
+            return self._store_token(payload)
+
+    async def _apost(self, operation, url, payload):
+        import httpx
+
+        client = self._async_http()
+        token = await self.aaccess_token()
+        for attempt in range(2):
+            try:
+                with self.metrics.timed(operation):
+                    response = await client.post(url, json=payload, headers={"Authorization": f"Bearer {token}"})
+            except httpx.HTTPError as exc:
+                raise PaymentGatewayError(str(exc) or exc.__class__.__name__) from exc
+            if response.status_code != 401 or attempt:
+                return response
+            token = await self.aaccess_token(force_refresh=True)
+
+    def _express_credentials(self):
+        with _configured():
+            if mpesa_config("MPESA_ENVIRONMENT") == "sandbox":
+                business_short_code = mpesa_config("MPESA_EXPRESS_SHORTCODE")
+            else:
+                business_short_code = mpesa_config("MPESA_SHORTCODE")
+            passkey = mpesa_config("MPESA_PASSKEY")
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        password = base64.b64encode((business_short_code + passkey + timestamp).encode("ascii")).decode("utf-8")
+        return business_short_code, password, timestamp
+
+    def _stk_push_payload(self, phone_number, amount, account_reference, transaction_desc, callback_url):
+        """Validate a push and build its request body. Returns ``(payload, None)`` or ``(None, rejection)``."""
+        if not str(account_reference).strip() or not str(transaction_desc).strip():
+            return None, StkPushResult(False, message="Account reference and description are required.")
+        if not isinstance(amount, int):
+            return None, StkPushResult(False, message="Amount must be an integer")
+        try:
+            phone_number = format_phone_number(phone_number)
+        except IllegalPhoneNumberException as exc:
+            return None, StkPushResult(False, message=str(exc))
+
+        business_short_code, password, timestamp = self._express_credentials()
+        return {
+            "BusinessShortCode": business_short_code,
+            "Password": password,
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": amount,
+            "PartyA": phone_number,
+            "PartyB": business_short_code,
+            "PhoneNumber": phone_number,
+            "CallBackURL": callback_url,
+            "AccountReference": account_reference,
+            "TransactionDesc": transaction_desc,
+        }, None
+
+    def _stk_push_result(self, response):
+        """Turn a ``requests`` or ``httpx`` response to a push into an ``StkPushResult``."""
+        try:
+            data = response.json()
+        except ValueError as exc:
+            raise PaymentGatewayError(f"Unexpected gateway response ({response.status_code}).") from exc
+        if not isinstance(data, dict):
+            raise PaymentGatewayError(f"Unexpected gateway response ({response.status_code}).")
+
+        if str(data.get("ResponseCode") or "") != "0":
+            problem_text = (
+                data.get("errorMessage")
+                or data.get("ResponseDescription")
+                or data.get("CustomerMessage")
+                or "STK request was not accepted."
+            )
+            return StkPushResult(False, message=problem_text)
+        return StkPushResult(True, extract_checkout_id(data), data.get("CustomerMessage") or "")
+
+    def stk_push(self, phone_number, amount, account_reference, transaction_desc, callback_url):
+        payload, rejection = self._stk_push_payload(phone_number, amount, account_reference, transaction_desc, callback_url)
+        if rejection is not None:
+            return rejection
+        response = self._post("stk_push", self.api_url("mpesa/stkpush/v1/processrequest"), payload)
+        return self._stk_push_result(response)
+
+    async def astk_push(self, phone_number, amount, account_reference, transaction_desc, callback_url):
+        payload, rejection = self._stk_push_payload(phone_number, amount, account_reference, transaction_desc, callback_url)
+        if rejection is not None:
+            return rejection
+        response = await self._apost("stk_push", self.api_url("mpesa/stkpush/v1/processrequest"), payload)
+        return self._stk_push_result(response)
+
+    def stk_query(self, checkout_request_id):
+        """
+        Ask Daraja for the final result of an STK push.
+
+        Returns an ``StkCallback`` once the customer has completed or abandoned
+        the prompt, or ``None`` while the push is still being processed.
+        """
+        business_short_code, password, timestamp = self._express_credentials()
+        payload = {
+            "BusinessShortCode": business_short_code,
+            "Password": password,
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id,
+        }
+        response = self._post("stk_query", self.api_url("mpesa/stkpushquery/v1/query"), payload)
+        try:
+            data = response.json()
+        except ValueError as exc:
+            raise PaymentGatewayError(f"Unexpected gateway response ({response.status_code}).") from exc
+        if not isinstance(data, dict):
+            raise PaymentGatewayError(f"Unexpected gateway response ({response.status_code}).")
+
+        if data.get("errorCode") == QUERY_STILL_PROCESSING:
+            return None
+        try:
+            result_code = int(data["ResultCode"])
+        except (KeyError, TypeError, ValueError):
+            raise PaymentGatewayError(
+                data.get("errorMessage") or f"Unexpected gateway response ({response.status_code})."
+            )
+        return StkCallback(checkout_request_id, result_code, str(data.get("ResultDesc") or ""))
+
+
+class FakeDarajaBackend:
+    """
+    Offline stand-in for Daraja used in tests and local development.
+
+    Every push is accepted with a sequential checkout request ID, except phone
+    numbers ending in ``REJECT_SUFFIX`` (rejected by the "gateway") and
+    ``ERROR_SUFFIX`` (raises ``PaymentGatewayError`` as a dropped connection
+    would). Sent pushes are recorded on ``FakeDarajaBackend.sent``.
+
+    STK queries report success unless ``query_results`` maps the checkout
+    request ID to another result code, or to ``None`` for "still processing".
+    """
+
+    REJECT_SUFFIX = "0000"
+    ERROR_SUFFIX = "9999"
+
+    sent = []
+    query_results = {}
+    _counter = itertools.count(1)
+    _lock = threading.Lock()
+
+    def stk_push(self, phone_number, amount, account_reference, transaction_desc, callback_url):
+        if str(phone_number).endswith(self.ERROR_SUFFIX):
+            raise PaymentGatewayError("Connection failed")
+        if str(phone_number).endswith(self.REJECT_SUFFIX):
+            return StkPushResult(False, message="Invalid PhoneNumber")
+
+        with self._lock:
+            checkout_request_id = f"ws_CO_FAKE_{next(self._counter):010d}"
+            self.sent.append(
+                {
+                    "phone_number": phone_number,
+                    "amount": amount,
+                    "account_reference": account_reference,
+                    "transaction_desc": transaction_desc,
+                    "callback_url": callback_url,
+                    "checkout_request_id": checkout_request_id,
+                }
+            )
+        return StkPushResult(True, checkout_request_id, "Success. Request accepted for processing")
+
+    async def astk_push(self, phone_number, amount, account_reference, transaction_desc, callback_url):
+        return self.stk_push(phone_number, amount, account_reference, transaction_desc, callback_url)
+
+    async def aclose(self):
+        pass
+
+    def stk_query(self, checkout_request_id):
+        result_code = self.query_results.get(checkout_request_id, 0)
+        if result_code is None:
+            return None
+        result_desc = "The service request is processed successfully." if result_code == 0 else "Request cancelled by user"
+        return StkCallback(checkout_request_id, result_code, result_desc)
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.sent.clear()
+            cls.query_results.clear()
+
+
+def get_payment_backend():
+    """Return this process's shared instance of the configured gateway backend."""
+    return _backend_instance(_setting("PAYMENT_GATEWAY_BACKEND", DEFAULT_BACKEND))
+
+
+@lru_cache(maxsize=None)
+def _backend_instance(path):
+    return import_string(path)()
@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import search
+from .callbacks import APPLIED, ingest_callbacks
+from .models import PaymentJob, Transaction, apply_tracked_changes
+from .payments import PaymentGatewayError, get_payment_backend
+
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Spaces calls at least ``1 / per_second`` seconds apart across threads."""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ReconcileReport:
+    def __init__(self):
+        self.queried = 0
+        self.applied = 0
+        self.still_pending = 0
+        self.errors = 0
+        self.expired = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.queried / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"Queried {self.queried} pending payments in {self.elapsed:.1f}s ({self.rate:.1f}/s): "
+            f"{self.applied} resolved, {self.still_pending} still processing, {self.errors} errors, "
+            f"{self.expired} expired without a gateway reference."
+        )
+
+
+def stale_pending(older_than, after=None, limit=100):
+    """
+    Return ``(id, created_at, payment_reference)`` for pending pushes older than ``older_than``.
+
+    Rows are read oldest first through the ``(status, created_at)`` index and
+    ``after`` is the last ``(created_at, id)`` seen, so a sweep moves past rows
+    that are still processing instead of asking about them again.
+    """
+    queryset = Transaction.objects.filter(
+        status=Transaction.STATUS_PENDING, created_at__lt=timezone.now() - older_than
+    ).exclude(payment_reference="")
+    if after is not None:
+        created_at, pk = after
+        queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+    return list(queryset.order_by("created_at", "id").values_list("id", "created_at", "payment_reference")[:limit])
+
+
+def query_payments(backend, checkout_request_ids, workers=8, rate_limit=None):
+    """
+    Query the gateway for each checkout request ID on a bounded thread pool.
+
+    Returns ``(results, still_pending, errors)`` where ``results`` holds the
+    final ``StkCallback`` for every push the customer has finished with. Only
+    gateway calls run on the pool; the database is left to the calling thread.
+    """
+    limiter = RateLimiter(rate_limit)
+
+    def query(checkout_request_id):
+        limiter.wait()
+        try:
+            return backend.stk_query(checkout_request_id), False
+        except PaymentGatewayError as exc:
+            logger.warning("STK query for %s failed: %s", checkout_request_id, exc)
+            return None, True
+
+    results = []
+    still_pending = errors = 0
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        for result, failed in pool.map(query, checkout_request_ids):
+            if failed:
+                errors += 1
+            elif result is None:
+                still_pending += 1
+            else:
+                results.append(result)
+    return results, still_pending, errors
+
+
+def expire_unsent(older_than):
+    """
+    Fail pending transactions that never got a gateway reference and have no live push job.
+
+    These can never be matched to a callback or queried, so they would otherwise
+    stay pending. Returns the number of transactions failed.
+    """
+    tracked_fields = Transaction.tracked_fields
+    with db_transaction.atomic():
+        states = list(
+            Transaction.objects.select_for_update()
+            .filter(
+                status=Transaction.STATUS_PENDING,
+                payment_reference="",
+                created_at__lt=timezone.now() - older_than,
+            )
+            .exclude(payment_job__status__in=[PaymentJob.STATUS_QUEUED, PaymentJob.STATUS_RUNNING])
+            .values("id", *tracked_fields)
+        )
+        if not states:
+            return 0
+        Transaction.objects.filter(id__in=[state["id"] for state in states]).update(
+            status=Transaction.STATUS_FAILED, description="Payment expired before it reached M-Pesa."
+        )
+        changes = []
+        for state in states:
+            previous = {field: state[field] for field in tracked_fields}
+            changes.append((previous, dict(previous, status=Transaction.STATUS_FAILED)))
+        apply_tracked_changes(Transaction, changes)
+        search.reindex(Transaction, [state["id"] for state in states])
+    return len(states)
+
+
+def reconcile_pending(
+    backend=None,
+    older_than=timedelta(minutes=5),
+    batch_size=100,
+    workers=8,
+    rate_limit=None,
+    limit=None,
+    expire_unsent_after=timedelta(hours=24),
+):
+    """
+    Resolve pending payments whose callback never arrived by querying the gateway.
+
+    Stale pending pushes are fetched in batches, queried concurrently, and the
+    final results applied in one transaction per batch through the callback
+    ingestion path, so a late real callback is recognised as a duplicate.
+    Returns a ``ReconcileReport``.
+    """
+    backend = backend or get_payment_backend()
+    report = ReconcileReport()
+    started = time.perf_counter()
+    after = None
+    while limit is None or report.queried < limit:
+        size = batch_size if limit is None else min(batch_size, limit - report.queried)
+        rows = stale_pending(older_than, after=after, limit=size)
+        if not rows:
+            break
+        after = (rows[-1][1], rows[-1][0])
+
+        results, still_pending, errors = query_payments(
+            backend, [reference for _, _, reference in rows], workers=workers, rate_limit=rate_limit
+        )
+        report.queried += len(rows)
+        report.still_pending += still_pending
+        report.errors += errors
+        if results:
+            report.applied += ingest_callbacks(results, batch_size=len(results))[APPLIED]
+
+    if expire_unsent_after is not None:
+        report.expired = expire_unsent(expire_unsent_after)
+    report.elapsed = time.perf_counter() - started
+    return report
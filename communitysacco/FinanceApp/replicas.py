@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PIN_COOKIE = "db_primary_pin"
+
+# Alias reads are routed to inside ``reading_from``; None leaves them on the default database.
+_read_alias = ContextVar("replica_read_alias", default=None)
+# The ``RequestWrites`` of the current request, set by ``tracking_writes``.
+_request_writes = ContextVar("replica_request_writes", default=None)
+
+
+class RequestWrites:
+    """Whether the current request has written to the primary yet."""
+
+    seen = False
+
+
+def replica_alias():
+    """The configured replica alias, or ``None`` when reads have nowhere else to go."""
+    alias = settings.DATABASE_REPLICA_ALIAS
+    return alias if alias and alias in connections else None
+
+
+def read_database(request=None):
+    """
+    Alias to read from for ``request``: the replica, unless none is configured or the browser is
+    pinned to the primary after one of its own writes.
+    """
+    alias = replica_alias()
+    if alias is None or (request is not None and PIN_COOKIE in request.COOKIES):
+        return DEFAULT_DB_ALIAS
+    return alias
+
+
+@contextmanager
+def reading_from(alias):
+    """Route reads that do not name a database to ``alias`` for the duration of the block."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def tracking_writes():
+    """Note whether the block writes to the primary; yields the ``RequestWrites``."""
+    writes = RequestWrites()
+    token = _request_writes.set(writes)
+    try:
+        yield writes
+    finally:
+        _request_writes.reset(token)
+
+
+def replica_reads(view):
+    """Serve a read-only view's ``GET`` requests from the replica (see ``read_database``)."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return view(request, *args, **kwargs)
+        with reading_from(read_database(request)):
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Send reads inside ``reading_from`` to its alias; everything else stays on ``default``.
+
+    Reads fall back to the primary once the current request has written, and inside a
+    transaction on the primary, so a request always sees its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or alias == DEFAULT_DB_ALIAS:
+            return None
+        writes = _request_writes.get()
+        if (writes is not None and writes.seen) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        writes = _request_writes.get()
+        if writes is not None:
+            writes.seen = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
@@ -0,0 +1,225 @@
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+
+# Upper bounds of the wall-time histogram buckets, in seconds (Prometheus' defaults).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WORKERS_KEY = "request-metrics:workers"
+UNRESOLVED = "<unresolved>"
+
+current_request = ContextVar("current_request_stats", default=None)
+
+
+class RequestStats:
+    """What one request spent, filled in by the middleware, ``record_query`` and the template backend."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_seconds += time.perf_counter() - started
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper on every connection: times the query against the current request, if any."""
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.record_query(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def _wrap_connection(sender, connection, **kwargs):
+    # Installed per connection rather than around the request: async views query through
+    # sync_to_async threads with their own connections, which the middleware cannot reach.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current_request.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.render_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` that adds each top-level template render to the current request's stats."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def _empty_route():
+    return {
+        "count": 0,
+        "queries": 0,
+        "max_queries": 0,
+        "sql_seconds": 0.0,
+        "render_seconds": 0.0,
+        "wall_seconds": 0.0,
+        "buckets": [0] * (len(BUCKETS) + 1),
+    }
+
+
+class RouteHistogram:
+    """
+    This process's cumulative per-route totals and wall-time histogram.
+
+    ``flush`` publishes the whole snapshot to the cache under a per-worker key
+    (snapshots are cumulative, so a lost or repeated flush is harmless), and
+    ``collect`` sums the snapshots of every worker that has flushed recently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._last_flush = 0.0
+        self.worker_key = f"request-metrics:worker:{socket.gethostname()}:{os.getpid()}"
+
+    def record(self, route, stats, wall_seconds):
+        with self._lock:
+            totals = self._routes.setdefault(route, _empty_route())
+            totals["count"] += 1
+            totals["queries"] += stats.queries
+            totals["max_queries"] = max(totals["max_queries"], stats.queries)
+            totals["sql_seconds"] += stats.sql_seconds
+            totals["render_seconds"] += stats.render_seconds
+            totals["wall_seconds"] += wall_seconds
+            totals["buckets"][bisect_left(BUCKETS, wall_seconds)] += 1
+            due = time.monotonic() - self._last_flush >= settings.REQUEST_METRICS_FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {route: dict(totals, buckets=list(totals["buckets"])) for route, totals in self._routes.items()}
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+        timeout = settings.REQUEST_METRICS_WORKER_TTL_SECONDS
+        cache.set(self.worker_key, self.snapshot(), timeout)
+        workers = cache.get(WORKERS_KEY) or []
+        if self.worker_key not in workers:
+            # Racing workers may drop each other here; each re-adds itself on its next flush.
+            cache.set(WORKERS_KEY, [*workers, self.worker_key], timeout)
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._last_flush = 0.0
+        cache.delete(self.worker_key)
+
+
+histogram = RouteHistogram()
+
+
+def collect():
+    """Per-route totals summed across every worker's last flushed snapshot, busiest routes first."""
+    histogram.flush()
+    workers = cache.get(WORKERS_KEY) or []
+    snapshots = cache.get_many(workers)
+    live = [key for key in workers if key in snapshots]
+    if len(live) != len(workers):
+        cache.set(WORKERS_KEY, live, settings.REQUEST_METRICS_WORKER_TTL_SECONDS)
+
+    routes = {}
+    for snapshot in snapshots.values():
+        for route, totals in snapshot.items():
+            merged = routes.setdefault(route, _empty_route())
+            for field in ("count", "queries", "sql_seconds", "render_seconds", "wall_seconds"):
+                merged[field] += totals[field]
+            merged["max_queries"] = max(merged["max_queries"], totals["max_queries"])
+            merged["buckets"] = [a + b for a, b in zip(merged["buckets"], totals["buckets"])]
+    return dict(sorted(routes.items(), key=lambda item: -item[1]["count"]))
+
+
+def bucket_quantile(buckets, quantile):
+    """Upper bound of the bucket holding ``quantile`` of the requests, or ``None`` past the last bound."""
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    seen = 0
+    for bound, count in zip(BUCKETS, buckets):
+        seen += count
+        if seen >= quantile * total:
+            return bound
+    return None
+
+
+def route_rows(routes):
+    """Per-route averages for the staff metrics page."""
+    rows = []
+    for route, totals in routes.items():
+        count = totals["count"] or 1
+        p95 = bucket_quantile(totals["buckets"], 0.95)
+        rows.append(
+            {
+                "route": route,
+                "count": totals["count"],
+                "avg_queries": totals["queries"] / count,
+                "max_queries": totals["max_queries"],
+                "avg_sql_ms": totals["sql_seconds"] * 1000 / count,
+                "avg_render_ms": totals["render_seconds"] * 1000 / count,
+                "avg_wall_ms": totals["wall_seconds"] * 1000 / count,
+                "p95_wall_ms": p95 * 1000 if p95 is not None else None,
+            }
+        )
+    return rows
+
+
+def _label(route):
+    return route.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def prometheus_text(routes):
+    """Render ``collect()`` output in the Prometheus text exposition format."""
+    lines = [
+        "# HELP sacco_request_duration_seconds Wall time of requests by URL name.",
+        "# TYPE sacco_request_duration_seconds histogram",
+    ]
+    for route, totals in routes.items():
+        label = _label(route)
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, "+Inf"), totals["buckets"]):
+            cumulative += count
+            lines.append(f'sacco_request_duration_seconds_bucket{{route="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'sacco_request_duration_seconds_sum{{route="{label}"}} {totals["wall_seconds"]:.6f}')
+        lines.append(f'sacco_request_duration_seconds_count{{route="{label}"}} {totals["count"]}')
+    for name, field, help_text in (
+        ("sacco_request_queries_total", "queries", "Database queries run by requests."),
+        ("sacco_request_sql_seconds_total", "sql_seconds", "Time spent in database queries."),
+        ("sacco_request_render_seconds_total", "render_seconds", "Time spent rendering templates."),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for route, totals in routes.items():
+            value = totals[field]
+            lines.append(f'{name}{{route="{_label(route)}"}} {value if isinstance(value, int) else f"{value:.6f}"}')
+    return "\n".join(lines) + "\n"
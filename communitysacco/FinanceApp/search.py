@@ -0,0 +1,284 @@
+import re
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from Authapp.models import MemberProfile
+
+from .models import LoanRequest, SearchEntry, Transaction
+
+
+FTS_TABLE = "FinanceApp_searchentry_fts"
+MIN_QUERY_LENGTH = 2
+BATCH_SIZE = 500
+
+# Fields each entry is built from; saves that touch none of them (e.g. a login bumping
+# ``last_login``, a new description) leave the index alone.
+INDEXED_FIELDS = {
+    User: {"username", "first_name", "last_name"},
+    MemberProfile: {"user", "user_id", "phone_number", "membership_number"},
+    LoanRequest: {"user", "user_id", "name", "id_number", "amount", "status"},
+    Transaction: {"user", "user_id", "phone_number", "payment_reference", "status"},
+}
+
+
+def words(*values):
+    """
+    Lower-cased words of ``values`` with punctuation dropped, so a receipt typed as
+    ``QGH7-XK2`` or ``qgh7xk2`` matches the same term. Queries are split the same way.
+    """
+    found = []
+    for value in values:
+        for part in str(value or "").lower().split():
+            word = re.sub(r"[\W_]+", "", part)
+            if word:
+                found.append(word)
+    return found
+
+
+def phone_terms(phone_number):
+    """A phone number in every form staff type it: +254712..., 254712..., 0712... and 712..."""
+    digits = re.sub(r"\D", "", phone_number or "")
+    if not digits:
+        return []
+    if digits.startswith("254"):
+        local = digits[3:]
+    elif digits.startswith("0"):
+        local = digits[1:]
+    else:
+        local = digits
+    return sorted({digits, local, f"0{local}", f"254{local}"})
+
+
+def _entry(kind, instance, user_id, title, detail, terms):
+    if not terms:
+        return None
+    return SearchEntry(
+        kind=kind,
+        object_id=instance.pk,
+        user_id=user_id,
+        title=title[:255],
+        detail=detail[:255],
+        terms=" ".join(dict.fromkeys(terms)),
+    )
+
+
+def member_entry(user, profile):
+    phone_number = profile.phone_number if profile else ""
+    membership_number = profile.membership_number if profile else ""
+    detail = " · ".join(filter(None, [f"@{user.username}", membership_number, phone_number]))
+    return _entry(
+        SearchEntry.KIND_MEMBER,
+        user,
+        user.pk,
+        user.get_full_name() or user.username,
+        detail,
+        words(user.username, user.first_name, user.last_name, membership_number) + phone_terms(phone_number),
+    )
+
+
+def user_entry(user):
+    return member_entry(user, MemberProfile.objects.filter(user=user).first())
+
+
+def loan_entry(loan_request):
+    return _entry(
+        SearchEntry.KIND_LOAN,
+        loan_request,
+        loan_request.user_id,
+        loan_request.name,
+        f"ID {loan_request.id_number} · KES {loan_request.amount} · {loan_request.get_status_display()}",
+        words(loan_request.name, loan_request.id_number),
+    )
+
+
+def transaction_entry(transaction):
+    # Only payments carrying a phone number or reference are searchable; the rest have nothing to type.
+    return _entry(
+        SearchEntry.KIND_TRANSACTION,
+        transaction,
+        transaction.user_id,
+        f"{transaction.get_transaction_type_display()} KES {transaction.amount}",
+        " · ".join(
+            filter(None, [transaction.payment_reference, transaction.phone_number, transaction.get_status_display()])
+        ),
+        words(transaction.payment_reference) + phone_terms(transaction.phone_number),
+    )
+
+
+BUILDERS = {
+    User: user_entry,
+    LoanRequest: loan_entry,
+    Transaction: transaction_entry,
+}
+KINDS = {
+    User: SearchEntry.KIND_MEMBER,
+    LoanRequest: SearchEntry.KIND_LOAN,
+    Transaction: SearchEntry.KIND_TRANSACTION,
+}
+
+
+def _upsert(entries):
+    SearchEntry.objects.bulk_create(
+        entries,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["kind", "object_id"],
+        update_fields=["user", "title", "detail", "terms"],
+    )
+
+
+def _index(entries):
+    entries = [entry for entry in entries if entry is not None]
+    if entries:
+        _upsert(entries)
+    return len(entries)
+
+
+def index_instances(model, instances):
+    """Add or refresh the entries of ``instances``. Bulk writes that bypass the save signals call this."""
+    return _index(map(BUILDERS[model], instances))
+
+
+def reindex(model, ids):
+    """
+    Refresh the entries of the ``model`` rows with ``ids``. Called after ``update()`` calls,
+    which bypass the save signals; rows left with nothing to search by lose their entry.
+    """
+    entries = {instance.pk: BUILDERS[model](instance) for instance in model.objects.filter(id__in=list(ids))}
+    unsearchable = [object_id for object_id, entry in entries.items() if entry is None]
+    if unsearchable:
+        SearchEntry.objects.filter(kind=KINDS[model], object_id__in=unsearchable).delete()
+    return _index(entries.values())
+
+
+def _chunked(queryset, size=2000):
+    chunk = []
+    for instance in queryset.order_by("id").iterator(chunk_size=size):
+        chunk.append(instance)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def rebuild_index():
+    """Re-create every entry from the source tables. Returns the entries written per kind."""
+    SearchEntry.objects.all().delete()
+    profiles = {profile.user_id: profile for profile in MemberProfile.objects.all()}
+    written = {SearchEntry.KIND_MEMBER: 0, SearchEntry.KIND_LOAN: 0, SearchEntry.KIND_TRANSACTION: 0}
+    for users in _chunked(User.objects.all()):
+        written[SearchEntry.KIND_MEMBER] += _index(member_entry(user, profiles.get(user.pk)) for user in users)
+    for loan_requests in _chunked(LoanRequest.objects.all()):
+        written[SearchEntry.KIND_LOAN] += index_instances(LoanRequest, loan_requests)
+    for transactions in _chunked(Transaction.objects.exclude(phone_number="", payment_reference="")):
+        written[SearchEntry.KIND_TRANSACTION] += index_instances(Transaction, transactions)
+    return written
+
+
+def _terms(query):
+    return [term for term in words(query) if len(term) >= MIN_QUERY_LENGTH]
+
+
+def _fts_match(terms):
+    return "terms : (" + " AND ".join(f'"{term}"*' for term in terms) + ")"
+
+
+def _tsquery(terms):
+    return " & ".join(f"{term}:*" for term in terms)
+
+
+def search(query, kinds=None, limit=20):
+    """
+    Entries whose terms start with every word of ``query``, newest first. Single characters are
+    ignored: as a prefix they match most of the index and would only slow typeahead down.
+
+    Answered from the FTS5 table on SQLite and the GIN index on PostgreSQL; other databases
+    fall back to ``icontains`` scans.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+    kinds = list(kinds or [])
+    alias = SearchEntry.objects.db
+    vendor = connections[alias].vendor
+
+    if vendor == "sqlite":
+        # Walking the FTS index in descending rowid order lets LIMIT stop early however many rows match.
+        sql = (
+            f'SELECT e.* FROM "{FTS_TABLE}" f JOIN "FinanceApp_searchentry" e ON e.id = f.rowid '
+            f'WHERE f."{FTS_TABLE}" MATCH %s ORDER BY f.rowid DESC LIMIT %s'
+        )
+        match = _fts_match(terms)
+        if kinds:
+            match += " AND kind : (" + " OR ".join(f'"{kind}"' for kind in kinds) + ")"
+        return list(SearchEntry.objects.using(alias).raw(sql, [match, limit]))
+    if vendor == "postgresql":
+        kind_filter = f" AND e.kind IN ({', '.join(['%s'] * len(kinds))})" if kinds else ""
+        sql = (
+            'SELECT e.* FROM "FinanceApp_searchentry" e '
+            f"WHERE to_tsvector('simple', e.terms) @@ to_tsquery('simple', %s){kind_filter} "
+            "ORDER BY e.id DESC LIMIT %s"
+        )
+        match = _tsquery(terms)
+        return list(SearchEntry.objects.using(alias).raw(sql, [match, *kinds, limit]))
+
+    entries = SearchEntry.objects.using(alias)
+    if kinds:
+        entries = entries.filter(kind__in=kinds)
+    for term in terms:
+        entries = entries.filter(terms__icontains=term)
+    return list(entries.order_by("-id")[:limit])
+
+
+def matching_entries(query, kind):
+    """
+    Every ``kind`` entry matching ``query``, unlimited and unordered, as a queryset to filter by
+    (the admin changelists use it as a subquery). ``None`` when no word of ``query`` is long
+    enough to look up, so the caller can fall back to a plain scan.
+    """
+    terms = _terms(query)
+    if not terms:
+        return None
+    entries = SearchEntry.objects.filter(kind=kind)
+    vendor = connections[entries.db].vendor
+    if vendor == "sqlite":
+        fts_rows = f'SELECT rowid FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s'
+        return entries.filter(id__in=RawSQL(fts_rows, [_fts_match(terms)]))
+    if vendor == "postgresql":
+        matches = "to_tsvector('simple', \"terms\") @@ to_tsquery('simple', %s)"
+        return entries.filter(RawSQL(matches, [_tsquery(terms)], BooleanField()))
+    for term in terms:
+        entries = entries.filter(terms__icontains=term)
+    return entries
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=LoanRequest)
+@receiver(post_save, sender=Transaction)
+def index_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not INDEXED_FIELDS[sender] & set(update_fields):
+        return
+    entry = BUILDERS[sender](instance)
+    if entry is not None:
+        _upsert([entry])
+    elif not created:
+        SearchEntry.objects.filter(kind=KINDS[sender], object_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=MemberProfile)
+def index_profile_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not INDEXED_FIELDS[sender] & set(update_fields):
+        return
+    _upsert([member_entry(instance.user, instance)])
+
+
+@receiver(post_delete, sender=LoanRequest)
+@receiver(post_delete, sender=Transaction)
+def unindex_on_delete(sender, instance, **kwargs):
+    SearchEntry.objects.filter(kind=KINDS[sender], object_id=instance.pk).delete()
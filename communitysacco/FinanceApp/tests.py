@@ -1,3 +1,1598 @@
-from django.test import TestCase
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import date, datetime, timedelta
+from importlib.util import find_spec
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection, connections, transaction as db_transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from Authapp.models import MemberProfile
+from communitysacco.databases import default_database, replica_database
+
+from .accruals import partition_bounds, run_accruals
+from .amortization import recompute_portfolio, schedule_cents
+from .loan_limits import cached_limit, score_all, score_stale
+from .member_summary import cache_stats, summary_key
+from .analytics import rebuild_rollups
+from .callbacks import ingest_callbacks, iter_jsonl_callbacks
+from .document_previews import drain as drain_previews
+from .fake_daraja import FakeDarajaServer
+from .ledger import verify_balances
+from .ledger_archive import partition_model, recorded_references, rows as archived_rows, verify_partition
+from .ledger_import import import_ledger, read_rows
+from .models import (
+    AnalyticsRollup,
+    LedgerImport,
+    LedgerPartition,
+    LoanDocument,
+    LoanProduct,
+    LoanRequest,
+    MemberBalance,
+    PaymentJob,
+    ProcessedCallback,
+    RepaymentInstalment,
+    SavingsRecord,
+    SearchEntry,
+    Transaction,
+    TransactionTrend,
+    TrendWatermark,
+    UserLoanLimit,
+)
+from .middleware import ReplicaPinMiddleware, RequestMetricsMiddleware
+from .payment_queue import adrain, drain
+from .payments import DarajaBackend, FakeDarajaBackend, PaymentGatewayError
+from .replicas import PIN_COOKIE, reading_from, tracking_writes
+from .reconciliation import reconcile_pending
+from .search import index_instances, rebuild_index, search
+from .request_metrics import RequestStats, RouteHistogram, collect, histogram
+from .trends import _summary as trend_summary, monthly_trends, refresh as refresh_trends
+
+
+class TransactionHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="member", password="pass12345")
+        Transaction.objects.bulk_create(
+            [
+                Transaction(user=self.user, transaction_type=Transaction.TYPE_DEPOSIT, amount=index + 1)
+                for index in range(60)
+            ]
+        )
+        self.client.force_login(self.user)
+
+    def test_history_pages_cover_every_row_once(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {"page_size": 25}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.client.get(reverse("transactions-feed"), params).json()
+            seen.extend(row["id"] for row in data["results"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 60)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_history_page_is_limited(self):
+        response = self.client.get(reverse("transactions"))
+        self.assertEqual(len(response.context["transactions"]), 25)
+        self.assertIsNotNone(response.context["next_cursor"])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse("transactions-feed"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_history_benchmark_runs(self):
+        out = StringIO()
+        call_command("bench_transaction_history", rows=500, batch_size=100, repeat=2, max_ratio=100, stdout=out)
+        self.assertIn("deep/first latency ratio", out.getvalue())
+        self.assertFalse(User.objects.filter(username="bench-history-member").exists())
+
+
+class TransactionExportTests(TestCase):
+    def setUp(self):
+        self.member = User.objects.create_user(username="member", password="pass12345")
+        other = User.objects.create_user(username="other", password="pass12345")
+        self.admin = User.objects.create_user(username="reviewer", password="pass12345", is_staff=True)
+        for user, transaction_type, status in [
+            (self.member, Transaction.TYPE_DEPOSIT, Transaction.STATUS_COMPLETED),
+            (self.member, Transaction.TYPE_DEPOSIT, Transaction.STATUS_PENDING),
+            (self.member, Transaction.TYPE_LOAN_REPAYMENT, Transaction.STATUS_COMPLETED),
+            (other, Transaction.TYPE_DEPOSIT, Transaction.STATUS_COMPLETED),
+        ]:
+            Transaction.objects.create(user=user, transaction_type=transaction_type, status=status, amount=100)
+
+    def _csv_rows(self, response):
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode("utf-8")
+        return list(csv.reader(StringIO(content)))
+
+    def test_statement_streams_own_filtered_rows(self):
+        self.client.force_login(self.member)
+        rows = self._csv_rows(self.client.get(reverse("transactions-export")))
+        self.assertEqual(rows[0], ["Date", "Type", "Status", "Amount", "Reference", "Description"])
+        self.assertEqual(len(rows), 4)
+
+        today = timezone.localdate().isoformat()
+        params = {"transaction_type": Transaction.TYPE_DEPOSIT, "status": Transaction.STATUS_COMPLETED, "date_from": today, "date_to": today}
+        rows = self._csv_rows(self.client.get(reverse("transactions-export"), params))
+        self.assertEqual([row[1:3] for row in rows[1:]], [["Deposit", "Completed"]])
+
+    def test_ledger_export_is_staff_only(self):
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get(reverse("admin-transactions-export")).status_code, 302)
+        self.client.force_login(self.admin)
+        rows = self._csv_rows(self.client.get(reverse("admin-transactions-export")))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual({row[1] for row in rows[1:]}, {"member", "other"})
+
+
+class LedgerImportTests(TestCase):
+    def setUp(self):
+        self.member = User.objects.create_user(username="legacy", password="pass12345")
+        Transaction.objects.create(
+            user=self.member, transaction_type=Transaction.TYPE_DEPOSIT, amount=10, payment_reference="LIVE1"
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def _write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write("\n".join(lines) + "\n")
+        return path
+
+    def test_csv_import_validates_and_keeps_history_dates(self):
+        path = self._write(
+            "transactions.csv",
+            [
+                "username,created_at,transaction_type,status,amount,payment_reference,description",
+                "legacy,2015-03-01 09:30,DEPOSIT,,500,OLD1,Paper ledger",
+                "legacy,2015-04-01,LOAN_DISBURSEMENT,COMPLETED,2000,,",
+                "legacy,2015-05-01,LOAN_REPAYMENT,COMPLETED,-5,,",
+                "ghost,2015-05-01,DEPOSIT,COMPLETED,100,,",
+                "legacy,2015-06-01,DEPOSIT,COMPLETED,100,OLD1,",
+                "legacy,2015-06-01,DEPOSIT,COMPLETED,100,LIVE1,",
+                "legacy,not a date,TRANSFER,COMPLETED,100,,",
+            ],
+        )
+        out = StringIO()
+        call_command("import_ledger", path, "--kind", "transactions", "--chunk-size", "2", stdout=out)
+        self.assertIn("Imported 2 rows, rejected 5", out.getvalue())
+
+        imported = Transaction.objects.exclude(payment_reference="LIVE1").order_by("created_at")
+        self.assertEqual([txn.created_at.year for txn in imported], [2015, 2015])
+        self.assertEqual(imported[0].status, Transaction.STATUS_COMPLETED)
+        self.assertEqual(MemberBalance.objects.get(user=self.member).total_disbursed, 2000)
+        self.assertEqual(verify_balances(), [])
+
+        with open(f"{path}.rejects.jsonl", encoding="utf-8") as rejects:
+            errors = {entry["row"]: entry["errors"] for entry in map(json.loads, rejects)}
+        self.assertEqual(sorted(errors), [3, 4, 5, 6, 7])
+        self.assertIn("amount", errors[3])
+        self.assertIn("username", errors[4])
+        self.assertIn("payment_reference", errors[6])
+        self.assertEqual(set(errors[7]), {"created_at", "transaction_type"})
+
+    def test_import_leaves_concurrent_timestamps_alone(self):
+        path = self._write("savings.jsonl", [json.dumps({"username": "legacy", "created_at": "2012-01-01", "amount": 100})])
+        live = []
+
+        def progress(line_number):
+            # A web request saving while the import runs still gets the current time.
+            live.append(SavingsRecord.objects.create(user=self.member, amount=5))
+
+        with open(path, encoding="utf-8") as stream:
+            import_ledger(read_rows(stream, "jsonl"), LedgerImport.KIND_SAVINGS, "savings-live", progress=progress)
+        self.assertEqual(SavingsRecord.objects.get(amount=100).created_at.year, 2012)
+        self.assertGreater(live[0].created_at, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(MemberBalance.objects.get(user=self.member).total_saved, 105)
+        self.assertEqual(verify_balances(), [])
+
+    def test_jsonl_import_resumes_from_checkpoint(self):
+        lines = [json.dumps({"username": "legacy", "created_at": f"2012-01-0{day}", "amount": day * 100}) for day in range(1, 6)]
+        path = self._write("savings.jsonl", lines)
+        LedgerImport.objects.create(source="savings-2012", kind=LedgerImport.KIND_SAVINGS, rows_read=3)
+
+        call_command("import_ledger", path, "--kind", "savings", "--source", "savings-2012", stdout=StringIO())
+        self.assertEqual(sorted(SavingsRecord.objects.values_list("amount", flat=True)), [400, 500])
+        self.assertEqual(MemberBalance.objects.get(user=self.member).total_saved, 900)
+
+        out = StringIO()
+        call_command("import_ledger", path, "--kind", "savings", "--source", "savings-2012", stdout=out)
+        self.assertIn("already imported", out.getvalue())
+        self.assertEqual(SavingsRecord.objects.count(), 2)
+
+
+class MemberBalanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="saver", password="pass12345")
+
+    def test_writes_keep_balance_in_step(self):
+        SavingsRecord.objects.create(user=self.user, amount=500)
+        Transaction.objects.create(
+            user=self.user, transaction_type=Transaction.TYPE_LOAN_DISBURSEMENT, amount=1000
+        )
+        repayment = Transaction.objects.create(
+            user=self.user,
+            transaction_type=Transaction.TYPE_LOAN_REPAYMENT,
+            status=Transaction.STATUS_PENDING,
+            amount=300,
+        )
+        balance = MemberBalance.objects.get(user=self.user)
+        self.assertEqual((balance.total_saved, balance.outstanding, balance.pending_count), (500, 1000, 1))
+
+        repayment = Transaction.objects.get(pk=repayment.pk)
+        repayment.status = Transaction.STATUS_COMPLETED
+        repayment.save(update_fields=["status"])
+        balance.refresh_from_db()
+        self.assertEqual((balance.total_repaid, balance.outstanding, balance.pending_count), (300, 700, 0))
+
+        repayment.delete()
+        balance.refresh_from_db()
+        self.assertEqual(balance.outstanding, 1000)
+        self.assertEqual(verify_balances(), [])
+
+    def test_rebuild_command_repairs_drift(self):
+        SavingsRecord.objects.create(user=self.user, amount=250)
+        MemberBalance.objects.filter(user=self.user).update(total_saved=0)
+        self.assertTrue(verify_balances())
+        call_command("rebuild_balances", stdout=StringIO())
+        self.assertEqual(verify_balances(), [])
+
+
+class AnalyticsRollupTests(TestCase):
+    def setUp(self):
+        self.member = User.objects.create_user(username="borrower", password="pass12345")
+        self.admin = User.objects.create_user(username="reviewer", password="pass12345", is_staff=True)
+
+    def _rollup_rows(self):
+        return sorted(AnalyticsRollup.objects.filter(count__gt=0).values_list("metric", "period", "category", "status", "count", "total_amount"))
+
+    def test_incremental_rollups_match_backfill(self):
+        loan = LoanRequest.objects.create(user=self.member, name="Borrower", id_number="1", document="loan.pdf", amount=1000)
+        LoanRequest.objects.create(user=self.member, name="Borrower", id_number="1", document="loan.pdf", amount=400)
+        loan.status = LoanRequest.STATUS_APPROVED
+        loan.save()
+        repayment = Transaction.objects.create(
+            user=self.member,
+            transaction_type=Transaction.TYPE_LOAN_REPAYMENT,
+            status=Transaction.STATUS_PENDING,
+            amount=250,
+        )
+        repayment.status = Transaction.STATUS_COMPLETED
+        repayment.save()
+
+        incremental = self._rollup_rows()
+        rebuild_rollups()
+        self.assertEqual(incremental, self._rollup_rows())
+
+    def test_dashboard_reads_rollups(self):
+        LoanRequest.objects.create(user=self.member, name="Borrower", id_number="1", document="loan.pdf", amount=1000)
+        Transaction.objects.create(
+            user=self.member, transaction_type=Transaction.TYPE_LOAN_REPAYMENT, status=Transaction.STATUS_COMPLETED, amount=300
+        )
+        self.client.force_login(self.admin)
+        # The session comes from the cache; the user is loaded once after login. The monthly
+        # chart is fetched separately from the trend API.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("admin-analytics-dashboard"))
+        self.assertEqual(response.context["total_applicants"], 1)
+        self.assertEqual(response.context["total_loan_requests"], 1)
+        self.assertEqual(response.context["total_loan_repayment"], 300)
+
+
+class TransactionTrendTests(TestCase):
+    def setUp(self):
+        self.member = User.objects.create_user(username="member", password="pass12345")
+        self.admin = User.objects.create_user(username="reviewer", password="pass12345", is_staff=True)
+        this_month = timezone.localdate().replace(day=1)
+        self.months = [this_month - timedelta(days=1), this_month]
+        self.last_month = self.months[0].replace(day=1)
+
+    def _transaction(self, amount, status=Transaction.STATUS_COMPLETED, transaction_type=Transaction.TYPE_DEPOSIT, day=None):
+        txn = Transaction.objects.create(user=self.member, transaction_type=transaction_type, status=status, amount=amount)
+        if day is not None:
+            Transaction.objects.filter(pk=txn.pk).update(created_at=timezone.make_aware(datetime.combine(day, datetime.min.time())))
+        return txn
+
+    def _summary(self):
+        return sorted(TransactionTrend.objects.values_list("month", "transaction_type", "status", "count", "total_amount"))
+
+    def test_refresh_folds_settled_rows_above_the_watermark(self):
+        later = timezone.now() + timedelta(hours=1)
+        self._transaction(100, day=self.months[0])
+        self._transaction(200, day=self.months[0])
+        self._transaction(50, transaction_type=Transaction.TYPE_LOAN_REPAYMENT, day=self.months[1])
+        pending = self._transaction(70, status=Transaction.STATUS_PENDING, day=self.months[1])
+        after_pending = self._transaction(30, day=self.months[1])
+
+        self.assertEqual(refresh_trends(now=later), 4)
+        # The pending payment is passed over and kept on the watermark until it settles.
+        mark = TrendWatermark.objects.get()
+        self.assertEqual((mark.last_id, mark.pending_ids), (after_pending.pk, [pending.pk]))
+        this_month = self.months[1].replace(day=1)
+        self.assertEqual(
+            self._summary(),
+            [
+                (self.last_month, Transaction.TYPE_DEPOSIT, Transaction.STATUS_COMPLETED, 2, 300),
+                (this_month, Transaction.TYPE_DEPOSIT, Transaction.STATUS_COMPLETED, 1, 30),
+                (this_month, Transaction.TYPE_LOAN_REPAYMENT, Transaction.STATUS_COMPLETED, 1, 50),
+            ],
+        )
+        self.assertEqual(refresh_trends(now=later), 0)
+
+        fresh = self._transaction(20)
+        pending.status = Transaction.STATUS_FAILED
+        pending.save()
+        # Rows younger than the settle window stay above the watermark.
+        self.assertEqual(refresh_trends(), 1)
+        self.assertEqual(TrendWatermark.objects.get().last_id, after_pending.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(refresh_trends(now=later + timedelta(hours=1)), 1)
+        mark = TrendWatermark.objects.get()
+        self.assertEqual((mark.last_id, mark.pending_ids), (fresh.pk, []))
+        # Every read of the ledger is bounded below by the old watermark.
+        ledger_reads = [query["sql"] for query in queries if 'FROM "FinanceApp_transaction"' in query["sql"]]
+        self.assertTrue(ledger_reads)
+        for sql in ledger_reads:
+            self.assertIn(f'"FinanceApp_transaction"."id" > {after_pending.pk}', sql)
+
+        incremental = self._summary()
+        refresh_trends(rebuild=True, now=later)
+        self.assertEqual(incremental, self._summary())
+
+    def test_long_pending_payments_do_not_hold_the_watermark_back(self):
+        later = timezone.now() + timedelta(hours=1)
+        stuck = self._transaction(70, status=Transaction.STATUS_PENDING, day=self.months[0])
+        self._transaction(10, day=self.months[1])
+        refresh_trends(now=later)
+        settled = self._transaction(5)
+        self.assertEqual(refresh_trends(now=later + timedelta(days=20)), 1)
+        self.assertEqual(TrendWatermark.objects.get().last_id, settled.pk)
+
+        # The stuck payment is still counted, live, under its current status.
+        _, series = monthly_trends(2)
+        self.assertEqual(series[Transaction.TYPE_DEPOSIT], [(1, 70), (2, 15)])
+        Transaction.objects.filter(pk=stuck.pk).update(status=Transaction.STATUS_COMPLETED)
+        _, completed = monthly_trends(2, Transaction.STATUS_COMPLETED)
+        self.assertEqual(completed[Transaction.TYPE_DEPOSIT], [(1, 70), (2, 15)])
+
+        self.assertEqual(refresh_trends(now=later + timedelta(days=40)), 1)
+        self.assertEqual(TrendWatermark.objects.get().pending_ids, [])
+        self.assertEqual(monthly_trends(2, Transaction.STATUS_COMPLETED)[1], completed)
+        incremental = self._summary()
+        refresh_trends(rebuild=True, now=later)
+        self.assertEqual(incremental, self._summary())
+
+    def test_summary_is_read_again_when_a_refresh_commits_midway(self):
+        folded = self._transaction(100, day=self.months[0])
+
+        class RefreshedWhileRead:
+            def __iter__(self):
+                # A refresh commits after the watermark was read but before the rows are.
+                if not TrendWatermark.objects.exists():
+                    refresh_trends(now=timezone.now() + timedelta(hours=1))
+                return iter(TransactionTrend.objects.all())
+
+        mark, rows = trend_summary(RefreshedWhileRead())
+        self.assertEqual(mark["last_id"], folded.pk)
+        self.assertEqual([row.count for row in rows], [1])
+        self.assertEqual(monthly_trends(2)[1][Transaction.TYPE_DEPOSIT], [(1, 100), (0, 0)])
+
+    def test_trends_add_rows_above_the_watermark(self):
+        self._transaction(100, day=self.months[0])
+        refresh_trends(now=timezone.now() + timedelta(hours=1))
+        self._transaction(40, day=self.months[1])
+        self._transaction(60, status=Transaction.STATUS_PENDING, transaction_type=Transaction.TYPE_LOAN_REPAYMENT)
+
+        months, series = monthly_trends(2)
+        self.assertEqual(months, [self.last_month, self.months[1].replace(day=1)])
+        self.assertEqual(series[Transaction.TYPE_DEPOSIT], [(1, 100), (1, 40)])
+        self.assertEqual(series[Transaction.TYPE_LOAN_REPAYMENT], [(0, 0), (1, 60)])
+        _, completed = monthly_trends(2, Transaction.STATUS_COMPLETED)
+        self.assertEqual(completed[Transaction.TYPE_LOAN_REPAYMENT], [(0, 0), (0, 0)])
+
+    def test_trend_api(self):
+        self._transaction(100, day=self.months[0])
+        self._transaction(25, transaction_type=Transaction.TYPE_LOAN_REPAYMENT)
+        refresh_trends(now=timezone.now() + timedelta(hours=1))
+
+        url = reverse("admin-transaction-trends")
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(url, {"months": 2})
+        self.assertEqual(response.status_code, 200)
+        trends = response.json()
+        self.assertEqual(trends["months"], [f"{month:%Y-%m}" for month in self.months])
+        by_type = {series["transaction_type"]: series for series in trends["series"]}
+        self.assertEqual(by_type[Transaction.TYPE_DEPOSIT]["counts"], [1, 0])
+        self.assertEqual(by_type[Transaction.TYPE_DEPOSIT]["totals"], ["100.00", "0"])
+        self.assertEqual(by_type[Transaction.TYPE_LOAN_REPAYMENT]["totals"], ["0", "25.00"])
+        self.assertEqual(len(self.client.get(url).json()["months"]), 12)
+
+        self.assertEqual(self.client.get(url, {"months": 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"months": settings.TRANSACTION_TRENDS_MAX_MONTHS + 1}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"status": "REVERSED"}).status_code, 400)
+
+
+class LoanApprovalDashboardTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="reviewer", password="pass12345", is_staff=True)
+        self.client.force_login(self.admin)
+
+    def _create_loans(self, count, status=LoanRequest.STATUS_PENDING):
+        for index in range(count):
+            member = User.objects.create(username=f"member{LoanRequest.objects.count()}")
+            UserLoanLimit.objects.create(user=member, amount=5000)
+            LoanRequest.objects.create(
+                user=member, name="Member", id_number=str(index), document="loan.pdf", amount=100, status=status
+            )
+
+    def _get(self, **params):
+        return self.client.get(reverse("loan-approval-dashboard"), params)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self._create_loans(2)
+        self._get()  # Warm the cached session user so both measured requests start alike.
+        with CaptureQueriesContext(connection) as small:
+            self._get()
+        self._create_loans(40)
+        self._create_loans(10, status=LoanRequest.STATUS_APPROVED)
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self._get()
+            self.assertContains(response, "member41")
+        self.assertEqual(len(response.context["pending_loans"]), 10)
+        self.assertEqual(len(response.context["all_loans"]), 25)
+        self.assertEqual(len(response.context["applicants_with_limits"]), 52)
+
+    def test_filters_and_pages_cover_matching_loans(self):
+        self._create_loans(30)
+        self._create_loans(5, status=LoanRequest.STATUS_REJECTED)
+        seen = []
+        params = {"status": LoanRequest.STATUS_PENDING, "page_size": 20}
+        while True:
+            response = self._get(**params)
+            seen.extend(loan.id for loan in response.context["all_loans"])
+            if not response.context["next_loans_url"]:
+                break
+            params["cursor"] = response.context["next_loans_url"].split("cursor=")[1].split("&")[0]
+        pending_ids = LoanRequest.objects.filter(status=LoanRequest.STATUS_PENDING).values_list("id", flat=True)
+        self.assertEqual(sorted(seen), sorted(pending_ids))
+
+        response = self._get(applicant="member31", date_from=timezone.localdate().isoformat())
+        self.assertEqual([loan.user.username for loan in response.context["all_loans"]], ["member31"])
+
+
+class BulkLoanReviewTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="reviewer", password="pass12345", is_staff=True)
+        self.member = User.objects.create_user(username="borrower", password="pass12345")
+        self.loans = [
+            LoanRequest.objects.create(user=self.member, name="Borrower", id_number="1", document="loan.pdf", amount=amount)
+            for amount in (100, 200, 300)
+        ]
+        self.own_loan = LoanRequest.objects.create(user=self.admin, name="Reviewer", id_number="2", document="loan.pdf", amount=50)
+        self.client.force_login(self.admin)
+
+    def _rollup_rows(self):
+        return sorted(AnalyticsRollup.objects.filter(count__gt=0).values_list("metric", "period", "category", "status", "count", "total_amount"))
+
+    def test_bulk_approve_disburses_each_pending_loan_once(self):
+        loan_ids = [loan.id for loan in self.loans] + [self.own_loan.id]
+        self.client.post(reverse("loan-approval-dashboard"), {"action": "APPROVED", "loan_ids": loan_ids, "admin_comment": "ok"})
+        self.client.post(reverse("loan-approval-dashboard"), {"action": "APPROVED", "loan_ids": loan_ids})
+
+        self.assertEqual(LoanRequest.objects.filter(status=LoanRequest.STATUS_APPROVED, reviewed_by=self.admin).count(), 3)
+        self.assertEqual(LoanRequest.objects.get(id=self.own_loan.id).status, LoanRequest.STATUS_PENDING)
+        disbursed = Transaction.objects.filter(transaction_type=Transaction.TYPE_LOAN_DISBURSEMENT)
+        self.assertEqual(sorted(disbursed.values_list("amount", flat=True)), [100, 200, 300])
+        self.assertEqual(MemberBalance.objects.get(user=self.member).total_disbursed, 600)
+        self.assertEqual(verify_balances(), [])
+
+        incremental = self._rollup_rows()
+        rebuild_rollups()
+        self.assertEqual(incremental, self._rollup_rows())
+
+    def test_single_review_keeps_own_loan_check(self):
+        response = self.client.post(reverse("loan-approval-dashboard"), {"action": "REJECTED", "loan_id": self.own_loan.id}, follow=True)
+        self.assertContains(response, "You cannot approve or reject your own loan request.")
+        self.client.post(reverse("loan-approval-dashboard"), {"action": "REJECTED", "loan_id": self.loans[0].id})
+        self.assertEqual(LoanRequest.objects.get(id=self.loans[0].id).status, LoanRequest.STATUS_REJECTED)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_non_ascii_and_oversized_ids_are_ignored(self):
+        for loan_id in ("²", "١٢", str(2**64)):
+            response = self.client.post(reverse("loan-approval-dashboard"), {"action": "APPROVED", "loan_id": loan_id}, follow=True)
+            self.assertContains(response, "Select at least one loan request.")
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get(reverse("mpesaPayment"), {"job": "²"}).status_code, 200)
+
+
+class LoanAmortizationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="reviewer", password="pass12345", is_staff=True)
+        self.member = User.objects.create_user(username="borrower", password="pass12345")
+        self.product = LoanProduct.objects.create(name="Development", interest_rate=12, term_months=6)
+        SavingsRecord.objects.create(user=self.member, amount=1000)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root.name))
+        self.client.force_login(self.member)
+        self.client.post(
+            reverse("loans"),
+            {"name": "Borrower", "id_number": "1", "amount": "1000", "product": self.product.id, "document": StringIO("x")},
+        )
+        self.loan = LoanRequest.objects.get(user=self.member)
+        self.client.force_login(self.admin)
+        self.client.post(reverse("loan-approval-dashboard"), {"action": "APPROVED", "loan_id": self.loan.id})
+
+    def _repay(self, amount):
+        Transaction.objects.create(
+            user=self.member,
+            transaction_type=Transaction.TYPE_LOAN_REPAYMENT,
+            status=Transaction.STATUS_COMPLETED,
+            amount=amount,
+        )
+
+    def test_schedules_repay_the_principal(self):
+        for method in (LoanProduct.METHOD_FLAT, LoanProduct.METHOD_REDUCING):
+            rows = schedule_cents(100_000, "12.00", 12, method)
+            self.assertEqual(len(rows), 12)
+            self.assertEqual(sum(principal for principal, _ in rows), 100_000)
+        self.assertEqual(sum(interest for _, interest in schedule_cents(100_000, "12.00", 12, LoanProduct.METHOD_FLAT)), 12_000)
+        reducing = schedule_cents(100_000, "12.00", 12, LoanProduct.METHOD_REDUCING)
+        self.assertEqual(reducing[0], (7885, 1000))
+        self.assertEqual(len({principal + interest for principal, interest in reducing[:-1]}), 1)
+
+    def test_approval_stores_schedule_with_product_terms(self):
+        self.assertEqual((self.loan.interest_rate, self.loan.term_months), (12, 6))
+        instalments = list(self.loan.instalments.all())
+        self.assertEqual([instalment.number for instalment in instalments], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(sum(instalment.principal_due for instalment in instalments), 1000)
+        self.assertLess(instalments[0].due_date, instalments[1].due_date)
+
+    def test_repayments_are_allocated_oldest_instalment_first(self):
+        first, second = self.loan.instalments.all()[:2]
+        self._repay(first.amount_due + 10)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.balance, 0)
+        self.assertIsNotNone(first.paid_at)
+        self.assertEqual(second.amount_paid, 10)
+        self.assertIsNone(second.paid_at)
+
+        self.client.force_login(self.member)
+        response = self.client.get(reverse("loans"))
+        self.assertContains(response, f"amount={second.balance}")
+
+    def test_repayments_of_earlier_loans_do_not_pay_new_instalments(self):
+        member = User.objects.create_user(username="returning", password="pass12345")
+        for transaction_type in (Transaction.TYPE_LOAN_DISBURSEMENT, Transaction.TYPE_LOAN_REPAYMENT):
+            legacy = Transaction.objects.create(
+                user=member, transaction_type=transaction_type, status=Transaction.STATUS_COMPLETED, amount=10000
+            )
+            Transaction.objects.filter(pk=legacy.pk).update(created_at=timezone.now() - timedelta(days=400))
+        SavingsRecord.objects.create(user=member, amount=3000)
+        loan = LoanRequest(user=member, name="Returning", id_number="2", document="loan.pdf", amount=6000, product=self.product)
+        loan.apply_product_terms()
+        loan.save()
+        self.client.post(reverse("loan-approval-dashboard"), {"action": "APPROVED", "loan_id": loan.id})
+
+        instalments = loan.instalments.all()
+        self.assertEqual(len(instalments), 6)
+        self.assertTrue(all(instalment.amount_paid == 0 and instalment.paid_at is None for instalment in instalments))
+
+        Transaction.objects.create(
+            user=member, transaction_type=Transaction.TYPE_LOAN_REPAYMENT, status=Transaction.STATUS_COMPLETED, amount=50
+        )
+        self.assertEqual(loan.instalments.get(number=1).amount_paid, 50)
+        self.assertEqual(recompute_portfolio()["instalments_updated"], 0)
+
+    def test_recompute_is_a_no_op_until_schedules_drift(self):
+        self._repay(50)
+        self.assertEqual(recompute_portfolio(), {"loans": 1, "schedules_written": 0, "instalments_updated": 0})
+
+        RepaymentInstalment.objects.filter(loan=self.loan, number=6).delete()
+        RepaymentInstalment.objects.filter(loan=self.loan, number=1).update(amount_paid=0)
+        stats = recompute_portfolio()
+        self.assertEqual((stats["schedules_written"], stats["instalments_updated"]), (1, 0))
+        self.assertEqual(self.loan.instalments.count(), 6)
+        self.assertEqual(self.loan.instalments.get(number=1).amount_paid, 50)
+
+
+class MemberSummaryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.member = User.objects.create_user(username="member", password="pass12345")
+        SavingsRecord.objects.create(user=self.member, amount=250)
+        self.client.force_login(self.member)
+
+    def test_warm_home_needs_no_queries(self):
+        self.client.get(reverse("home"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("home"))
+        self.assertEqual(response.context["total_saved"], 250)
+        self.assertEqual(cache_stats(), {"hits": 1, "misses": 1})
+
+    def test_writes_invalidate_the_cached_summary(self):
+        self.client.get(reverse("home"))
+        writes = [
+            lambda: SavingsRecord.objects.create(user=self.member, amount=50),
+            lambda: LoanRequest.objects.create(user=self.member, name="Member", id_number="1", document="loan.pdf", amount=10),
+            lambda: Transaction.objects.create(
+                user=self.member, transaction_type=Transaction.TYPE_DEPOSIT, status=Transaction.STATUS_PENDING, amount=5
+            ),
+            lambda: UserLoanLimit.objects.update_or_create(user=self.member, defaults={"amount": 900, "is_manual": True}),
+        ]
+        for write in writes:
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            self.assertIsNone(cache.get(summary_key(self.member.id)))
+            self.client.get(reverse("home"))
+
+        response = self.client.get(reverse("home"))
+        self.assertEqual(
+            [response.context[key] for key in ("total_saved", "loan_status", "pending_transactions", "loan_limit")],
+            [300, "Pending", 1, 900],
+        )
+
+
+@override_settings(LOAN_LIMIT_SAVINGS_MULTIPLE=3)
+class LoanLimitScoringTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="reviewer", password="pass12345", is_staff=True)
+        self.member = User.objects.create_user(username="borrower", password="pass12345")
+        self.other = User.objects.create_user(username="other", password="pass12345")
+        SavingsRecord.objects.create(user=self.member, amount=1000)
+        SavingsRecord.objects.create(user=self.other, amount=500)
+        Transaction.objects.create(user=self.member, transaction_type=Transaction.TYPE_LOAN_DISBURSEMENT, amount=400)
+        score_all()
+
+    def _apply(self, amount):
+        return self.client.post(reverse("loans"), {"name": "Borrower", "id_number": "1", "amount": amount, "document": StringIO("x")})
+
+    def test_limit_is_savings_multiple_less_outstanding(self):
+        self.assertEqual(cached_limit(self.member), 2600)
+        with self.assertNumQueries(1):
+            cached_limit(self.other)
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root.name))
+        self.client.force_login(self.member)
+        self.assertContains(self._apply("2601"), "This exceeds your loan limit of 2600.")
+        self._apply("2600")
+        self.assertEqual(LoanRequest.objects.get(user=self.member).amount, 2600)
+
+    def test_incremental_run_rescores_only_changed_members(self):
+        other_scored_at = UserLoanLimit.objects.get(user=self.other).scored_at
+        SavingsRecord.objects.create(user=self.member, amount=100)
+        self.assertTrue(UserLoanLimit.objects.get(user=self.member).needs_scoring)
+
+        self.assertEqual(score_stale()["scored"], 1)
+        self.assertEqual(cached_limit(self.member), 2900)
+        self.assertEqual(UserLoanLimit.objects.get(user=self.other).scored_at, other_scored_at)
+
+    def test_late_instalments_reduce_limit(self):
+        loan = LoanRequest.objects.create(
+            user=self.other, name="Other", id_number="2", document="loan.pdf", amount=100, status=LoanRequest.STATUS_APPROVED
+        )
+        for number in (1, 2):
+            RepaymentInstalment.objects.create(
+                loan=loan,
+                number=number,
+                due_date=timezone.localdate() - timedelta(days=40 - number * 10),
+                principal_due=50,
+                interest_due=0,
+                amount_paid=50 if number == 1 else 0,
+                paid_at=timezone.now() - timedelta(days=60) if number == 1 else None,
+            )
+        score_all()
+        self.assertEqual(cached_limit(self.other), 750)
+
+    def test_manual_override_survives_scoring_until_cleared(self):
+        self.client.force_login(self.admin)
+        self.client.post(reverse("loan-approval-dashboard"), {"action": "SET_LIMIT", "target_user_id": self.member.id, "loan_limit_amount": "50"})
+        SavingsRecord.objects.create(user=self.member, amount=100)
+        score_stale()
+        score_all()
+        self.assertEqual(cached_limit(self.member), 50)
+
+        self.client.post(reverse("loan-approval-dashboard"), {"action": "SET_LIMIT", "target_user_id": self.member.id, "loan_limit_amount": ""})
+        self.assertEqual(cached_limit(self.member), 2900)
+
+
+@override_settings(SAVINGS_DIVIDEND_RATE=10, LOAN_PENALTY_RATE=36.5, LOAN_PENALTY_GRACE_DAYS=7)
+class AccrualTests(TestCase):
+    def setUp(self):
+        self.savers = [User.objects.create_user(username=f"saver{index}") for index in range(6)]
+        for user in self.savers:
+            SavingsRecord.objects.create(user=user, amount=36500)
+        self.borrower = self.savers[0]
+        loan = LoanRequest.objects.create(
+            user=self.borrower, name="Borrower", id_number="1", document="loan.pdf", amount=1000, status=LoanRequest.STATUS_APPROVED
+        )
+        self.today = timezone.localdate()
+        RepaymentInstalment.objects.create(
+            loan=loan, number=1, due_date=self.today - timedelta(days=30), principal_due=900, interest_due=100, amount_paid=0
+        )
+        RepaymentInstalment.objects.create(
+            loan=loan, number=2, due_date=self.today - timedelta(days=3), principal_due=900, interest_due=100, amount_paid=0
+        )
+
+    def test_accruals_post_dividends_and_penalties_once_per_day(self):
+        stats = run_accruals(self.today, chunk_size=4)
+        self.assertEqual((stats["dividends"], stats["penalties"]), (6, 1))
+        self.assertEqual(stats["dividends_total"], 60)
+        # Only the instalment past its grace period is penalised: 1000 * 36.5% / 365.
+        penalty = Transaction.objects.get(transaction_type=Transaction.TYPE_PENALTY)
+        self.assertEqual((penalty.user, penalty.amount), (self.borrower, 1))
+        self.assertEqual(timezone.localtime(penalty.created_at).date(), self.today)
+        self.assertEqual(MemberBalance.objects.get(user=self.borrower).total_saved, 36510)
+
+        rerun = run_accruals(self.today)
+        self.assertEqual((rerun["dividends"], rerun["penalties"], rerun["skipped"]), (0, 0, 7))
+        self.assertEqual(Transaction.objects.count(), 7)
+        self.assertEqual(verify_balances(), [])
+
+        incremental = sorted(AnalyticsRollup.objects.values_list("metric", "period", "category", "count", "total_amount"))
+        rebuild_rollups()
+        self.assertEqual(incremental, sorted(AnalyticsRollup.objects.values_list("metric", "period", "category", "count", "total_amount")))
+
+    def test_overlapping_run_skips_accruals_posted_since_its_check(self):
+        run_accruals(self.today)
+        # The other run committed between this run's reference check and its insert.
+        with mock.patch("FinanceApp.accruals.ledger_archive.recorded_references", return_value=set()):
+            rerun = run_accruals(self.today)
+        self.assertEqual((rerun["dividends"], rerun["penalties"], rerun["skipped"]), (0, 0, 7))
+        self.assertEqual(Transaction.objects.count(), 7)
+        self.assertEqual(verify_balances(), [])
+
+    def test_partitions_cover_every_member_once(self):
+        ranges = [partition_bounds(index, 4) for index in range(1, 5)]
+        # Six members split into partitions of two leave the fourth empty.
+        self.assertIsNone(ranges[3])
+        for user_range in ranges[:3]:
+            run_accruals(self.today, user_range=user_range)
+        self.assertEqual((ranges[0][0], ranges[2][1]), (self.savers[0].id, self.savers[-1].id))
+        self.assertEqual(Transaction.objects.filter(transaction_type=Transaction.TYPE_DIVIDEND).count(), 6)
+
+        # The next day compounds on the credited dividend.
+        call_command("run_accruals", "--date", str(self.today + timedelta(days=1)), "--partition", "1/1", stdout=StringIO())
+        self.assertEqual(
+            Transaction.objects.filter(transaction_type=Transaction.TYPE_DIVIDEND, user=self.borrower).latest("created_at").amount,
+            10,
+        )
+
+
+@override_settings(PAYMENT_GATEWAY_BACKEND="FinanceApp.payments.FakeDarajaBackend", MPESA_CALLBACK_URL="https://example.com/cb")
+class PaymentQueueTests(TestCase):
+    def setUp(self):
+        FakeDarajaBackend.reset()
+        self.user = User.objects.create_user(username="payer", password="pass12345")
+        self.client.force_login(self.user)
+
+    def _pay(self, phone_number):
+        return self.client.post(
+            reverse("mpesaPayment"),
+            {"phonenumber": phone_number, "payment_type": Transaction.TYPE_DEPOSIT, "amount": "150"},
+        )
+
+    def test_payment_is_queued_then_sent_by_worker(self):
+        response = self._pay("0712345678")
+        job = PaymentJob.objects.get()
+        self.assertRedirects(response, f"{reverse('mpesaPayment')}?job={job.id}")
+        self.assertEqual(job.transaction.status, Transaction.STATUS_PENDING)
+        self.assertEqual(FakeDarajaBackend.sent, [])
+
+        self.assertEqual(drain(FakeDarajaBackend()), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PaymentJob.STATUS_SENT)
+        self.assertTrue(job.transaction.payment_reference.startswith("ws_CO_FAKE_"))
+        status = self.client.get(reverse("payment-job-status", args=[job.id])).json()
+        self.assertTrue(status["finished"])
+
+    def test_gateway_errors_are_retried_then_failed(self):
+        self._pay("0712349999")
+        job = PaymentJob.objects.get()
+        drain(FakeDarajaBackend())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (PaymentJob.STATUS_QUEUED, 1))
+        self.assertGreater(job.next_attempt_at, job.updated_at)
+
+        PaymentJob.objects.update(attempts=job.max_attempts - 1, next_attempt_at=job.created_at)
+        drain(FakeDarajaBackend())
+        job.refresh_from_db()
+        self.assertEqual(job.status, PaymentJob.STATUS_FAILED)
+        self.assertEqual(job.transaction.status, Transaction.STATUS_FAILED)
+        self.assertEqual(MemberBalance.objects.get(user=self.user).pending_count, 0)
+
+    def test_rejected_push_fails_without_retry(self):
+        self._pay("0712340000")
+        drain(FakeDarajaBackend())
+        job = PaymentJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (PaymentJob.STATUS_FAILED, 1))
+
+    def test_async_drain_records_the_same_outcomes(self):
+        for phone_number in ("0712345678", "0712340000", "0712349999"):
+            self._pay(phone_number)
+        self.assertEqual(async_to_sync(adrain)(FakeDarajaBackend(), concurrency=3), 3)
+        self.assertEqual(
+            dict(PaymentJob.objects.values_list("transaction__phone_number", "status")),
+            {
+                "0712345678": PaymentJob.STATUS_SENT,
+                "0712340000": PaymentJob.STATUS_FAILED,
+                "0712349999": PaymentJob.STATUS_QUEUED,
+            },
+        )
+
+
+class DarajaBackendTests(TestCase):
+    def setUp(self):
+        cache.delete(DarajaBackend.TOKEN_CACHE_KEY)
+        self.backend = DarajaBackend()
+        token_response = mock.Mock(status_code=200)
+        token_response.json.return_value = {"access_token": "token-1", "expires_in": "3599"}
+        push_response = mock.Mock(status_code=200)
+        push_response.json.return_value = {"ResponseCode": "0", "CheckoutRequestID": "ws_CO_1"}
+        self.backend.session = mock.Mock()
+        self.backend.session.get.return_value = token_response
+        self.backend.session.post.return_value = push_response
+
+    def test_token_is_fetched_once_and_shared(self):
+        for _ in range(3):
+            result = self.backend.stk_push("0712345678", 10, "FinanceApp", "Savings", "https://example.com/cb")
+            self.assertTrue(result.accepted)
+        self.assertEqual(self.backend.session.get.call_count, 1)
+        self.assertEqual(self.backend.session.post.call_count, 3)
+        self.assertEqual(DarajaBackend().access_token(), "token-1")
+        self.assertEqual(self.backend.metrics.snapshot()["stk_push"]["count"], 3)
+
+    def test_bad_token_responses_are_retried_by_the_worker(self):
+        user = User.objects.create_user(username="payer", password="pass12345")
+        pending = Transaction.objects.create(
+            user=user,
+            transaction_type=Transaction.TYPE_DEPOSIT,
+            status=Transaction.STATUS_PENDING,
+            amount=150,
+            phone_number="0712345678",
+        )
+        job = PaymentJob.objects.create(transaction=pending, callback_url="https://example.com/cb")
+        self.backend.session.get.return_value.json.return_value = {"error": "invalid_client"}
+
+        self.assertEqual(drain(self.backend), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (PaymentJob.STATUS_QUEUED, 1))
+        self.assertIn("access token", job.last_error)
+
+    def test_query_rejects_non_object_responses(self):
+        query_response = mock.Mock(status_code=200)
+        query_response.json.return_value = ["unexpected"]
+        self.backend.session.post.return_value = query_response
+        with self.assertRaises(PaymentGatewayError):
+            self.backend.stk_query("ws_CO_1")
+
+    @skipUnless(find_spec("httpx"), "The async gateway client needs httpx.")
+    def test_async_pushes_share_one_token_and_overlap(self):
+        server = FakeDarajaServer(latency=0.2).start()
+        self.addCleanup(server.stop)
+        backend = DarajaBackend()
+
+        async def push_all():
+            try:
+                return await asyncio.gather(
+                    *(backend.astk_push("0712345678", 10, "FinanceApp", "Savings", "https://example.com/cb") for _ in range(5))
+                )
+            finally:
+                await backend.aclose()
+
+        with override_settings(MPESA_API_BASE_URL=server.url):
+            results = asyncio.run(push_all())
+        self.assertTrue(all(result.accepted for result in results))
+        self.assertEqual(len({result.checkout_request_id for result in results}), 5)
+        self.assertEqual(server.requests["/oauth/v1/generate"], 1)
+        self.assertEqual(server.max_in_flight, 5)
+
+
+def stk_callback_payload(checkout_request_id, result_code=0, receipt="QGH123ABC"):
+    callback = {
+        "MerchantRequestID": "29115-34620561-1",
+        "CheckoutRequestID": checkout_request_id,
+        "ResultCode": result_code,
+        "ResultDesc": "The service request is processed successfully." if result_code == 0 else "Request cancelled by user",
+    }
+    if result_code == 0:
+        callback["CallbackMetadata"] = {
+            "Item": [
+                {"Name": "Amount", "Value": 150},
+                {"Name": "MpesaReceiptNumber", "Value": receipt},
+                {"Name": "PhoneNumber", "Value": 254712345678},
+            ]
+        }
+    return {"Body": {"stkCallback": callback}}
+
+
+class MpesaCallbackTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="payer", password="pass12345")
+        self.pending = Transaction.objects.create(
+            user=self.user,
+            transaction_type=Transaction.TYPE_LOAN_REPAYMENT,
+            status=Transaction.STATUS_PENDING,
+            amount=150,
+            payment_reference="ws_CO_1",
+        )
+
+    def _post(self, payload):
+        return self.client.post(reverse("mpesa-callback"), data=payload, content_type="application/json")
+
+    def test_callback_completes_transaction_once(self):
+        self.assertEqual(self._post(stk_callback_payload("ws_CO_1")).json()["ResultCode"], 0)
+        self.assertEqual(self._post(stk_callback_payload("ws_CO_1")).json()["ResultCode"], 0)
+
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, Transaction.STATUS_COMPLETED)
+        self.assertEqual(ProcessedCallback.objects.count(), 1)
+        balance = MemberBalance.objects.get(user=self.user)
+        self.assertEqual((balance.pending_count, balance.total_repaid), (0, 150))
+        self.assertEqual(verify_balances(), [])
+
+    def test_failed_callback_marks_transaction_failed(self):
+        self._post(stk_callback_payload("ws_CO_1", result_code=1032))
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, Transaction.STATUS_FAILED)
+
+    def test_unknown_checkout_id_is_not_logged(self):
+        self._post(stk_callback_payload("ws_CO_unknown"))
+        self.assertFalse(ProcessedCallback.objects.exists())
+
+
+class CallbackIngestionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="payer", password="pass12345")
+        for index in range(5):
+            Transaction.objects.create(
+                user=self.user,
+                transaction_type=Transaction.TYPE_DEPOSIT,
+                status=Transaction.STATUS_PENDING,
+                amount=100,
+                payment_reference=f"ws_CO_{index}",
+            )
+
+    def _lines(self):
+        payloads = [stk_callback_payload(f"ws_CO_{index}", receipt=f"R{index}") for index in range(4)]
+        payloads.append(stk_callback_payload("ws_CO_4", result_code=1032))
+        payloads.append(stk_callback_payload("ws_CO_0", receipt="R0"))
+        payloads.append(stk_callback_payload("ws_CO_missing", receipt="RX"))
+        return [json.dumps(payload) for payload in payloads] + ["not json"]
+
+    def test_batches_apply_each_callback_once(self):
+        stats = ingest_callbacks(iter_jsonl_callbacks(self._lines()), batch_size=3)
+        self.assertEqual(stats, {"applied": 5, "duplicate": 1, "unmatched": 1, "invalid": 1})
+        self.assertEqual(Transaction.objects.filter(status=Transaction.STATUS_COMPLETED).count(), 4)
+        self.assertEqual(Transaction.objects.filter(status=Transaction.STATUS_FAILED).count(), 1)
+        self.assertEqual(verify_balances(), [])
+
+        replay = ingest_callbacks(iter_jsonl_callbacks(self._lines()))
+        self.assertEqual(replay["applied"], 0)
+
+    def test_callback_logged_during_a_batch_is_skipped(self):
+        # A single webhook logs ws_CO_1's receipt after the batch checked the log.
+        def unlogged(by_checkout_id, stats):
+            fresh = list(by_checkout_id.values())
+            ProcessedCallback.objects.create(checkout_request_id="ws_CO_other", mpesa_receipt_number="R1", result_code=0)
+            return fresh
+
+        payloads = [stk_callback_payload(f"ws_CO_{index}", receipt=f"R{index}") for index in range(3)]
+        with mock.patch("FinanceApp.callbacks._unlogged", side_effect=unlogged):
+            stats = ingest_callbacks(iter_jsonl_callbacks(json.dumps(payload) for payload in payloads))
+        self.assertEqual((stats["applied"], stats["duplicate"]), (2, 1))
+        self.assertEqual(
+            set(Transaction.objects.filter(status=Transaction.STATUS_COMPLETED).values_list("payment_reference", flat=True)),
+            {"ws_CO_0", "ws_CO_2"},
+        )
+        self.assertEqual(verify_balances(), [])
+
+    @override_settings(CALLBACK_INGEST_TOKEN="secret")
+    def test_batch_endpoint_requires_token(self):
+        body = "\n".join(self._lines())
+        url = reverse("mpesa-callback-batch")
+        self.assertEqual(self.client.post(url, data=body, content_type="application/x-ndjson").status_code, 403)
+        response = self.client.post(
+            url, data=body, content_type="application/x-ndjson", headers={"X-Callback-Ingest-Token": "secret"}
+        )
+        self.assertEqual(response.json()["applied"], 5)
+
+
+class ReconcilePendingTests(TestCase):
+    def setUp(self):
+        FakeDarajaBackend.reset()
+        self.user = User.objects.create_user(username="payer", password="pass12345")
+        for reference in ("ws_CO_paid", "ws_CO_cancelled", "ws_CO_waiting", ""):
+            Transaction.objects.create(
+                user=self.user,
+                transaction_type=Transaction.TYPE_DEPOSIT,
+                status=Transaction.STATUS_PENDING,
+                amount=100,
+                payment_reference=reference,
+            )
+        FakeDarajaBackend.query_results.update({"ws_CO_cancelled": 1032, "ws_CO_waiting": None})
+
+    def _status(self, reference):
+        return Transaction.objects.get(payment_reference=reference).status
+
+    def test_sweep_applies_final_results(self):
+        report = reconcile_pending(
+            FakeDarajaBackend(), older_than=timedelta(0), batch_size=2, workers=2, expire_unsent_after=timedelta(0)
+        )
+        self.assertEqual((report.queried, report.applied, report.still_pending, report.expired), (3, 2, 1, 1))
+        self.assertEqual(self._status("ws_CO_paid"), Transaction.STATUS_COMPLETED)
+        self.assertEqual(self._status("ws_CO_cancelled"), Transaction.STATUS_FAILED)
+        self.assertEqual(self._status("ws_CO_waiting"), Transaction.STATUS_PENDING)
+        self.assertEqual(self._status(""), Transaction.STATUS_FAILED)
+        self.assertEqual(verify_balances(), [])
+
+        response = self.client.post(
+            reverse("mpesa-callback"), data=stk_callback_payload("ws_CO_paid"), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ProcessedCallback.objects.filter(checkout_request_id="ws_CO_paid").count(), 1)
+
+    def test_recent_and_queued_payments_are_left_alone(self):
+        unsent = Transaction.objects.get(payment_reference="")
+        PaymentJob.objects.create(transaction=unsent, callback_url="https://example.com/cb")
+        report = reconcile_pending(FakeDarajaBackend(), expire_unsent_after=timedelta(0))
+        self.assertEqual((report.queried, report.expired), (0, 0))
+        self.assertEqual(Transaction.objects.filter(status=Transaction.STATUS_PENDING).count(), 4)
+
+    def test_command_queries_local_fake_daraja(self):
+        cache.delete(DarajaBackend.TOKEN_CACHE_KEY)
+        server = FakeDarajaServer().start()
+        self.addCleanup(server.stop)
+        server.outcomes.update(FakeDarajaBackend.query_results)
+        out = StringIO()
+        with override_settings(MPESA_API_BASE_URL=server.url, PAYMENT_GATEWAY_BACKEND="FinanceApp.payments.DarajaBackend"):
+            call_command("reconcile_pending", "--older-than", "0", "--rate", "0", stdout=out)
+        self.assertIn("Queried 3 pending payments", out.getvalue())
+        self.assertEqual(server.requests["/mpesa/stkpushquery/v1/query"], 3)
+        self.assertEqual(self._status("ws_CO_paid"), Transaction.STATUS_COMPLETED)
+        self.assertEqual(self._status("ws_CO_waiting"), Transaction.STATUS_PENDING)
+
+
+class DatabaseProfileTests(SimpleTestCase):
+    def test_sqlite_profile_enables_wal_on_connect(self):
+        with mock.patch.dict(os.environ, {"SQLITE_BUSY_TIMEOUT_MS": "8000"}):
+            os.environ.pop("DATABASE_ENGINE", None)
+            os.environ.pop("SQLITE_PATH", None)
+            database = default_database(Path("/srv/sacco"))
+        self.assertEqual(database["NAME"], Path("/srv/sacco/db.sqlite3"))
+        self.assertIn("PRAGMA journal_mode=WAL", database["OPTIONS"]["init_command"])
+        self.assertIn("PRAGMA busy_timeout=8000", database["OPTIONS"]["init_command"])
+        self.assertEqual(database["OPTIONS"]["transaction_mode"], "IMMEDIATE")
+
+    def test_postgres_pool_replaces_persistent_connections(self):
+        with mock.patch.dict(os.environ, {"DATABASE_ENGINE": "postgres", "DB_CONN_MAX_AGE": "120"}):
+            persistent = default_database(Path("/srv/sacco"))
+            with mock.patch.dict(os.environ, {"DB_POOL_MAX_SIZE": "20"}):
+                pooled = default_database(Path("/srv/sacco"))
+        self.assertEqual((persistent["CONN_MAX_AGE"], persistent["CONN_HEALTH_CHECKS"]), (120, True))
+        self.assertNotIn("pool", persistent["OPTIONS"])
+        self.assertEqual(pooled["CONN_MAX_AGE"], 0)
+        self.assertEqual(pooled["OPTIONS"]["pool"]["max_size"], 20)
+
+    def test_replica_profile_follows_the_primary_engine(self):
+        with mock.patch.dict(os.environ, {"DATABASE_ENGINE": "postgres", "POSTGRES_REPLICA_HOST": "replica.internal"}):
+            self.assertEqual(replica_database()["HOST"], "replica.internal")
+            self.assertEqual(replica_database()["TEST"], {"MIRROR": "default"})
+        with mock.patch.dict(os.environ, {"SQLITE_REPLICA_PATH": "/srv/replica/db.sqlite3"}):
+            os.environ.pop("DATABASE_ENGINE", None)
+            self.assertEqual(replica_database()["NAME"], "/srv/replica/db.sqlite3")
+            os.environ.pop("SQLITE_REPLICA_PATH")
+            self.assertIsNone(replica_database())
+
+
+@override_settings(REQUEST_METRICS_FLUSH_SECONDS=0)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        histogram.reset()
+        self.admin = User.objects.create_user(username="reviewer", password="pass12345", is_staff=True)
+        self.client.force_login(self.admin)
+
+    def test_records_queries_and_render_time_per_url_name(self):
+        self.client.get(reverse("loan-approval-dashboard"))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("loan-approval-dashboard"))
+        self.client.get("/FinanceApp/no-such-page/")
+
+        routes = collect()
+        dashboard = routes["loan-approval-dashboard"]
+        self.assertEqual(dashboard["count"], 2)
+        self.assertGreaterEqual(dashboard["max_queries"], len(queries.captured_queries))
+        self.assertGreater(dashboard["render_seconds"], 0)
+        self.assertGreaterEqual(dashboard["wall_seconds"], dashboard["sql_seconds"] + dashboard["render_seconds"])
+        self.assertEqual(sum(dashboard["buckets"]), 2)
+        self.assertEqual(routes["<unresolved>"]["count"], 1)
+
+        response = self.client.get(reverse("admin-request-metrics"))
+        self.assertContains(response, "loan-approval-dashboard")
+
+    def test_snapshots_from_other_workers_are_summed(self):
+        self.client.get(reverse("loan-approval-dashboard"))
+        other_worker = RouteHistogram()
+        other_worker.worker_key += ":other"
+        stats = RequestStats()
+        stats.queries = 7
+        other_worker.record("loan-approval-dashboard", stats, 3.0)
+
+        dashboard = collect()["loan-approval-dashboard"]
+        self.assertEqual(dashboard["count"], 2)
+        self.assertEqual(dashboard["max_queries"], 7)
+        self.assertEqual(dashboard["buckets"][9], 1)  # 2.5s < 3.0s <= 5s
+
+    @override_settings(METRICS_TOKEN="scrape-secret")
+    def test_prometheus_endpoint_needs_staff_or_token(self):
+        self.client.get(reverse("loan-approval-dashboard"))
+        self.client.logout()
+        url = reverse("request-metrics-export")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer scrape-secret")
+        body = response.content.decode()
+        self.assertIn('sacco_request_duration_seconds_bucket{route="loan-approval-dashboard",le="+Inf"} 1', body)
+        self.assertIn('sacco_request_duration_seconds_count{route="loan-approval-dashboard"} 1', body)
+        self.assertIn('sacco_request_queries_total{route="loan-approval-dashboard"}', body)
+
+    def test_async_chain_is_awaited_without_a_thread(self):
+        async def view(request):
+            request.resolver_match = resolve(reverse("loan-approval-dashboard"))
+            await sync_to_async(User.objects.count)()
+            return HttpResponse("ok")
+
+        middleware = RequestMetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get("/"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(collect()["loan-approval-dashboard"]["max_queries"], 1)
+
+    def test_profile_header_dumps_a_profile_for_staff(self):
+        with tempfile.TemporaryDirectory() as profile_dir, override_settings(REQUEST_PROFILE_DIR=profile_dir):
+            response = self.client.get(reverse("loan-approval-dashboard"), HTTP_X_PROFILE_REQUEST="1")
+            self.assertTrue(Path(response["X-Profile-File"]).is_file())
+
+            member = User.objects.create_user(username="member", password="pass12345")
+            self.client.force_login(member)
+            response = self.client.get(reverse("home"), HTTP_X_PROFILE_REQUEST="1")
+            self.assertNotIn("X-Profile-File", response.headers)
+            self.assertEqual(len(list(Path(profile_dir).iterdir())), 1)
+
+    def test_profile_header_under_asgi_loads_the_user_off_the_event_loop(self):
+        with tempfile.TemporaryDirectory() as profile_dir, override_settings(REQUEST_PROFILE_DIR=profile_dir):
+            self.async_client.force_login(self.admin)
+            # Neither the session nor the user is cached, so checking is_staff has to query.
+            cache.clear()
+            response = async_to_sync(self.async_client.get)(reverse("mpesaPayment"), headers={"X-Profile-Request": "1"})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(Path(response["X-Profile-File"]).is_file())
+
+
+class LoanDocumentTests(TestCase):
+    def setUp(self):
+        self.member = User.objects.create_user(username="borrower", password="pass12345")
+        self.admin = User.objects.create_user(username="reviewer", password="pass12345", is_staff=True)
+        SavingsRecord.objects.create(user=self.member, amount=1000)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = Path(media_root.name)
+        self.enterContext(self.settings(MEDIA_ROOT=self.media_root))
+        self.client.force_login(self.member)
+
+    def _apply(self, content, filename="payslip.pdf"):
+        upload = SimpleUploadedFile(filename, content, content_type="application/octet-stream")
+        self.client.post(reverse("loans"), {"name": "Borrower", "id_number": "1", "amount": "100", "document": upload})
+        return LoanRequest.objects.filter(user=self.member).latest("id")
+
+    def _png(self):
+        from PIL import Image
+
+        output = BytesIO()
+        Image.new("RGB", (1200, 800), "green").save(output, "PNG")
+        return output.getvalue()
+
+    def test_identical_uploads_are_stored_once(self):
+        content = b"%PDF-1.4 payslip" * 1000
+        first = self._apply(content)
+        second = self._apply(content, filename="copy.PDF")
+        self._apply(b"%PDF-1.4 another payslip")
+
+        self.assertEqual(LoanDocument.objects.count(), 2)
+        self.assertEqual(first.stored_document_id, second.stored_document_id)
+        stored = first.stored_document
+        self.assertEqual(stored.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual((stored.content_type, stored.size), ("application/pdf", len(content)))
+        self.assertEqual(second.document.name, stored.name)
+        self.assertEqual((self.media_root / stored.name).read_bytes(), content)
+        self.assertEqual(len(list((self.media_root / "loan_documents").rglob("*.pdf"))), 2)
+
+    def test_download_streams_ranges_to_owner_and_staff_only(self):
+        content = bytes(range(256)) * 4
+        loan = self._apply(content, filename="statement.bin")
+        url = reverse("loan-document", args=[loan.id])
+
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b"".join(response.streaming_content), content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertTrue(response["Content-Disposition"].startswith("attachment"))
+
+        response = self.client.get(url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/1024")
+        self.assertEqual(b"".join(response.streaming_content), content[10:20])
+        response = self.client.get(url, HTTP_RANGE="bytes=-4")
+        self.assertEqual(b"".join(response.streaming_content), content[-4:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE="bytes=5000-").status_code, 416)
+
+        self.client.force_login(User.objects.create_user(username="stranger"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.admin)
+        with self.settings(DOCUMENT_SENDFILE_HEADER="X-Accel-Redirect"):
+            response = self.client.get(url)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{loan.stored_document.name}")
+        self.assertEqual(response.content, b"")
+
+    @skipUnless(find_spec("PIL"), "Pillow is not installed")
+    def test_worker_renders_previews_shown_on_the_dashboard(self):
+        image_loan = self._apply(self._png(), filename="id-card.png")
+        text_loan = self._apply(b"plain text", filename="notes.txt")
+        self.assertEqual(drain_previews(), 2)
+
+        image = LoanDocument.objects.get(id=image_loan.stored_document_id)
+        self.assertEqual(image.preview_status, LoanDocument.PREVIEW_READY)
+        self.assertEqual(LoanDocument.objects.get(id=text_loan.stored_document_id).preview_status, LoanDocument.PREVIEW_UNAVAILABLE)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("loan-approval-dashboard"))
+        self.assertContains(response, reverse("loan-document-preview", args=[image_loan.id]))
+        self.assertNotContains(response, reverse("loan-document-preview", args=[text_loan.id]))
+        response = self.client.get(reverse("loan-document-preview", args=[image_loan.id]))
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        from PIL import Image
+
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as preview:
+            self.assertEqual(preview.size, (480, 320))
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.member = User.objects.create_user(username="jwanjiru", first_name="Jane", last_name="Wanjiru")
+        MemberProfile.objects.create(user=self.member, phone_number="+254712345678", membership_number="CS-0042")
+        self.loan = LoanRequest.objects.create(
+            user=self.member, name="Jane Wanjiru", id_number="23456789", document="loan.pdf", amount=500
+        )
+        self.payment = Transaction.objects.create(
+            user=self.member,
+            transaction_type=Transaction.TYPE_DEPOSIT,
+            amount=100,
+            phone_number="0712345678",
+            payment_reference="QGH7XK2LM9",
+        )
+        other = User.objects.create_user(username="okoth")
+        LoanRequest.objects.create(user=other, name="Peter Okoth", id_number="11112222", document="loan.pdf", amount=50)
+
+    def _found(self, query, kinds=None):
+        return {(entry.kind, entry.object_id) for entry in search(query, kinds)}
+
+    def test_prefixes_of_names_ids_phones_and_references_match(self):
+        member = (SearchEntry.KIND_MEMBER, self.member.id)
+        loan = (SearchEntry.KIND_LOAN, self.loan.id)
+        payment = (SearchEntry.KIND_TRANSACTION, self.payment.id)
+        self.assertEqual(self._found("wanj"), {member, loan})
+        self.assertEqual(self._found("jane wan", [SearchEntry.KIND_LOAN]), {loan})
+        self.assertEqual(self._found("2345"), {loan})
+        self.assertEqual(self._found("cs-00"), {member})
+        self.assertEqual(self._found("0712 345"), set())
+        self.assertEqual(self._found("0712345"), {member, payment})
+        self.assertEqual(self._found("+2547123"), {member, payment})
+        self.assertEqual(self._found("qgh7-xk"), {payment})
+        self.assertEqual(self._found("jane w"), self._found("jane"))
+        self.assertEqual(self._found("q"), set())
+
+    def test_writes_keep_the_index_current(self):
+        self.loan.name = "Jane Achieng"
+        self.loan.save()
+        self.assertEqual(self._found("wanj", [SearchEntry.KIND_LOAN]), set())
+        self.assertEqual(self._found("achi"), {(SearchEntry.KIND_LOAN, self.loan.id)})
+
+        self.payment.delete()
+        self.assertEqual(self._found("qgh7"), set())
+        with self.assertNumQueries(1):
+            self.member.last_login = timezone.now()
+            self.member.save(update_fields=["last_login"])
+
+        before = sorted(SearchEntry.objects.values_list("kind", "object_id", "terms"))
+        rebuild_index()
+        self.assertEqual(sorted(SearchEntry.objects.values_list("kind", "object_id", "terms")), before)
+
+    def test_bulk_status_and_reference_updates_reach_the_index(self):
+        FakeDarajaBackend.reset()
+        pending = Transaction.objects.create(
+            user=self.member,
+            transaction_type=Transaction.TYPE_DEPOSIT,
+            status=Transaction.STATUS_PENDING,
+            amount=150,
+            phone_number="0712345678",
+        )
+        PaymentJob.objects.create(transaction=pending, callback_url="https://example.com/cb")
+        drain(FakeDarajaBackend())
+        pending.refresh_from_db()
+        [entry] = search(pending.payment_reference)
+        self.assertEqual(entry.object_id, pending.id)
+        self.assertEqual(entry.detail, f"{pending.payment_reference} · 0712345678 · Pending payment")
+
+        self.client.post(
+            reverse("mpesa-callback"), data=stk_callback_payload(pending.payment_reference), content_type="application/json"
+        )
+        self.assertEqual(search(pending.payment_reference)[0].detail, f"{pending.payment_reference} · 0712345678 · Completed")
+
+        self.client.force_login(User.objects.create_user(username="reviewer", is_staff=True))
+        self.client.post(reverse("loan-approval-dashboard"), {"action": "APPROVED", "loan_ids": [self.loan.id]})
+        [entry] = search("23456789")
+        self.assertEqual(entry.detail, "ID 23456789 · KES 500.00 · Approved")
+
+    def test_staff_search_page_and_admin_changelist_use_the_index(self):
+        admin = User.objects.create_user(username="reviewer", is_staff=True, is_superuser=True)
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get(reverse("admin-search-suggest"), {"q": "wanj"}).status_code, 302)
+
+        self.client.force_login(admin)
+        response = self.client.get(reverse("admin-search-suggest"), {"q": "wanj", "kind": SearchEntry.KIND_LOAN})
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {
+                    "kind": "loan",
+                    "kind_display": "Loan request",
+                    "title": "Jane Wanjiru",
+                    "detail": "ID 23456789 · KES 500 · Pending",
+                    "url": reverse("admin:FinanceApp_loanrequest_change", args=[self.loan.id]),
+                }
+            ],
+        )
+        self.assertContains(self.client.get(reverse("admin-search"), {"q": "okoth"}), "Peter Okoth")
+
+        response = self.client.get(reverse("admin:FinanceApp_loanrequest_changelist"), {"q": "2345"})
+        self.assertEqual(list(response.context["cl"].queryset), [self.loan])
+        # A single character is too short for the index and falls back to search_fields.
+        response = self.client.get(reverse("admin:FinanceApp_loanrequest_changelist"), {"q": "5"})
+        self.assertEqual(list(response.context["cl"].queryset), [self.loan])
+
+        applications = LoanRequest.objects.bulk_create(
+            LoanRequest(user=self.member, name="Bulk Applicant", id_number=str(number), document="loan.pdf", amount=10)
+            for number in range(600)
+        )
+        index_instances(LoanRequest, applications)
+        response = self.client.get(reverse("admin:FinanceApp_loanrequest_changelist"), {"q": "bulk appl"})
+        self.assertEqual(response.context["cl"].result_count, 600)
+
+
+class LedgerArchiveTests(TransactionTestCase):
+    # Archive tables are created with the schema editor, which SQLite refuses inside TestCase's transaction.
+
+    def setUp(self):
+        self.member = User.objects.create_user(username="member", password="pass12345")
+        self.old = []
+        for created_at, status, amount in [
+            (datetime(2024, 1, 5, 9), Transaction.STATUS_COMPLETED, 100),
+            (datetime(2024, 1, 20, 9), Transaction.STATUS_COMPLETED, 200),
+            (datetime(2024, 1, 20, 9), Transaction.STATUS_PENDING, 50),
+            (datetime(2024, 1, 31, 23), Transaction.STATUS_COMPLETED, 300),
+            (datetime(2024, 2, 10, 9), Transaction.STATUS_COMPLETED, 400),
+            (datetime(2024, 2, 11, 9), Transaction.STATUS_COMPLETED, 500),
+        ]:
+            txn = Transaction.objects.create(
+                user=self.member,
+                transaction_type=Transaction.TYPE_DEPOSIT,
+                status=status,
+                amount=amount,
+                payment_reference=f"QA{amount}",
+            )
+            Transaction.objects.filter(pk=txn.pk).update(created_at=timezone.make_aware(created_at))
+            self.old.append(txn)
+        self.recent = Transaction.objects.create(user=self.member, transaction_type=Transaction.TYPE_DEPOSIT, amount=10)
+        PaymentJob.objects.create(transaction=self.old[0], status=PaymentJob.STATUS_SENT, callback_url="https://example.com/cb")
+        ProcessedCallback.objects.create(checkout_request_id="ws_CO_1", result_code=0, transaction=self.old[0])
+        rebuild_rollups()
+
+    def tearDown(self):
+        for partition in LedgerPartition.objects.all():
+            with connection.schema_editor() as editor:
+                editor.delete_model(partition_model(partition.table_name))
+
+    def _archive(self, *args):
+        out = StringIO()
+        call_command("archive_ledger", *args, keep_months=1, chunk_size=2, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def _history(self):
+        self.client.force_login(self.member)
+        seen, cursor = [], None
+        while True:
+            params = {"page_size": 2, **({"cursor": cursor} if cursor else {})}
+            data = self.client.get(reverse("transactions-feed"), params).json()
+            seen.extend(row["id"] for row in data["results"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                return seen
+
+    def test_closed_months_move_to_verified_partitions_without_changing_the_ledger(self):
+        history = self._history()
+        rollups = sorted(AnalyticsRollup.objects.values_list("period", "category", "status", "count", "total_amount"))
+
+        output = self._archive()
+
+        self.assertIn("2 archived months verified.", output)
+        self.assertEqual(
+            set(Transaction.objects.values_list("id", flat=True)), {self.old[2].id, self.recent.id}
+        )
+        self.assertEqual(
+            list(LedgerPartition.objects.values_list("month", "row_count", "total_amount")),
+            [(date(2024, 2, 1), 2, 900), (date(2024, 1, 1), 3, 600)],
+        )
+        self.assertFalse(PaymentJob.objects.exists())
+        self.assertIsNone(ProcessedCallback.objects.get().transaction_id)
+        self.assertEqual(verify_balances(), [])
+        rebuild_rollups()
+        self.assertEqual(
+            sorted(AnalyticsRollup.objects.values_list("period", "category", "status", "count", "total_amount")), rollups
+        )
+        self.assertEqual(self._history(), history)
+
+        rows = list(csv.reader(StringIO(b"".join(self.client.get(reverse("transactions-export")).streaming_content).decode())))
+        self.assertEqual([row[3] for row in rows[1:]], ["100.00", "200.00", "50.00", "300.00", "400.00", "500.00", "10.00"])
+        february = {"date_from": "2024-02-01", "date_to": "2024-02-29"}
+        rows = list(csv.reader(StringIO(b"".join(self.client.get(reverse("transactions-export"), february).streaming_content).decode())))
+        self.assertEqual([row[3] for row in rows[1:]], ["400.00", "500.00"])
+        self.assertEqual(recorded_references(["QA100", "QA50", "QA999"]), {"QA100", "QA50"})
+
+    def test_archived_rows_are_read_only_and_tampering_fails_verification(self):
+        self._archive()
+        january = LedgerPartition.objects.get(month=date(2024, 1, 1))
+        with self.assertRaises(DatabaseError):
+            archived_rows(january).filter(id=self.old[0].id).update(amount=1)
+        with self.assertRaises(DatabaseError):
+            archived_rows(january).filter(id=self.old[0].id).delete()
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER "{january.table_name}_no_update"')
+        archived_rows(january).filter(id=self.old[0].id).update(amount=1)
+        self.assertEqual({field for field, _, _ in verify_partition(january)}, {"total_amount", "checksum"})
+        with self.assertRaises(CommandError):
+            self._archive("--verify")
+
+    def test_late_completions_are_appended_on_the_next_run(self):
+        self._archive()
+        Transaction.objects.filter(pk=self.old[2].pk).update(status=Transaction.STATUS_COMPLETED)
+        self.assertIn("2024-01: moved 1, 4 archived.", self._archive())
+        january = LedgerPartition.objects.get(month=date(2024, 1, 1))
+        self.assertEqual((january.row_count, january.total_amount), (4, 650))
+        self.assertEqual(verify_partition(january), [])
+        self.assertEqual(list(Transaction.objects.values_list("id", flat=True)), [self.recent.id])
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # The test database plays the primary. The replica is a second SQLite file copied from it with
+    # SQLite's backup API, so it lags behind the primary until the test replicates again. The
+    # alias is added after the test runner has set databases up, so it is not given a test copy.
+    databases = {"default"}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        replica = {"ENGINE": "django.db.backends.sqlite3", "NAME": os.path.join(cls.replica_dir.name, "replica.sqlite3")}
+        configured = connections.configure_settings({"default": connections.settings["default"], "replica": replica})
+        connections.settings["replica"] = configured["replica"]
+        cls.databases = {"default", "replica"}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.databases = {"default"}
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+        cls.replica_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.member = User.objects.create_user(username="member", password="pass12345")
+        self.client.force_login(self.member)
+        Transaction.objects.create(user=self.member, transaction_type=Transaction.TYPE_DEPOSIT, amount=100)
+        self._replicate()
+        Transaction.objects.create(user=self.member, transaction_type=Transaction.TYPE_DEPOSIT, amount=200)
+
+    def _replicate(self):
+        connections["replica"].close()
+        primary = connections["default"]
+        primary.ensure_connection()
+        replica = sqlite3.connect(connections["replica"].settings_dict["NAME"])
+        try:
+            primary.connection.backup(replica)
+        finally:
+            replica.close()
+
+    def _history(self):
+        return [row["amount"] for row in self.client.get(reverse("transactions-feed")).json()["results"]]
+
+    def test_read_only_views_use_the_replica_until_the_member_writes(self):
+        response = self.client.get(reverse("transactions-feed"))
+        self.assertEqual([row["amount"] for row in response.json()["results"]], ["100.00"])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        statement = b"".join(self.client.get(reverse("transactions-export")).streaming_content).decode()
+        self.assertEqual(len(statement.splitlines()), 2)
+
+        response = self.client.post(reverse("savings"), {"amount": "50", "notes": ""})
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], settings.DATABASE_REPLICA_PIN_SECONDS)
+        self.assertEqual(self._history(), ["200.00", "100.00"])
+
+        # Once the pin expires the member is back on the replica.
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(self._history(), ["100.00"])
+        self._replicate()
+        self.assertEqual(self._history(), ["200.00", "100.00"])
+
+    def test_home_summary_is_cached_from_the_primary(self):
+        SavingsRecord.objects.create(user=self.member, amount=50)
+        cache.clear()
+        self.assertEqual(self.client.get(reverse("home")).context["total_saved"], 50)
+        self._replicate()
+        self.assertEqual(self.client.get(reverse("home")).context["total_saved"], 50)
+
+    def test_async_requests_that_write_are_pinned(self):
+        async def view(request):
+            await sync_to_async(SavingsRecord.objects.create)(user=self.member, amount=10)
+            return HttpResponse("ok")
+
+        middleware = ReplicaPinMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get("/"))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_after_a_write_or_inside_a_transaction_stay_on_the_primary(self):
+        with reading_from("replica"):
+            self.assertEqual(Transaction.objects.count(), 1)
+            with db_transaction.atomic():
+                self.assertEqual(Transaction.objects.count(), 2)
+            with tracking_writes() as writes:
+                self.assertEqual(Transaction.objects.count(), 1)
+                SavingsRecord.objects.create(user=self.member, amount=10)
+                self.assertTrue(writes.seen)
+                self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(Transaction.objects.using("replica").count(), 1)
@@ -0,0 +1,177 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DateField, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import ledger_archive
+from .models import Transaction, TransactionTrend, TrendWatermark
+
+
+def _watermark():
+    mark, _ = TrendWatermark.objects.select_for_update().get_or_create(name=TrendWatermark.TRANSACTIONS)
+    return mark
+
+
+def hold_refresh():
+    """
+    Make ``refresh`` wait for the current transaction. Writers inserting rows dated in the past
+    (accruals, ledger imports) call this before they insert: the settle window goes by
+    ``created_at``, so it cannot tell their rows are still uncommitted, and a refresh running
+    alongside would move the watermark past their ids.
+    """
+    _watermark()
+
+
+def _buckets(querysets):
+    """``{(month, transaction_type, status): [count, total_amount]}`` summed over ``querysets``."""
+    buckets = defaultdict(lambda: [0, Decimal("0")])
+    for queryset in querysets:
+        rows = (
+            queryset.order_by()
+            .annotate(month=TruncMonth("created_at", output_field=DateField()))
+            .values("month", "transaction_type", "status")
+            .annotate(count=Count("id"), total_amount=Sum("amount"))
+        )
+        for row in rows:
+            bucket = buckets[row["month"], row["transaction_type"], row["status"]]
+            bucket[0] += row["count"]
+            bucket[1] += row["total_amount"] or 0
+    return buckets
+
+
+def _settled_through(querysets, last_id, now):
+    """
+    The highest id below the first row written in the last ``TRANSACTION_TRENDS_SETTLE_SECONDS``:
+    rows with lower ids than a recent one may still be committing, so everything from it on is
+    left for a later refresh. Rows dated ahead of ``now`` (scheduled accruals) are not being
+    written and do not stop it; backdated writers hold the refresh off instead (``hold_refresh``).
+    """
+    recent = Q(created_at__gte=now - timedelta(seconds=settings.TRANSACTION_TRENDS_SETTLE_SECONDS), created_at__lte=now)
+    stops = [queryset.filter(recent).aggregate(first=Min("id"))["first"] for queryset in querysets]
+    stops = [stop for stop in stops if stop is not None]
+    if stops:
+        return min(stops) - 1
+    highest = [queryset.aggregate(last=Max("id"))["last"] for queryset in querysets]
+    return max([last_id] + [last for last in highest if last is not None])
+
+
+def refresh(rebuild=False, now=None):
+    """
+    Fold the settled transactions above the watermark into ``TransactionTrend`` and advance it.
+
+    Each refresh reads only rows with a higher id than the last one, found through the primary
+    key. Pending payments are passed over rather than holding the watermark back: their ids are
+    kept on it and each refresh folds in the ones that have since completed or failed, however
+    long they stay pending. Settled rows are not expected to change, since callbacks and
+    reconciliation only move pending payments. Edits or deletes of settled rows are picked up by
+    ``rebuild``, which starts over from the first id. Archived rows stay counted after
+    ``archive_ledger`` moves them. Returns the number of transactions folded in.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        mark = _watermark()
+        if rebuild:
+            TransactionTrend.objects.all().delete()
+            mark.last_id = 0
+            mark.pending_ids = []
+        new_rows = [queryset.filter(id__gt=mark.last_id) for queryset in ledger_archive.sources()]
+        through = _settled_through(new_rows, mark.last_id, now)
+        candidates = [queryset.filter(id__lte=through) for queryset in new_rows] + [
+            queryset.filter(id__in=mark.pending_ids) for queryset in ledger_archive.sources()
+        ]
+        # Read before the fold, so a payment settling in between waits for the next refresh
+        # instead of being missed by both.
+        pending_ids = sorted(
+            {
+                txn_id
+                for queryset in candidates
+                for txn_id in queryset.filter(status=Transaction.STATUS_PENDING).values_list("id", flat=True)
+            }
+        )
+
+        folded = 0
+        for (month, transaction_type, status), (count, amount) in _buckets(
+            queryset.exclude(id__in=pending_ids) for queryset in candidates
+        ).items():
+            key = {"month": month, "transaction_type": transaction_type, "status": status}
+            updates = {"count": F("count") + count, "total_amount": F("total_amount") + amount}
+            # The watermark lock keeps refreshes from racing, so a missing bucket can just be created.
+            if not TransactionTrend.objects.filter(**key).update(**updates):
+                TransactionTrend.objects.create(count=count, total_amount=amount, **key)
+            folded += count
+
+        mark.last_id = through
+        mark.pending_ids = pending_ids
+        mark.refreshed_at = now
+        mark.save(update_fields=["last_id", "pending_ids", "refreshed_at"])
+    return folded
+
+
+def _summary(summarized):
+    """
+    The watermark and the ``summarized`` trend rows as of the same refresh. A refresh commits both
+    together, so if the watermark reads the same before and after the rows, no refresh committed
+    in between; otherwise the read is repeated, rather than counting rows both in the summary and
+    above an older watermark.
+    """
+    marks = TrendWatermark.objects.filter(name=TrendWatermark.TRANSACTIONS).values("last_id", "pending_ids")
+    mark = marks.first() or {"last_id": 0, "pending_ids": []}
+    while True:
+        rows = list(summarized)
+        current = marks.first() or {"last_id": 0, "pending_ids": []}
+        if current == mark:
+            return mark, rows
+        mark = current
+
+
+def _months(start, count):
+    first = start.year * 12 + start.month - 1
+    return [date((first + offset) // 12, (first + offset) % 12 + 1, 1) for offset in range(count)]
+
+
+def monthly_trends(months=12, status=None, now=None):
+    """
+    Count and sum of transactions per month and type over the last ``months`` months, this one
+    included, optionally for one ``status``.
+
+    Reads the summary up to the watermark and aggregates the few rows above it, plus the pending
+    ones it passed over, live, so the figures are current however long ago the last refresh ran.
+    Returns ``(month_starts, {transaction_type: [(count, total_amount), ...]})`` with one entry
+    per month, zero-filled.
+    """
+    window_start = ledger_archive.archive_cutoff(months - 1, now)
+    first_month = timezone.localtime(window_start).date()
+    month_starts = _months(first_month, months)
+
+    summarized = TransactionTrend.objects.filter(month__gte=first_month)
+    if status:
+        summarized = summarized.filter(status=status)
+    mark, summarized = _summary(summarized)
+    unfolded = Q(id__gt=mark["last_id"]) | Q(id__in=mark["pending_ids"])
+    recent = [
+        queryset.filter(unfolded, created_at__gte=window_start) for queryset in ledger_archive.sources(start=window_start)
+    ]
+    if status:
+        recent = [queryset.filter(status=status) for queryset in recent]
+
+    buckets = _buckets(recent)
+    for trend in summarized:
+        bucket = buckets[trend.month, trend.transaction_type, trend.status]
+        bucket[0] += trend.count
+        bucket[1] += trend.total_amount
+
+    index = {month: position for position, month in enumerate(month_starts)}
+    series = {transaction_type: [[0, Decimal("0")] for _ in month_starts] for transaction_type, _ in Transaction.TYPE_CHOICES}
+    for (month, transaction_type, _), (count, amount) in buckets.items():
+        if month in index and transaction_type in series:
+            point = series[transaction_type][index[month]]
+            point[0] += count
+            point[1] += amount
+    return month_starts, {
+        transaction_type: [tuple(point) for point in points] for transaction_type, points in series.items()
+    }
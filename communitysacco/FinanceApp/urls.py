@@ -5,10 +5,22 @@ urlpatterns = [
     path('savings/', views.savings, name='savings'),
     path('index/', views.index, name='index'),
     path('loans/', views.loans, name='loans'),
+    path('loans/<int:loan_id>/document/', views.loan_document, name='loan-document'),
+    path('loans/<int:loan_id>/document/preview/', views.loan_document_preview, name='loan-document-preview'),
     path('transactions/', views.transactions, name='transactions'),
+    path('transactions/feed/', views.transactions_feed, name='transactions-feed'),
+    path('transactions/export/', views.transactions_export, name='transactions-export'),
     path('admin/login/', views.admin_login, name='admin-login'),
     path('admin/loans/', views.loan_approval_dashboard, name='loan-approval-dashboard'),
     path('admin/analytics/', views.admin_analytics_dashboard, name='admin-analytics-dashboard'),
+    path('admin/analytics/trends/', views.admin_transaction_trends, name='admin-transaction-trends'),
+    path('admin/transactions/export/', views.admin_transactions_export, name='admin-transactions-export'),
+    path('admin/search/', views.admin_search, name='admin-search'),
+    path('admin/search/suggest/', views.admin_search_suggest, name='admin-search-suggest'),
+    path('admin/metrics/', views.admin_request_metrics, name='admin-request-metrics'),
+    path('metrics/', views.request_metrics_export, name='request-metrics-export'),
     path('payment/',views.mpesaPayment,name='mpesaPayment'),
+    path('payment/jobs/<int:job_id>/', views.payment_job_status, name='payment-job-status'),
     path('payment/callback/', views.mpesa_callback, name='mpesa-callback'),
+    path('payment/callback/batch/', views.mpesa_callback_batch, name='mpesa-callback-batch'),
 ]
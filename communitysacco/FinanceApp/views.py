@@ -1,32 +1,65 @@
+import hmac
 import json
+import mimetypes
 from decimal import Decimal, InvalidOperation
+from pathlib import Path
 
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.conf import settings
-from django.db.models import Count, Sum
-from django.db.models.functions import TruncMonth
-from django.http import HttpResponse, JsonResponse
+from django.db.models import Exists, F, OuterRef, Subquery
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .analytics import rollup_totals
+from .callbacks import apply_stk_callback, ingest_callbacks, iter_jsonl_callbacks, parse_stk_callback
+from .documents import document_response
+from .exports import LEDGER_COLUMNS, csv_download, iter_transaction_csv
+from .forms import LoanFilterForm, LoanRequestForm, SavingsRecordForm, TransactionFilterForm, TransactionTrendForm
+from .ledger import get_balance
+from .ledger_archive import ledger_page, sources as ledger_sources
+from .loan_limits import cached_limit, score_limits
+from .loan_review import REVIEW_DECISIONS, review_loans
+from .member_summary import cache_stats as summary_cache_stats
+from .models import (
+    AnalyticsRollup,
+    LoanDocument,
+    LoanRequest,
+    PaymentJob,
+    RepaymentInstalment,
+    SearchEntry,
+    Transaction,
+    UserLoanLimit,
+)
+from .pagination import InvalidCursor, keyset_page, resolve_page_size
+from .payment_queue import enqueue_stk_push
+from .payments import PaymentGatewayError, get_payment_backend
+from .replicas import read_database, replica_reads
+from .request_metrics import collect as collect_request_metrics, prometheus_text, route_rows
+from .search import search as search_index
+from .trends import monthly_trends
+
+PENDING_LOANS_PAGE_SIZE = 10
 
-from .forms import LoanRequestForm, SavingsRecordForm
-from .models import LoanRequest, Transaction, UserLoanLimit
-from django_daraja.mpesa.core import MpesaClient
 
 def index(request):
-    cl = MpesaClient()
     # Use a Safaricom phone number that you have access to, for you to be able to view the prompt.
     phone_number = '+254742252718'
     amount = 1
     account_reference = 'reference'
     transaction_desc = 'Description'
     callback_url = 'https://api.darajambili.com/express-payment'
-    response = cl.stk_push(phone_number, amount, account_reference, transaction_desc, callback_url)
-    return HttpResponse(response)
+    try:
+        result = get_payment_backend().stk_push(phone_number, amount, account_reference, transaction_desc, callback_url)
+    except PaymentGatewayError as exc:
+        return HttpResponse(f"STK push failed: {exc}", status=502)
+    return HttpResponse(f"accepted={result.accepted} checkout_request_id={result.checkout_request_id} {result.message}")
 
 
 
@@ -34,6 +67,14 @@ def _is_staff(user):
     return user.is_authenticated and user.is_staff
 
 
+def _object_id(raw_id):
+    """``raw_id`` as a primary key, or ``None`` unless it is a plain ASCII number that fits one."""
+    if not (raw_id.isascii() and raw_id.isdecimal()):
+        return None
+    object_id = int(raw_id)
+    return object_id if object_id < 2**63 else None
+
+
 @login_required
 def savings(request):
     if request.method == "POST":
@@ -48,8 +89,7 @@ def savings(request):
         form = SavingsRecordForm()
 
     records = request.user.savings_records.all()
-    total_saved = records.aggregate(total=Sum("amount"))["total"] or 0
-    context = {"form": form, "records": records, "total_saved": total_saved}
+    context = {"form": form, "records": records, "total_saved": get_balance(request.user).total_saved}
     return render(request, "FinanceApp/savings.html", context)
 
 
@@ -57,24 +97,119 @@ def savings(request):
 def loans(request):
     if request.method == "POST":
         form = LoanRequestForm(request.POST, request.FILES)
+        loan_limit = cached_limit(request.user)
+        if form.is_valid() and loan_limit is not None and form.cleaned_data["amount"] > loan_limit:
+            form.add_error("amount", f"This exceeds your loan limit of {loan_limit}.")
         if form.is_valid():
             loan_request = form.save(commit=False)
             loan_request.user = request.user
+            loan_request.apply_product_terms()
             loan_request.save()
             messages.success(request, "Loan request submitted and awaiting admin approval.")
             return redirect("loans")
     else:
         form = LoanRequestForm(initial={"name": request.user.get_full_name() or request.user.username})
-
-    user_loans = request.user.loan_requests.all()
-    context = {"form": form, "loan_requests": user_loans}
+        loan_limit = cached_limit(request.user)
+
+    next_instalment = RepaymentInstalment.objects.filter(
+        loan=OuterRef("pk"), amount_paid__lt=F("principal_due") + F("interest_due")
+    ).order_by("number")
+    user_loans = request.user.loan_requests.annotate(
+        next_due_date=Subquery(next_instalment.values("due_date")[:1]),
+        next_due_amount=Subquery(
+            next_instalment.annotate(balance=F("principal_due") + F("interest_due") - F("amount_paid")).values("balance")[:1]
+        ),
+    )
+    context = {"form": form, "loan_requests": user_loans, "loan_limit": loan_limit}
     return render(request, "FinanceApp/loans.html", context)
 
 
+def _visible_loan(request, loan_id):
+    loan_request = get_object_or_404(LoanRequest.objects.select_related("stored_document"), id=loan_id)
+    if loan_request.user_id != request.user.id and not request.user.is_staff:
+        raise Http404
+    return loan_request
+
+
+@login_required
+def loan_document(request, loan_id):
+    loan_request = _visible_loan(request, loan_id)
+    stored = loan_request.stored_document
+    if stored is not None:
+        name, content_type = stored.name, stored.content_type
+    else:
+        # Uploaded before content-addressed storage: the file sits at its original name.
+        name = loan_request.document.name
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    response = document_response(request, name, content_type, f"loan-{loan_request.id}-document{Path(name).suffix}")
+    if response is None:
+        raise Http404
+    return response
+
+
+@login_required
+def loan_document_preview(request, loan_id):
+    stored = _visible_loan(request, loan_id).stored_document
+    if stored is None or stored.preview_status != LoanDocument.PREVIEW_READY:
+        raise Http404
+    response = document_response(request, stored.preview_name, "image/jpeg", f"loan-{loan_id}-preview.jpg")
+    if response is None:
+        raise Http404
+    return response
+
+
 @login_required
+@replica_reads
 def transactions(request):
-    user_transactions = request.user.transactions.all()
-    return render(request, "FinanceApp/transactions.html", {"transactions": user_transactions})
+    page_size = resolve_page_size(request.GET.get("page_size"))
+    try:
+        user_transactions, next_cursor = ledger_page(request.GET.get("cursor"), page_size, user_id=request.user.id)
+    except InvalidCursor:
+        return redirect("transactions")
+    context = {
+        "transactions": user_transactions,
+        "next_cursor": next_cursor,
+        "page_size": page_size,
+        "is_first_page": not request.GET.get("cursor"),
+        "export_form": TransactionFilterForm(),
+    }
+    return render(request, "FinanceApp/transactions.html", context)
+
+
+@login_required
+@replica_reads
+def transactions_feed(request):
+    page_size = resolve_page_size(request.GET.get("page_size"))
+    try:
+        user_transactions, next_cursor = ledger_page(request.GET.get("cursor"), page_size, user_id=request.user.id)
+    except InvalidCursor:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+
+    results = [
+        {
+            "id": txn.id,
+            "created_at": txn.created_at.isoformat(),
+            "transaction_type": txn.transaction_type,
+            "transaction_type_display": txn.get_transaction_type_display(),
+            "status": txn.status,
+            "status_display": txn.get_status_display(),
+            "amount": str(txn.amount),
+            "description": txn.description,
+            "payment_reference": txn.payment_reference,
+        }
+        for txn in user_transactions
+    ]
+    return JsonResponse({"results": results, "next_cursor": next_cursor})
+
+
+@login_required
+def transactions_export(request):
+    filter_form = TransactionFilterForm(request.GET or None)
+    # Rows stream after the view returns, outside replica_reads, so the querysets name the database.
+    database = read_database(request)
+    sources = [rows.using(database).filter(user_id=request.user.id) for rows in ledger_sources(*filter_form.bounds())]
+    lines = iter_transaction_csv([filter_form.filter(rows) for rows in sources])
+    return csv_download(lines, f"statement-{request.user.username}-{timezone.localdate():%Y%m%d}.csv")
 
 
 def admin_login(request):
@@ -83,33 +218,54 @@ def admin_login(request):
 
 @login_required(login_url="admin-login")
 @user_passes_test(_is_staff, login_url="admin-login")
+def admin_transactions_export(request):
+    filter_form = TransactionFilterForm(request.GET or None)
+    database = read_database(request)
+    sources = [rows.using(database) for rows in ledger_sources(*filter_form.bounds())]
+    lines = iter_transaction_csv([filter_form.filter(rows) for rows in sources], columns=LEDGER_COLUMNS)
+    return csv_download(lines, f"ledger-{timezone.localdate():%Y%m%d}.csv")
+
+
+def _with_query(request, **params):
+    query = request.GET.copy()
+    for key, value in params.items():
+        if value is None:
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return f"?{query.urlencode()}"
+
+
+@login_required(login_url="admin-login")
+@user_passes_test(_is_staff, login_url="admin-login")
+@replica_reads
 def loan_approval_dashboard(request):
     if request.method == "POST":
         action = request.POST.get("action")
 
-        if action in [LoanRequest.STATUS_APPROVED, LoanRequest.STATUS_REJECTED]:
-            loan_request = get_object_or_404(LoanRequest, id=request.POST.get("loan_id"))
-            admin_comment = request.POST.get("admin_comment", "").strip()
-            if loan_request.user_id == request.user.id:
-                messages.error(request, "You cannot approve or reject your own loan request.")
+        if action in REVIEW_DECISIONS:
+            raw_ids = request.POST.getlist("loan_ids") or [request.POST.get("loan_id", "")]
+            loan_ids = [loan_id for loan_id in map(_object_id, raw_ids) if loan_id is not None]
+            if not loan_ids:
+                messages.error(request, "Select at least one loan request.")
                 return redirect("loan-approval-dashboard")
-            loan_request.status = action
-            loan_request.admin_comment = admin_comment
-            loan_request.reviewed_by = request.user
-            loan_request.reviewed_at = timezone.now()
-            loan_request.save()
+            if len(loan_ids) == 1:
+                loan_request = get_object_or_404(LoanRequest, id=loan_ids[0])
+                if loan_request.user_id == request.user.id:
+                    messages.error(request, "You cannot approve or reject your own loan request.")
+                    return redirect("loan-approval-dashboard")
 
-            if action == LoanRequest.STATUS_APPROVED:
-                Transaction.objects.create(
-                    user=loan_request.user,
-                    transaction_type=Transaction.TYPE_LOAN_DISBURSEMENT,
-                    status=Transaction.STATUS_COMPLETED,
-                    amount=loan_request.amount,
-                    description=f"Approved loan: {loan_request.name}",
-                )
-                messages.success(request, "Loan approved successfully.")
-            else:
-                messages.info(request, "Loan rejected.")
+            admin_comment = request.POST.get("admin_comment", "").strip()
+            reviewed, skipped = review_loans(loan_ids, action, request.user, admin_comment)
+            if len(loan_ids) == 1 and reviewed:
+                if action == LoanRequest.STATUS_APPROVED:
+                    messages.success(request, "Loan approved successfully.")
+                else:
+                    messages.info(request, "Loan rejected.")
+            elif reviewed:
+                messages.success(request, f"{reviewed} loans {action.lower()}.")
+            if skipped:
+                messages.info(request, f"Skipped {skipped} loan requests that were already reviewed or are your own.")
         elif action == "SET_LIMIT":
             target_user_id = request.POST.get("target_user_id")
             raw_limit = request.POST.get("loan_limit_amount", "").strip()
@@ -121,34 +277,70 @@ def loan_approval_dashboard(request):
                 except InvalidOperation:
                     messages.error(request, "Invalid loan limit amount.")
                     return redirect("loan-approval-dashboard")
+                loan_limit_obj.is_manual = True
+                loan_limit_obj.needs_scoring = False
+                loan_limit_obj.save()
+                messages.success(request, f"Loan limit updated for {target_user.username}.")
             else:
-                loan_limit_obj.amount = None
-            loan_limit_obj.save()
-            messages.success(request, f"Loan limit updated for {target_user.username}.")
+                loan_limit_obj.is_manual = False
+                loan_limit_obj.save()
+                score_limits([target_user.id])
+                messages.success(request, f"{target_user.username}'s loan limit is scored automatically again.")
         return redirect("loan-approval-dashboard")
 
-    pending_loans = LoanRequest.objects.filter(status=LoanRequest.STATUS_PENDING)
-    all_loans = LoanRequest.objects.select_related("user", "reviewed_by")
-    applicants = User.objects.filter(loan_requests__isnull=False).distinct().order_by("username")
-    limits_by_user_id = {limit.user_id: limit.amount for limit in UserLoanLimit.objects.filter(user__in=applicants)}
-    applicants_with_limits = [
-        {"id": applicant.id, "username": applicant.username, "limit": limits_by_user_id.get(applicant.id)}
-        for applicant in applicants
-    ]
+    filter_form = LoanFilterForm(request.GET or None)
+    page_size = resolve_page_size(request.GET.get("page_size"))
+    try:
+        pending_loans, next_pending_cursor = keyset_page(
+            filter_form.filter(LoanRequest.objects.filter(status=LoanRequest.STATUS_PENDING), by_status=False)
+            .select_related("user", "stored_document"),
+            request.GET.get("pending_cursor"),
+            PENDING_LOANS_PAGE_SIZE,
+        )
+        all_loans, next_cursor = keyset_page(
+            filter_form.filter(LoanRequest.objects.select_related("user", "reviewed_by")),
+            request.GET.get("cursor"),
+            page_size,
+        )
+    except InvalidCursor:
+        return redirect("loan-approval-dashboard")
+
+    applicants_with_limits = (
+        User.objects.filter(Exists(LoanRequest.objects.filter(user=OuterRef("pk"))))
+        .annotate(limit=F("loan_limit__amount"), manual_limit=F("loan_limit__is_manual"))
+        .order_by("username")
+        .values("id", "username", "limit", "manual_limit")
+    )
     context = {
+        "filter_form": filter_form,
         "pending_loans": pending_loans,
         "all_loans": all_loans,
         "applicants_with_limits": applicants_with_limits,
+        "next_pending_url": _with_query(request, pending_cursor=next_pending_cursor) if next_pending_cursor else "",
+        "next_loans_url": _with_query(request, cursor=next_cursor) if next_cursor else "",
+        "first_page_url": _with_query(request, cursor=None, pending_cursor=None),
+        "is_first_page": not (request.GET.get("cursor") or request.GET.get("pending_cursor")),
     }
     return render(request, "FinanceApp/loan_approval_dashboard.html", context)
 
 
+# Rendering may load the session, user and messages lazily, which the ORM only allows off the event loop.
+_arender = sync_to_async(render)
+
+
 @login_required
-def mpesaPayment(request):
+async def mpesaPayment(request):
+    """
+    Queue an STK push for the member and show its progress.
+
+    Async so that, under ASGI, a request waiting on the database does not hold
+    a worker thread; the push itself is sent by ``run_payment_worker``.
+    """
     initial_payment_type = request.GET.get("payment_type", Transaction.TYPE_DEPOSIT)
     initial_amount = request.GET.get("amount", "")
     if initial_payment_type not in [Transaction.TYPE_DEPOSIT, Transaction.TYPE_LOAN_REPAYMENT]:
         initial_payment_type = Transaction.TYPE_DEPOSIT
+    user = await request.auser()
 
     if request.method == "POST":
         phone_number = request.POST.get("phonenumber", "").strip()
@@ -164,7 +356,7 @@ def mpesaPayment(request):
                 raise InvalidOperation
         except (InvalidOperation, TypeError):
             messages.error(request, "Enter a valid payment amount greater than zero.")
-            return render(
+            return await _arender(
                 request,
                 "FinanceApp/prompt_stk_push.html",
                 {"initial_payment_type": payment_type, "initial_amount": raw_amount, "initial_phone_number": phone_number},
@@ -172,86 +364,51 @@ def mpesaPayment(request):
 
         if not phone_number:
             messages.error(request, "Phone number is required.")
-            return render(
+            return await _arender(
                 request,
                 "FinanceApp/prompt_stk_push.html",
                 {"initial_payment_type": payment_type, "initial_amount": raw_amount, "initial_phone_number": phone_number},
             )
 
-        cl = MpesaClient()
-        callback_url = _resolve_callback_url(request)
-        account_reference = "FinanceApp"
-        transaction_desc = "Loan repay" if payment_type == Transaction.TYPE_LOAN_REPAYMENT else "Savings"
+        payment_job = await sync_to_async(enqueue_stk_push)(
+            user, payment_type, amount_decimal, phone_number, _resolve_callback_url(request)
+        )
+        messages.success(
+            request,
+            "Payment request received. Check your phone for the STK prompt. Status will remain Pending payment until confirmed.",
+        )
+        return redirect(f"{reverse('mpesaPayment')}?job={payment_job.id}")
 
-        try:
-            response = cl.stk_push(
-                phone_number,
-                int(amount_decimal),
-                account_reference,
-                transaction_desc,
-                callback_url,
-            )
-            response_code = str(getattr(response, "response_code", "") or "")
-            response_desc = getattr(response, "response_description", "") or ""
-            error_message = getattr(response, "error_message", "") or ""
-            customer_message = getattr(response, "customer_message", "") or ""
-
-            if response_code != "0":
-                problem_text = error_message or response_desc or customer_message or "STK request was not accepted."
-                messages.error(request, f"STK push failed: {problem_text}")
-                return render(
-                    request,
-                    "FinanceApp/prompt_stk_push.html",
-                    {"initial_payment_type": payment_type, "initial_amount": raw_amount, "initial_phone_number": phone_number},
-                )
-
-            payment_reference = _extract_checkout_id(response)
-            Transaction.objects.create(
-                user=request.user,
-                transaction_type=payment_type,
-                status=Transaction.STATUS_PENDING,
-                amount=amount_decimal,
-                phone_number=phone_number,
-                payment_reference=payment_reference,
-                description=f"STK push initiated for {transaction_desc.lower()}",
-            )
-            messages.success(
-                request,
-                "STK push sent. Check your phone to complete payment. Status will remain Pending payment until confirmed.",
-            )
-        except Exception:
-            messages.error(request, "Unable to initiate STK push. Please retry.")
+    payment_job = None
+    job_id = _object_id(request.GET.get("job", ""))
+    if job_id is not None:
+        payment_job = await PaymentJob.objects.filter(id=job_id, transaction__user=user).afirst()
 
     context = {
         "initial_payment_type": initial_payment_type,
         "initial_amount": initial_amount,
+        "payment_job": payment_job,
     }
-    return render(request, "FinanceApp/prompt_stk_push.html", context)
+    return await _arender(request, "FinanceApp/prompt_stk_push.html", context)
 
 
-def _extract_checkout_id(response):
-    if isinstance(response, dict):
-        return (
-            response.get("CheckoutRequestID")
-            or response.get("checkout_request_id")
-            or response.get("checkoutRequestID")
-            or ""
-        )
-
-    checkout_from_attr = getattr(response, "checkout_request_id", None)
-    if checkout_from_attr:
-        return str(checkout_from_attr)
-
-    response_data = getattr(response, "response", None)
-    if isinstance(response_data, dict):
-        return str(
-            response_data.get("CheckoutRequestID")
-            or response_data.get("checkout_request_id")
-            or response_data.get("checkoutRequestID")
-            or ""
-        )
-
-    return ""
+@login_required
+def payment_job_status(request, job_id):
+    payment_job = get_object_or_404(
+        PaymentJob.objects.select_related("transaction"), id=job_id, transaction__user=request.user
+    )
+    return JsonResponse(
+        {
+            "id": payment_job.id,
+            "status": payment_job.status,
+            "status_display": payment_job.get_status_display(),
+            "attempts": payment_job.attempts,
+            "error": payment_job.last_error,
+            "transaction_status": payment_job.transaction.status,
+            "transaction_status_display": payment_job.transaction.get_status_display(),
+            "finished": payment_job.status in [PaymentJob.STATUS_SENT, PaymentJob.STATUS_FAILED],
+        }
+    )
 
 
 def _resolve_callback_url(request):
@@ -268,7 +425,7 @@ def _resolve_callback_url(request):
 
 
 @csrf_exempt
-def mpesa_callback(request):
+async def mpesa_callback(request):
     if request.method != "POST":
         return JsonResponse({"ResultCode": 1, "ResultDesc": "Invalid request method"}, status=405)
 
@@ -277,51 +434,56 @@ def mpesa_callback(request):
     except json.JSONDecodeError:
         payload = {}
 
-    callback_data = payload.get("Body", {}).get("stkCallback", {})
-    checkout_request_id = callback_data.get("CheckoutRequestID") or payload.get("CheckoutRequestID")
-    result_code = callback_data.get("ResultCode", payload.get("ResultCode"))
-
-    if checkout_request_id:
-        transaction = Transaction.objects.filter(payment_reference=checkout_request_id).order_by("-created_at").first()
-        if transaction:
-            transaction.status = (
-                Transaction.STATUS_COMPLETED if str(result_code) == "0" else Transaction.STATUS_PENDING
-            )
-            if str(result_code) != "0":
-                transaction.description = (
-                    f"{transaction.description}. Payment not completed yet."
-                    if transaction.description
-                    else "Payment not completed yet."
-                )
-            transaction.save(update_fields=["status", "description"])
+    callback = parse_stk_callback(payload)
+    if callback is not None:
+        # Applying a callback is one short transaction; atomic blocks need the sync ORM.
+        await sync_to_async(apply_stk_callback)(callback)
 
     return JsonResponse({"ResultCode": 0, "ResultDesc": "Accepted"})
 
 
+@csrf_exempt
+@require_POST
+def mpesa_callback_batch(request):
+    expected_token = getattr(settings, "CALLBACK_INGEST_TOKEN", "")
+    provided_token = request.headers.get("X-Callback-Ingest-Token", "")
+    if not expected_token or not hmac.compare_digest(provided_token, expected_token):
+        return JsonResponse({"error": "Not authorised."}, status=403)
+
+    batch_size = resolve_page_size(request.GET.get("batch_size"), default=1000, maximum=5000)
+    stats = ingest_callbacks(iter_jsonl_callbacks(request), batch_size)
+    return JsonResponse(dict(stats))
+
+
 @login_required(login_url="admin-login")
 @user_passes_test(_is_staff, login_url="admin-login")
+@replica_reads
 def admin_analytics_dashboard(request):
-    loan_status_counts = LoanRequest.objects.values("status").annotate(total=Count("id")).order_by("status")
-    loan_status_labels = [item["status"].title() for item in loan_status_counts]
-    loan_status_data = [item["total"] for item in loan_status_counts]
-
-    repayment_status_counts = (
-        Transaction.objects.filter(transaction_type=Transaction.TYPE_LOAN_REPAYMENT)
-        .values("status")
-        .annotate(total=Count("id"))
-        .order_by("status")
-    )
-    repayment_status_labels = ["Completed" if item["status"] == Transaction.STATUS_COMPLETED else "Pending payment" for item in repayment_status_counts]
-    repayment_status_data = [item["total"] for item in repayment_status_counts]
-
-    monthly_transactions = (
-        Transaction.objects.annotate(month=TruncMonth("created_at"))
-        .values("month")
-        .annotate(total=Count("id"))
-        .order_by("month")
-    )
-    monthly_labels = [item["month"].strftime("%b %Y") for item in monthly_transactions if item["month"]]
-    monthly_data = [item["total"] for item in monthly_transactions if item["month"]]
+    loan_status_totals = {}
+    repayment_status_totals = {}
+    total_applicants = 0
+    total_loan_repayment = 0
+    pending_payments = 0
+    for (metric, category, status), (count, amount) in sorted(rollup_totals().items()):
+        if metric == AnalyticsRollup.METRIC_LOAN_REQUEST and count:
+            loan_status_totals[status] = count
+        elif metric == AnalyticsRollup.METRIC_LOAN_APPLICANT:
+            total_applicants += count
+        elif metric == AnalyticsRollup.METRIC_TRANSACTION:
+            if status == Transaction.STATUS_PENDING:
+                pending_payments += count
+            if category == Transaction.TYPE_LOAN_REPAYMENT:
+                if count:
+                    repayment_status_totals[status] = count
+                if status == Transaction.STATUS_COMPLETED:
+                    total_loan_repayment += amount
+
+    loan_status_labels = [status.title() for status in loan_status_totals]
+    loan_status_data = list(loan_status_totals.values())
+
+    status_names = dict(Transaction.STATUS_CHOICES)
+    repayment_status_labels = [status_names.get(status, status.title()) for status in repayment_status_totals]
+    repayment_status_data = list(repayment_status_totals.values())
 
     recent_payment_transactions = (
         Transaction.objects.filter(
@@ -331,20 +493,10 @@ def admin_analytics_dashboard(request):
         .order_by("-created_at")[:15]
     )
 
-    total_applicants = LoanRequest.objects.values("user_id").distinct().count()
-    total_loan_repayment = (
-        Transaction.objects.filter(
-            transaction_type=Transaction.TYPE_LOAN_REPAYMENT,
-            status=Transaction.STATUS_COMPLETED,
-        ).aggregate(total=Sum("amount"))["total"]
-        or 0
-    )
-    pending_payments = Transaction.objects.filter(status=Transaction.STATUS_PENDING).count()
-
     context = {
         "total_applicants": total_applicants,
-        "total_loan_requests": LoanRequest.objects.count(),
-        "approved_loans": LoanRequest.objects.filter(status=LoanRequest.STATUS_APPROVED).count(),
+        "total_loan_requests": sum(loan_status_data),
+        "approved_loans": loan_status_totals.get(LoanRequest.STATUS_APPROVED, 0),
         "pending_payments": pending_payments,
         "total_loan_repayment": total_loan_repayment,
         "recent_payment_transactions": recent_payment_transactions,
@@ -352,7 +504,92 @@ def admin_analytics_dashboard(request):
         "loan_status_data": json.dumps(loan_status_data),
         "repayment_status_labels": json.dumps(repayment_status_labels),
         "repayment_status_data": json.dumps(repayment_status_data),
-        "monthly_labels": json.dumps(monthly_labels),
-        "monthly_data": json.dumps(monthly_data),
+        "trend_form": TransactionTrendForm(),
+        "export_form": TransactionFilterForm(),
+        "summary_cache": summary_cache_stats(),
     }
     return render(request, "FinanceApp/admin_analytics_dashboard.html", context)
+
+
+@login_required(login_url="admin-login")
+@user_passes_test(_is_staff, login_url="admin-login")
+@replica_reads
+def admin_transaction_trends(request):
+    trend_form = TransactionTrendForm(request.GET)
+    if not trend_form.is_valid():
+        return JsonResponse({"error": "Invalid window.", "fields": trend_form.errors}, status=400)
+
+    months, series = monthly_trends(trend_form.cleaned_data["months"], trend_form.cleaned_data["status"])
+    type_names = dict(Transaction.TYPE_CHOICES)
+    return JsonResponse(
+        {
+            "months": [month.strftime("%Y-%m") for month in months],
+            "labels": [month.strftime("%b %Y") for month in months],
+            "series": [
+                {
+                    "transaction_type": transaction_type,
+                    "transaction_type_display": type_names[transaction_type],
+                    "counts": [count for count, _ in points],
+                    "totals": [str(amount) for _, amount in points],
+                }
+                for transaction_type, points in series.items()
+            ],
+        }
+    )
+
+
+SEARCH_RESULT_URLS = {
+    SearchEntry.KIND_MEMBER: "admin:auth_user_change",
+    SearchEntry.KIND_LOAN: "admin:FinanceApp_loanrequest_change",
+    SearchEntry.KIND_TRANSACTION: "admin:FinanceApp_transaction_change",
+}
+
+
+def _search_results(request, limit):
+    kinds = [kind for kind in request.GET.getlist("kind") if kind in SEARCH_RESULT_URLS]
+    return [
+        {
+            "kind": entry.kind,
+            "kind_display": entry.get_kind_display(),
+            "title": entry.title,
+            "detail": entry.detail,
+            "url": reverse(SEARCH_RESULT_URLS[entry.kind], args=[entry.object_id]),
+        }
+        for entry in search_index(request.GET.get("q", ""), kinds, limit)
+    ]
+
+
+@login_required(login_url="admin-login")
+@user_passes_test(_is_staff, login_url="admin-login")
+def admin_search(request):
+    context = {
+        "query": request.GET.get("q", ""),
+        "results": _search_results(request, limit=50),
+        "kind_choices": SearchEntry.KIND_CHOICES,
+        "selected_kinds": request.GET.getlist("kind"),
+    }
+    return render(request, "FinanceApp/admin_search.html", context)
+
+
+@login_required(login_url="admin-login")
+@user_passes_test(_is_staff, login_url="admin-login")
+def admin_search_suggest(request):
+    limit = resolve_page_size(request.GET.get("limit"), default=10, maximum=50)
+    return JsonResponse({"results": _search_results(request, limit)})
+
+
+@login_required(login_url="admin-login")
+@user_passes_test(_is_staff, login_url="admin-login")
+def admin_request_metrics(request):
+    return render(request, "FinanceApp/request_metrics.html", {"routes": route_rows(collect_request_metrics())})
+
+
+def request_metrics_export(request):
+    expected_token = getattr(settings, "METRICS_TOKEN", "")
+    provided_token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    token_ok = bool(expected_token) and hmac.compare_digest(provided_token, expected_token)
+    if not token_ok and not _is_staff(request.user):
+        return HttpResponse("Not authorised.", status=403, content_type="text/plain")
+    return HttpResponse(
+        prometheus_text(collect_request_metrics()), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,87 @@
+"""
+Database profiles selected from the environment.
+
+``DATABASE_ENGINE=postgres`` selects PostgreSQL. Anything else, including
+unset, selects SQLite tuned for concurrent writers.
+"""
+
+import os
+
+
+def sqlite_database(name, tuned=True):
+    """
+    SQLite settings for the database file ``name``.
+
+    The tuned profile switches the journal to WAL so readers never block the writer,
+    relaxes fsyncs to ``synchronous=NORMAL`` (safe with WAL), waits up to
+    ``SQLITE_BUSY_TIMEOUT_MS`` for the write lock instead of failing with
+    "database is locked", and opens write transactions with ``BEGIN IMMEDIATE``
+    so a transaction that reads before writing cannot deadlock on the lock upgrade.
+    """
+    database = {"ENGINE": "django.db.backends.sqlite3", "NAME": name}
+    if tuned:
+        busy_timeout = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+        database["OPTIONS"] = {
+            "init_command": f"PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL;PRAGMA busy_timeout={busy_timeout}",
+            "transaction_mode": "IMMEDIATE",
+        }
+    return database
+
+
+def postgres_database():
+    """
+    PostgreSQL settings from ``POSTGRES_*`` variables.
+
+    Connections persist for ``DB_CONN_MAX_AGE`` seconds and are health-checked
+    before reuse. Setting ``DB_POOL_MAX_SIZE`` switches to psycopg's connection
+    pool instead (needs ``psycopg[pool]``); Django's pool replaces persistent
+    connections, so ``CONN_MAX_AGE`` is 0 then.
+    """
+    database = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("POSTGRES_DB", "communitysacco"),
+        "USER": os.environ.get("POSTGRES_USER", "communitysacco"),
+        "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+        "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+        "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
+    }
+    if os.environ.get("DB_POOL_MAX_SIZE"):
+        database["CONN_MAX_AGE"] = 0
+        database["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.environ["DB_POOL_MAX_SIZE"]),
+            "timeout": int(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        }
+    return database
+
+
+def replica_database():
+    """
+    Settings for a read replica, or ``None`` when there is none.
+
+    With PostgreSQL, ``POSTGRES_REPLICA_HOST`` (and ``POSTGRES_REPLICA_PORT``) name a streaming
+    replica reached with the primary's credentials. With SQLite, ``SQLITE_REPLICA_PATH`` names a
+    replicated copy of the database file (LiteFS, Litestream). The test runner points the alias
+    at the test database instead of creating a second one.
+    """
+    if os.environ.get("DATABASE_ENGINE", "sqlite").lower() in ("postgres", "postgresql"):
+        if not os.environ.get("POSTGRES_REPLICA_HOST"):
+            return None
+        database = postgres_database()
+        database["HOST"] = os.environ["POSTGRES_REPLICA_HOST"]
+        database["PORT"] = os.environ.get("POSTGRES_REPLICA_PORT", database["PORT"])
+    elif os.environ.get("SQLITE_REPLICA_PATH"):
+        database = sqlite_database(os.environ["SQLITE_REPLICA_PATH"])
+    else:
+        return None
+    database["TEST"] = {"MIRROR": "default"}
+    return database
+
+
+def default_database(base_dir):
+    if os.environ.get("DATABASE_ENGINE", "sqlite").lower() in ("postgres", "postgresql"):
+        return postgres_database()
+    return sqlite_database(os.environ.get("SQLITE_PATH", base_dir / "db.sqlite3"))
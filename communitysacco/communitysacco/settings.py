@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .databases import default_database, replica_database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -49,6 +52,8 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'FinanceApp.middleware.RequestMetricsMiddleware',
+    'FinanceApp.middleware.ReplicaPinMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -56,7 +61,8 @@ ROOT_URLCONF = 'communitysacco.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also times renders for the request metrics.
+        'BACKEND': 'FinanceApp.request_metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -76,13 +82,56 @@ WSGI_APPLICATION = 'communitysacco.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# SQLite (WAL) by default; DATABASE_ENGINE=postgres with POSTGRES_* variables in production.
+# See communitysacco/databases.py for the profiles and their tuning variables.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': default_database(BASE_DIR),
 }
 
+# Dashboards, history pages and exports read from this alias when it is configured
+# (POSTGRES_REPLICA_HOST or SQLITE_REPLICA_PATH). A browser that has just written stays on
+# the primary for DATABASE_REPLICA_PIN_SECONDS so it always sees its own writes.
+DATABASE_REPLICA_ALIAS = 'replica'
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get("DATABASE_REPLICA_PIN_SECONDS", "10"))
+if (replica := replica_database()) is not None:
+    DATABASES[DATABASE_REPLICA_ALIAS] = replica
+DATABASE_ROUTERS = ['FinanceApp.replicas.ReplicaRouter']
+
+
+# Cache: process-local memory in development. Set REDIS_URL (e.g. redis://localhost:6379/0) in
+# production so every worker shares cached summaries and the M-Pesa token (needs the redis package).
+if os.environ.get("REDIS_URL"):
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": os.environ["REDIS_URL"]}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "communitysacco"}}
+
+# Upper bound on how long a member's cached home summary lives; writes invalidate it sooner, but
+# only in the cache of the process that wrote. The payment worker and the scheduled commands run
+# in processes of their own, so without a shared cache a summary is only kept for a few seconds.
+MEMBER_SUMMARY_CACHE_SECONDS = int(
+    os.environ.get("MEMBER_SUMMARY_CACHE_SECONDS", "3600" if os.environ.get("REDIS_URL") else "5")
+)
+
+# Sessions are read from the cache and written through to the database, and the logged-in user
+# is cached for a short time, so an authenticated request needs no session or user query.
+# Set SESSION_ENGINE to 'django.contrib.sessions.backends.db' and AUTH_USER_CACHE_SECONDS to 0
+# to go back to per-request lookups.
+SESSION_ENGINE = os.environ.get("SESSION_ENGINE", "django.contrib.sessions.backends.cached_db")
+AUTHENTICATION_BACKENDS = ["Authapp.backends.CachedModelBackend"]
+AUTH_USER_CACHE_SECONDS = int(os.environ.get("AUTH_USER_CACHE_SECONDS", "60"))
+
+# Per-route request metrics: each worker publishes its totals to the cache at most this often
+# and they expire after the TTL once the worker stops. Metrics from several workers are only
+# combined when the cache is shared (REDIS_URL). METRICS_TOKEN lets a Prometheus scraper read
+# /FinanceApp/metrics/ with an "Authorization: Bearer <token>" header; blank means staff only.
+REQUEST_METRICS_FLUSH_SECONDS = 10
+REQUEST_METRICS_WORKER_TTL_SECONDS = 3600
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Staff requests sent with an X-Profile-Request header run under cProfile and are dumped here.
+# Leave blank to disable profiling.
+REQUEST_PROFILE_DIR = os.environ.get("REQUEST_PROFILE_DIR", "")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -125,6 +174,36 @@ STATICFILES_DIRS = [BASE_DIR / "static"] if (BASE_DIR / "static").exists() else
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Uploads stream to a temporary file on disk and are SHA-256'd as they arrive; loan documents
+# are then stored once per distinct content by the document storage backend (default: files
+# under DOCUMENT_STORAGE_ROOT, or MEDIA_ROOT when that is unset).
+FILE_UPLOAD_HANDLERS = ["FinanceApp.documents.HashingUploadHandler"]
+DOCUMENT_STORAGE_BACKEND = "FinanceApp.documents.LocalDocumentStorage"
+DOCUMENT_STORAGE_ROOT = os.environ.get("DOCUMENT_STORAGE_ROOT", "")
+
+# Let the web server send documents: 'X-Accel-Redirect' (nginx, with an internal location at
+# DOCUMENT_SENDFILE_PREFIX aliased to the storage root) or 'X-Sendfile' (Apache/lighttpd).
+# Blank streams them from Django in chunks, with Range support.
+DOCUMENT_SENDFILE_HEADER = os.environ.get("DOCUMENT_SENDFILE_HEADER", "")
+DOCUMENT_SENDFILE_PREFIX = "/protected-media/"
+
+# Previews rendered by run_document_worker: longest side in pixels, and how long a render may
+# run (or stay claimed by a dead worker) before it is abandoned.
+DOCUMENT_PREVIEW_MAX_PX = 480
+DOCUMENT_PREVIEW_TIMEOUT_SECONDS = 60
+DOCUMENT_PREVIEW_RUNNING_TIMEOUT_SECONDS = 300
+
+# archive_ledger moves completed transactions of months older than this many whole months
+# into read-only monthly archive tables, this many rows per transaction.
+LEDGER_ARCHIVE_AFTER_MONTHS = 3
+LEDGER_ARCHIVE_CHUNK_SIZE = 1000
+
+# refresh_transaction_trends leaves transactions younger than this out of the monthly summary
+# (they are counted live until then), so rows still being committed are not skipped.
+TRANSACTION_TRENDS_SETTLE_SECONDS = 300
+# Longest window, in months, the transaction trend API serves.
+TRANSACTION_TRENDS_MAX_MONTHS = 36
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'login'
@@ -180,3 +259,37 @@ MPESA_INITIATOR_SECURITY_CREDENTIAL = 'initiator_security_credential'
 
 # Public HTTPS endpoint for STK callbacks. If blank, app auto-detects and falls back to darajambili in local dev.
 MPESA_CALLBACK_URL = ''
+
+# Root of the Daraja API. Blank uses the MPESA_ENVIRONMENT default; point it at
+# `manage.py run_fake_daraja` (e.g. 'http://127.0.0.1:8765/') to test against a local fake.
+MPESA_API_BASE_URL = ''
+
+# Backend used by the payment worker to send STK pushes.
+# Use 'FinanceApp.payments.FakeDarajaBackend' to run the queue offline.
+PAYMENT_GATEWAY_BACKEND = 'FinanceApp.payments.DarajaBackend'
+
+# Daraja HTTP client: connection pool size, request timeout, and how long before expiry the
+# shared OAuth token (cached through Django's cache framework) is refreshed.
+PAYMENT_HTTP_POOL_SIZE = 10
+PAYMENT_HTTP_TIMEOUT_SECONDS = 30
+MPESA_TOKEN_REFRESH_MARGIN_SECONDS = 120
+
+# Queued STK push retries: attempts per job and exponential backoff bounds (seconds).
+PAYMENT_JOB_MAX_ATTEMPTS = 5
+PAYMENT_JOB_RETRY_BASE_SECONDS = 15
+PAYMENT_JOB_RETRY_MAX_SECONDS = 600
+PAYMENT_JOB_RUNNING_TIMEOUT_SECONDS = 300
+
+# Shared secret for the batched callback replay endpoint (X-Callback-Ingest-Token header).
+# Leave blank to disable the endpoint.
+CALLBACK_INGEST_TOKEN = ''
+
+# Nightly accruals (run_accruals), accrued daily: annual dividend rate on savings and annual
+# penalty rate on overdue instalments, both in percent, and days of grace before penalties start.
+SAVINGS_DIVIDEND_RATE = 6
+LOAN_PENALTY_RATE = 12
+LOAN_PENALTY_GRACE_DAYS = 7
+
+# Scored loan limits (score_loan_limits): savings x this multiple x the share of due instalments
+# paid on time, less the outstanding balance.
+LOAN_LIMIT_SAVINGS_MULTIPLE = 3